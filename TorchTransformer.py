@@ -1,5 +1,8 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+
+from decoding import DecoderCache, beam_search, greedy_decode
 
 
 class Transformer(nn.Module):
@@ -16,7 +19,22 @@ class Transformer(nn.Module):
         dropout=0.1,
         pad_idx=0,
         device="cuda",
+        n_pointers=0,
+        mask_padding=False,
     ):
+        """
+        With n_pointers > 0 the last n_pointers target ids refer to source
+        positions instead of words, as the LOC#i targets of the DKET data.
+        fc_out then only scores the other ids, the operators of the formulas,
+        and the source positions are scored by attending over the encoder
+        output. The logits of a batch have n_operators + src_length columns,
+        column n_operators + i for position i of the source.
+
+        With mask_padding, attention ignores the padding of the source and
+        target through key padding masks built from pad_idx. The encoder then
+        runs on nested tensors in inference, under eval() and torch.no_grad(),
+        skipping the computation of the padding positions altogether.
+        """
         super().__init__()
 
         self.transformer = nn.Transformer(
@@ -28,40 +46,219 @@ class Transformer(nn.Module):
             batch_first=True,
         )
 
+        self.n_pointers = n_pointers
+        self.n_operators = trg_vocab_size - n_pointers
+
         self.src_embedding = nn.Embedding(src_vocab_size, embed_size)
-        self.trg_embedding = nn.Embedding(trg_vocab_size, embed_size)
+        self.trg_embedding = nn.Embedding(self.n_operators, embed_size)
         self.src_position = nn.Embedding(max_length, embed_size)
         self.trg_position = nn.Embedding(max_length, embed_size)
         
-        self.fc_out = nn.Linear(embed_size, trg_vocab_size)
+        self.fc_out = nn.Linear(embed_size, self.n_operators)
+
+        if n_pointers:
+            self.pointer_query = nn.Linear(embed_size, embed_size)
+            self.pointer_key = nn.Linear(embed_size, embed_size)
 
         self.dropout = nn.Dropout(dropout)
         
         self.pad_idx = pad_idx
+        self.mask_padding = mask_padding
         
         self.device = device
+
+        # causal masks by target length and device
+        self.trg_masks = {}
+        # the fast path of nn.TransformerEncoder in inference, which reads
+        # the weights of the layers as float tensors
+        self.fastpath = True
     
     def make_trg_mask(self, trg):
+        """
+        Returns the causal mask of the target, True where a position
+        may not be attended to, made once for every length and device.
+        """
         N, trg_len = trg.shape
-        trg_mask = torch.tril(torch.ones((trg_len, trg_len))).expand(trg_len, trg_len)
-        return trg_mask.to(self.device)
+        if torch.compiler.is_compiling():
+            # made in the graph, as torch.compile
+            # would recompile whenever the cache changes
+            return torch.ones((trg_len, trg_len), dtype=torch.bool,
+                              device=trg.device).triu(diagonal=1)
+        key = (trg_len, trg.device)
+        if key not in self.trg_masks:
+            self.trg_masks[key] = torch.ones((trg_len, trg_len), dtype=torch.bool,
+                                             device=trg.device).triu(diagonal=1)
+        return self.trg_masks[key]
 
-    def forward(self, src, trg):
+    def make_padding_mask(self, ids):
+        """
+        Returns the key padding mask of the ids, True at padding,
+        or None if padding is not masked.
+        """
+        if not self.mask_padding:
+            return None
+        return ids == self.pad_idx
+
+    def embed_target(self, trg, memory):
+        """
+        Embeds the target ids, taking the encoder output at
+        the source position for ids that are pointers.
+        """
+        if not self.n_pointers:
+            return self.trg_embedding(trg)
+        is_pointer = trg >= self.n_operators
+        positions = (trg - self.n_operators).clamp(0, memory.shape[1] - 1)
+        copied = memory.gather(1, positions.unsqueeze(-1).expand(-1, -1, memory.shape[-1]))
+        embedded = self.trg_embedding(trg.clamp(max=self.n_operators - 1))
+        return torch.where(is_pointer.unsqueeze(-1), copied, embedded)
+
+    def pointer_scores(self, out, memory, src):
+        """
+        Scores every source position for every target position,
+        with padding in the source scored lowest.
+        """
+        queries = self.pointer_query(out)
+        keys = self.pointer_key(memory)
+        scores = queries @ keys.transpose(1, 2) / (keys.shape[-1] ** (1/2))
+        return scores.masked_fill((src == self.pad_idx).unsqueeze(1),
+                                  torch.finfo(scores.dtype).min)
+
+    def make_attention_mask(self, ids):
+        """
+        Returns the padding mask of the ids for scaled_dot_product_attention,
+        (N, 1, 1, len) and True where attending is allowed, or None if
+        padding is not masked.
+        """
+        if not self.mask_padding:
+            return None
+        return (ids != self.pad_idx).unsqueeze(1).unsqueeze(2)
+
+    def encode(self, src):
         N_src, src_length = src.shape
+        src_positions = torch.arange(0, src_length, device=src.device).expand(
+            N_src, src_length)
+        src_ids = src
+        src = self.dropout(self.src_embedding(
+            src) + self.src_position(src_positions))
+        # in training the encoder applies its dropout and never takes the fast path
+        if self.training or (self.fastpath and not torch.is_autocast_enabled(src.device.type)):
+            return self.transformer.encoder(
+                src, src_key_padding_mask=self.make_padding_mask(src_ids))
+        # the fast path only checks for autocast on CUDA, and fails on the
+        # mixed dtypes of autocast on CPU, so in inference every encoder layer
+        # is unrolled as in decode_step, which never takes it
+        src_mask = self.make_attention_mask(src_ids)
+        for layer in self.transformer.encoder.layers:
+            src = layer.norm1(src + layer.dropout1(
+                self.attend(layer.self_attn, *self.project(layer.self_attn, src), src_mask)))
+            src = layer.norm2(src + layer._ff_block(src))
+        if self.transformer.encoder.norm is not None:
+            src = self.transformer.encoder.norm(src)
+        return src
+
+    def init_cache(self, src):
+        """
+        Encodes the source once and returns the cache for decoding
+        it one token at a time with decode_step, with the keys and
+        values of the cross-attention of every decoder layer.
+        """
+        memory = self.encode(src)
+        cross_keys, cross_values = [], []
+        for layer in self.transformer.decoder.layers:
+            _, keys, values = self.project(layer.multihead_attn, memory, "kv")
+            cross_keys.append(keys)
+            cross_values.append(values)
+        return DecoderCache(cross_keys, cross_values, self.trg_position.num_embeddings,
+                            memory, src, self.make_attention_mask(src))
+
+    def project(self, attention, x, which="qkv"):
+        """
+        Applies the input projections of an nn.MultiheadAttention,
+        returning queries, keys and values as (N, len, heads, head_dim),
+        or None for those not in which.
+        """
+        N, length, embed_size = x.shape
+        shape = (N, length, attention.num_heads, embed_size // attention.num_heads)
+        weights = attention.in_proj_weight.chunk(3)
+        biases = attention.in_proj_bias.chunk(3)
+        projected = [F.linear(x, w, b).view(shape) if name in which else None
+                     for name, w, b in zip("qkv", weights, biases)]
+        return tuple(projected)
+
+    def attend(self, attention, queries, keys, values, mask):
+        N, length = queries.shape[0], queries.shape[1]
+        out = F.scaled_dot_product_attention(
+            queries.transpose(1, 2), keys.transpose(1, 2), values.transpose(1, 2),
+            attn_mask=mask)
+        return attention.out_proj(out.transpose(1, 2).reshape(N, length, -1))
+
+    def decode_step(self, trg, cache):
+        """
+        Returns the logits of the next tokens trg (N, n_tokens), which
+        follow the tokens already in the cache. Computes the same as
+        the last positions of forward over the whole target, with every
+        decoder layer of nn.Transformer unrolled to use the cache.
+        """
+        N_trg, trg_length = trg.shape
+        trg_positions = cache.positions(N_trg, trg_length, trg.device)
+        x = self.dropout(self.embed_target(
+            trg, cache.memory) + self.trg_position(trg_positions))
+        trg_mask = cache.step_mask(trg_length, trg.device)
+
+        for i, layer in enumerate(self.transformer.decoder.layers):
+            queries, keys, values = self.project(layer.self_attn, x)
+            keys, values = cache.append(i, keys, values)
+            x = layer.norm1(x + layer.dropout1(
+                self.attend(layer.self_attn, queries, keys, values, trg_mask)))
+            queries, _, _ = self.project(layer.multihead_attn, x, "q")
+            x = layer.norm2(x + layer.dropout2(
+                self.attend(layer.multihead_attn, queries,
+                            cache.cross_keys[i], cache.cross_values[i], cache.src_mask)))
+            x = layer.norm3(x + layer._ff_block(x))
+        cache.advance(trg_length)
+
+        if self.transformer.decoder.norm is not None:
+            x = self.transformer.decoder.norm(x)
+        logits = self.fc_out(x)
+        if self.n_pointers:
+            logits = torch.cat([logits, self.pointer_scores(x, cache.memory, cache.src)], dim=-1)
+        return logits
+
+    def translate(self, src, max_len=None, sos_idx=1, eos_idx=2, beam_size=1,
+                  length_penalty=1.0, constraint=None, dtype=None):
+        """
+        Greedily translates a batch of sources (N, src_len), encoding them
+        once and decoding the whole batch in lockstep, or with beam search
+        if beam_size > 1. Returns the ids (N, max_len) and the length of
+        every translation including <EOS>. A constraint, as
+        grammar.FormulaAutomaton, only lets it produce well-formed formulas.
+        A dtype, as torch.bfloat16, runs the model in mixed precision.
+        Call eval() first to turn off dropout.
+        """
+        if beam_size > 1:
+            return beam_search(self, src, beam_size, max_len, length_penalty,
+                               sos_idx, eos_idx, self.pad_idx, constraint, dtype)
+        return greedy_decode(self, src, max_len, sos_idx, eos_idx, self.pad_idx, constraint,
+                             dtype)
+
+    def forward(self, src, trg):
         N_trg, trg_length = trg.shape
 
         trg_mask = self.make_trg_mask(trg)
 
-        src_positions = torch.arange(0, src_length).expand(
-            N_src, src_length).to(self.device)
-        trg_positions = torch.arange(0, trg_length).expand(
-            N_trg, trg_length).to(self.device)
+        trg_positions = torch.arange(0, trg_length, device=trg.device).expand(
+            N_trg, trg_length)
 
-        src = self.dropout(self.src_embedding(
-            src) + self.src_position(src_positions))
-        trg = self.dropout(self.trg_embedding(
-            trg) + self.trg_position(trg_positions))
+        src_ids = src
+        trg_padding_mask = self.make_padding_mask(trg)
+        memory = self.encode(src)
+        trg = self.dropout(self.embed_target(
+            trg, memory) + self.trg_position(trg_positions))
 
-        out = self.transformer(src, trg, tgt_mask=trg_mask)
-        out = self.fc_out(out)
-        return out
+        out = self.transformer.decoder(trg, memory, tgt_mask=trg_mask, tgt_is_causal=True,
+                                       tgt_key_padding_mask=trg_padding_mask,
+                                       memory_key_padding_mask=self.make_padding_mask(src_ids))
+        logits = self.fc_out(out)
+        if self.n_pointers:
+            logits = torch.cat([logits, self.pointer_scores(out, memory, src_ids)], dim=-1)
+        return logits
@@ -1,12 +1,17 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+
+from decoding import DecoderCache, beam_search, greedy_decode
 
 class SelfAttention(nn.Module):
-    def __init__(self, embed_size, heads):
+    def __init__(self, embed_size, heads, fused=False):
         super(SelfAttention, self).__init__()
         self.embed_size = embed_size
         self.heads = heads
         self.head_dim = embed_size // heads
+        # use scaled_dot_product_attention when the weights are not needed
+        self.fused = fused
 
         assert (self.head_dim * heads == embed_size), "Embed size needs to be div by heads"
 
@@ -15,30 +20,46 @@ class SelfAttention(nn.Module):
         self.queries = nn.Linear(self.embed_size, self.embed_size, bias="False")
         self.fc_out = nn.Linear(heads * self.head_dim, embed_size)
 
-    def forward(self, values, keys, query, mask):
-        N = query.shape[0]
-        value_len, key_len, query_len = values.shape[1], keys.shape[1], query.shape[1]
-        
-        values = self.values(values)
-        keys = self.keys(keys)
-        queries = self.queries(query)
+    def forward(self, values, keys, query, mask, need_weights=True):
+        values, keys = self.project(values, keys)
+        return self.attend(values, keys, query, mask, need_weights)
+
+    def project(self, values, keys):
+        """
+        Projects the values and keys and splits them into heads,
+        (N, len, heads, head_dim), so they can be cached when decoding.
+        """
+        N = values.shape[0]
+        values = self.values(values).reshape(N, values.shape[1], self.heads, self.head_dim)
+        keys = self.keys(keys).reshape(N, keys.shape[1], self.heads, self.head_dim)
+        return values, keys
+
+    def attend(self, values, keys, query, mask, need_weights=True):
+        """
+        Attends from the query over values and keys already projected.
+        """
+        N, query_len = query.shape[0], query.shape[1]
 
         # Split embedding into self.heads pieces
-        values = values.reshape(N, value_len, self.heads, self.head_dim)
-        keys = keys.reshape(N, key_len, self.heads, self.head_dim)
         queries = query.reshape(N, query_len, self.heads, self.head_dim)
 
+        if self.fused and not need_weights:
+            return self.fused_attention(values, keys, queries, mask), None
+
         # instead of batch matrix multiply
         energy = torch.einsum("nqhd,nkhd->nhqk", [queries, keys])
         # queries shape: (N, query_len, heads, head_dim)
         # keys shape: (N, key_len, heads, head_dim)
         # energy shape: (N, heads, query_len, key_len)
 
+        # masking and softmax in float32, where -1e20 and the exponentials
+        # do not overflow as in float16, nor lose precision as in bfloat16
+        energy = energy.float()
         if mask is not None:
             # basically minus infinity, and will therefore be 0 in softmax
-            energy = energy.masked_fill(mask == 0, float("-1e20"))
+            energy = energy.masked_fill(mask == 0, torch.finfo(energy.dtype).min)
 
-        attention = torch.softmax(energy / (self.embed_size ** (1/2)), dim=3)
+        attention = torch.softmax(energy / (self.embed_size ** (1/2)), dim=3).type_as(values)
 
         out = torch.einsum("nhql,nlhd->nqhd", [attention, values])
         # attention shape: (N, heads, query_len, key_len)
@@ -52,11 +73,31 @@ class SelfAttention(nn.Module):
         out = self.fc_out(out)
         return out, weights
 
+    def fused_attention(self, values, keys, queries, mask):
+        """
+        Computes the same output as the einsum path with
+        scaled_dot_product_attention, without materializing the
+        (N, heads, query_len, key_len) energy and attention tensors.
+        Only differs for rows where every key is masked, which are
+        uniform in the einsum path and NaN here.
+        """
+        N, query_len = queries.shape[0], queries.shape[1]
+        # (N, seq_len, heads, head_dim) -> (N, heads, seq_len, head_dim)
+        out = F.scaled_dot_product_attention(
+            queries.transpose(1, 2),
+            keys.transpose(1, 2),
+            values.transpose(1, 2),
+            attn_mask=None if mask is None else mask != 0,
+            scale=1 / (self.embed_size ** (1/2)),
+        )
+        out = out.transpose(1, 2).reshape(N, query_len, self.heads*self.head_dim)
+        return self.fc_out(out)
+
 
 class TransformerBlock(nn.Module):
-    def __init__(self, embed_size, heads, dropout, forward_expansion):
+    def __init__(self, embed_size, heads, dropout, forward_expansion, fused=False):
         super(TransformerBlock, self).__init__()
-        self.attention = SelfAttention(embed_size, heads)
+        self.attention = SelfAttention(embed_size, heads, fused)
         self.norm1 = nn.LayerNorm(embed_size)
         self.norm2 = nn.LayerNorm(embed_size)
 
@@ -67,14 +108,24 @@ class TransformerBlock(nn.Module):
         )
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, value, key, query, mask):
-        attention, weights = self.attention(value, key, query, mask)
+    def forward(self, value, key, query, mask, need_weights=True):
+        attention, weights = self.attention(value, key, query, mask, need_weights)
+        return self.add_and_feed_forward(attention, query), weights
+
+    def step(self, values, keys, query, mask, need_weights=True):
+        """
+        Same as forward, with the values and keys already projected.
+        """
+        attention, weights = self.attention.attend(values, keys, query, mask, need_weights)
+        return self.add_and_feed_forward(attention, query), weights
+
+    def add_and_feed_forward(self, attention, query):
         x = self.norm1(attention + query)
         x = self.dropout(x)
         forward = self.feed_forward(x)
         out = self.norm2(forward + x)
         out = self.dropout(out)
-        return out, weights
+        return out
 
 class Encoder(nn.Module):
     def __init__(
@@ -87,6 +138,7 @@ class Encoder(nn.Module):
         forward_expansion,
         dropout,
         max_length,
+        fused=False,
     ):
         super(Encoder, self).__init__()
         self.embed_size = embed_size
@@ -101,6 +153,7 @@ class Encoder(nn.Module):
                     heads,
                     dropout=dropout,
                     forward_expansion=forward_expansion,
+                    fused=fused,
                 )
             for _ in range(num_layers)]
         )
@@ -108,30 +161,43 @@ class Encoder(nn.Module):
 
     def forward(self, x, mask):
         N, seq_length = x.shape
-        positions = torch.arange(0, seq_length).expand(N, seq_length).to(self.device)
+        positions = torch.arange(0, seq_length, device=x.device).expand(N, seq_length)
 
         out = self.dropout(self.word_embedding(x) + self.position_embedding(positions))
 
         for layer in self.layers:
-            out, _ = layer(out, out, out, mask)
+            out, _ = layer(out, out, out, mask, need_weights=False)
 
         return out
 
 class DecoderBlock(nn.Module):
-    def __init__(self, embed_size, heads, forward_expansion, dropout, device):
+    def __init__(self, embed_size, heads, forward_expansion, dropout, device, fused=False):
         super(DecoderBlock, self).__init__()
-        self.attention = SelfAttention(embed_size, heads)
+        self.attention = SelfAttention(embed_size, heads, fused)
         self.norm = nn.LayerNorm(embed_size)
         self.transform_block = TransformerBlock(
-            embed_size, heads, dropout, forward_expansion
+            embed_size, heads, dropout, forward_expansion, fused
         )
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, x, value, key, src_mask, trg_mask):
-        attention, _ = self.attention(x, x, x, trg_mask)
+    def forward(self, x, value, key, src_mask, trg_mask, need_weights=True):
+        attention, _ = self.attention(x, x, x, trg_mask, need_weights=False)
         query = self.dropout(self.norm(attention + x))
-        out, weights = self.transform_block(value, key, query, src_mask)
+        out, weights = self.transform_block(value, key, query, src_mask, need_weights)
         return out, weights
+
+    def step(self, x, cache, layer, trg_mask, need_weights=True):
+        """
+        Decodes the new tokens x, attending over the tokens before
+        them in the cache and the cross-attention keys and values
+        projected once per source.
+        """
+        values, keys = self.attention.project(x, x)
+        keys, values = cache.append(layer, keys, values)
+        attention, _ = self.attention.attend(values, keys, x, trg_mask, need_weights=False)
+        query = self.dropout(self.norm(attention + x))
+        return self.transform_block.step(cache.cross_values[layer], cache.cross_keys[layer],
+                                         query, cache.src_mask, need_weights)
     
 class Decoder(nn.Module):
     def __init__(self,
@@ -143,6 +209,7 @@ class Decoder(nn.Module):
                  dropout,
                  device,
                  max_length,
+                 fused=False,
     ):
         super(Decoder, self).__init__()
         self.device = device
@@ -150,20 +217,55 @@ class Decoder(nn.Module):
         self.position_embedding = nn.Embedding(max_length, embed_size)
 
         self.layers = nn.ModuleList(
-            [DecoderBlock(embed_size, heads, forward_expansion, dropout, device)
+            [DecoderBlock(embed_size, heads, forward_expansion, dropout, device, fused)
             for _ in range(num_layers)]
         )
 
         self.fc_out = nn.Linear(embed_size, trg_vocab_size)
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, x, enc_out, src_mask, trg_mask):
+    def forward(self, x, enc_out, src_mask, trg_mask, need_weights=True):
         N, seq_length = x.shape
-        positions = torch.arange(0, seq_length).expand(N, seq_length).to(self.device)
+        positions = torch.arange(0, seq_length, device=x.device).expand(N, seq_length)
         x = self.dropout((self.word_embedding(x) + self.position_embedding(positions)))
 
+        # only the attention weights of the last layer are returned
+        for i, layer in enumerate(self.layers):
+            x, weights = layer(x, enc_out, enc_out, src_mask, trg_mask,
+                               need_weights and i == len(self.layers) - 1)
+
+        out = self.fc_out(x)
+
+        return (out, weights)
+
+    def init_cache(self, enc_out, src, src_mask):
+        """
+        Creates the cache for decoding one token at a time, with
+        the cross-attention keys and values of every layer.
+        """
+        cross_keys, cross_values = [], []
         for layer in self.layers:
-            x, weights = layer(x, enc_out, enc_out, src_mask, trg_mask)
+            values, keys = layer.transform_block.attention.project(enc_out, enc_out)
+            cross_keys.append(keys)
+            cross_values.append(values)
+        return DecoderCache(cross_keys, cross_values, self.position_embedding.num_embeddings,
+                            enc_out, src, src_mask)
+
+    def step(self, x, cache, need_weights=False):
+        """
+        Decodes the next tokens x (N, n_tokens) given the tokens before
+        them in the cache, the same as the last positions of forward
+        over the whole target, without recomputing the tokens before.
+        """
+        N, seq_length = x.shape
+        positions = cache.positions(N, seq_length, x.device)
+        x = self.dropout((self.word_embedding(x) + self.position_embedding(positions)))
+        trg_mask = cache.step_mask(seq_length, x.device)
+
+        for i, layer in enumerate(self.layers):
+            x, weights = layer.step(x, cache, i, trg_mask,
+                                    need_weights and i == len(self.layers) - 1)
+        cache.advance(seq_length)
 
         out = self.fc_out(x)
 
@@ -182,8 +284,15 @@ class Transformer(nn.Module):
         heads=8,
         dropout=0,
         device="cuda",
-        max_length=100
+        max_length=100,
+        fused_attention=False,
     ):
+        """
+        With fused_attention, attention uses scaled_dot_product_attention
+        wherever its weights are not needed, which is everywhere except
+        the cross-attention of the last decoder layer, and there too
+        when forward is called with need_weights=False.
+        """
         super(Transformer, self).__init__()
         self.encoder = Encoder(
             src_vocab_size,
@@ -193,7 +302,8 @@ class Transformer(nn.Module):
             device,
             forward_expansion,
             dropout,
-            max_length
+            max_length,
+            fused_attention,
         )
 
         self.decoder = Decoder(
@@ -204,7 +314,8 @@ class Transformer(nn.Module):
             forward_expansion,
             dropout,
             device,
-            max_length
+            max_length,
+            fused_attention,
         )
 
         self.src_pad_idx = src_pad_idx
@@ -225,11 +336,45 @@ class Transformer(nn.Module):
         )
         return trg_mask.to(self.device)
         
-    def forward(self, src, trg):
+    def init_cache(self, src):
+        """
+        Encodes the source once and returns the cache for decoding
+        it one token at a time with decode_step.
+        """
+        src_mask = self.make_src_mask(src)
+        enc_src = self.encoder(src, src_mask)
+        return self.decoder.init_cache(enc_src, src, src_mask)
+
+    def decode_step(self, trg, cache):
+        """
+        Returns the logits (N, n_tokens, trg_vocab_size) of the next
+        tokens trg, which follow the tokens already in the cache.
+        """
+        out, _ = self.decoder.step(trg, cache)
+        return out
+
+    def translate(self, src, max_len=None, sos_idx=1, eos_idx=2, beam_size=1,
+                  length_penalty=1.0, constraint=None, dtype=None):
+        """
+        Greedily translates a batch of sources (N, src_len), encoding them
+        once and decoding the whole batch in lockstep, or with beam search
+        if beam_size > 1. Returns the ids (N, max_len) and the length of
+        every translation including <EOS>. A constraint, as
+        grammar.FormulaAutomaton, only lets it produce well-formed formulas.
+        A dtype, as torch.bfloat16, runs the model in mixed precision.
+        Call eval() first to turn off dropout.
+        """
+        if beam_size > 1:
+            return beam_search(self, src, beam_size, max_len, length_penalty,
+                               sos_idx, eos_idx, self.trg_pad_idx, constraint, dtype)
+        return greedy_decode(self, src, max_len, sos_idx, eos_idx, self.trg_pad_idx, constraint,
+                             dtype)
+
+    def forward(self, src, trg, need_weights=True):
         src_mask = self.make_src_mask(src)
         trg_mask = self.make_trg_mask(trg)
         enc_src = self.encoder(src, src_mask)
-        out, attn = self.decoder(trg, enc_src, src_mask, trg_mask)
+        out, attn = self.decoder(trg, enc_src, src_mask, trg_mask, need_weights)
         self.last_attention = attn
         return out
 
@@ -245,8 +390,7 @@ if __name__ == "__main__":
     trg_pad_idx = 0
     src_vocab_size = 10
     trg_vocab_size = 10
-    model = Transformer(src_vocab_size, trg_vocab_size, src_pad_idx, trg_pad_idx).to(
-        device
-    )
+    model = Transformer(src_vocab_size, trg_vocab_size, src_pad_idx, trg_pad_idx,
+                        device=device).to(device)
     out = model(x, trg[:, :-1])
-    print(out.shape)
\ No newline at end of file
+    print(out.shape)
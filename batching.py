@@ -0,0 +1,137 @@
+from typing import Iterator, Sequence
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+from vocabulary import PAD_IDX
+
+
+def sequence_lengths(ids: torch.Tensor, pad_idx=PAD_IDX) -> np.ndarray:
+    """
+    Returns the length of every row of a padded [N, T] tensor,
+    counting up to and including its last non padding token.
+    """
+    not_pad = (ids != pad_idx).cpu().numpy()
+    last = ids.shape[1] - np.argmax(not_pad[:, ::-1], axis=1)
+    return np.where(not_pad.any(axis=1), last, 0)
+
+
+def dataset_lengths(dataset, pad_idx=PAD_IDX) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the source and target lengths of every pair of a dataset,
+    either a TokenizedDataset, a TensorDataset of padded rows as made
+    by the notebooks, or a Subset of one such as random_split gives.
+    """
+    if isinstance(dataset, torch.utils.data.Subset):
+        src_lengths, trg_lengths = dataset_lengths(dataset.dataset, pad_idx)
+        indices = np.asarray(dataset.indices)
+        return src_lengths[indices], trg_lengths[indices]
+    if isinstance(dataset, torch.utils.data.TensorDataset):
+        src, trg = dataset.tensors
+        return sequence_lengths(src, pad_idx), sequence_lengths(trg, pad_idx)
+    return dataset.lengths("src"), dataset.lengths("trg")
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Batch sampler grouping pairs of similar length, so that every
+    batch is padded only to its own longest sentence instead of
+    to the longest sentence of the dataset.
+
+    With max_tokens, batches are filled until the padded size of
+    their longer side, batch size times the longest sentence, would
+    exceed the budget, keeping the work per batch about constant.
+    With batch_size, every batch holds a fixed number of pairs.
+    Given both, a batch stops at whichever limit is reached first.
+
+    Pairs are sorted by length with random order among equal lengths,
+    and the order of the batches is shuffled every epoch. The batches
+    of an epoch therefore differ, but their number does not.
+    """
+
+    def __init__(self, src_lengths: Sequence[int], trg_lengths: Sequence[int],
+                 max_tokens=None, batch_size=None, shuffle=True, seed=None) -> None:
+        if max_tokens is None and batch_size is None:
+            raise ValueError("Either max_tokens or batch_size must be given")
+        self.lengths = np.maximum(np.asarray(src_lengths), np.asarray(trg_lengths))
+        if max_tokens is not None and len(self.lengths) and self.lengths.max() > max_tokens:
+            raise ValueError("Sentence of length " + str(self.lengths.max()) +
+                             " does not fit in max_tokens " + str(max_tokens))
+        self.max_tokens = max_tokens
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.n_batches = len(self.batch_bounds(np.sort(self.lengths)))
+
+    @classmethod
+    def from_dataset(cls, dataset, max_tokens=None, batch_size=None,
+                     shuffle=True, seed=None, pad_idx=PAD_IDX) -> "BucketBatchSampler":
+        src_lengths, trg_lengths = dataset_lengths(dataset, pad_idx)
+        return cls(src_lengths, trg_lengths, max_tokens, batch_size, shuffle, seed)
+
+    def batch_bounds(self, sorted_lengths: np.ndarray) -> list[tuple[int, int]]:
+        """
+        Splits lengths sorted in ascending order into batches,
+        returning the start and end of every batch.
+        """
+        bounds = []
+        start = 0
+        for end in range(1, len(sorted_lengths) + 1):
+            size = end - start
+            too_many = self.batch_size is not None and size > self.batch_size
+            too_long = self.max_tokens is not None and \
+                size * sorted_lengths[end - 1] > self.max_tokens
+            if too_many or too_long:
+                bounds.append((start, end - 1))
+                start = end - 1
+        if start < len(sorted_lengths):
+            bounds.append((start, len(sorted_lengths)))
+        return bounds
+
+    def __iter__(self) -> Iterator[list[int]]:
+        if self.shuffle:
+            order = np.lexsort((self.rng.random(len(self.lengths)), self.lengths))
+        else:
+            order = np.argsort(self.lengths, kind="stable")
+        batches = [order[start:end].tolist()
+                   for start, end in self.batch_bounds(self.lengths[order])]
+        if self.shuffle:
+            batches = [batches[i] for i in self.rng.permutation(len(batches))]
+        return iter(batches)
+
+    def __len__(self) -> int:
+        return self.n_batches
+
+
+def collate_batch(batch: list[tuple[torch.Tensor, torch.Tensor]], pad_idx=PAD_IDX,
+                  length=None) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Collates pairs of source and target ids, of a TokenizedDataset or
+    of the notebooks' datasets, into two tensors padded to the longest
+    sentence of the batch, or to length if given. Rows that are already
+    padded, as in the notebooks' datasets, are cut down to it.
+    """
+    src, trg = zip(*batch)
+    src = torch.nn.utils.rnn.pad_sequence(src, batch_first=True, padding_value=pad_idx)
+    trg = torch.nn.utils.rnn.pad_sequence(trg, batch_first=True, padding_value=pad_idx)
+    src, trg = trim_padding(src, pad_idx), trim_padding(trg, pad_idx)
+    if length is not None:
+        if max(src.shape[1], trg.shape[1]) > length:
+            raise ValueError("Sentence of length " + str(max(src.shape[1], trg.shape[1])) +
+                             " does not fit in length " + str(length))
+        src = torch.nn.functional.pad(src, (0, length - src.shape[1]), value=pad_idx)
+        trg = torch.nn.functional.pad(trg, (0, length - trg.shape[1]), value=pad_idx)
+    return src, trg
+
+
+def trim_padding(ids: torch.Tensor, pad_idx=PAD_IDX) -> torch.Tensor:
+    """
+    Removes the trailing columns of a [N, T] tensor that hold
+    only padding in every row.
+    """
+    not_pad = (ids != pad_idx).any(dim=0)
+    if not not_pad.any():
+        return ids[:, :0]
+    length = int(not_pad.nonzero().max()) + 1
+    return ids[:, :length]
@@ -0,0 +1,60 @@
+"""
+Benchmark of batched beam search, with the beams of all sentences
+decoded as one batch, against running it for one sentence at a time,
+for both model classes with random weights on CPU. Run from the root
+of the repository:
+python ./benchmarks/beam_search.py
+"""
+import sys
+import time
+
+import torch
+
+sys.path.append(".")
+import Transformer  # noqa: E402
+import TorchTransformer  # noqa: E402
+
+N_SENTENCES = 32
+SRC_LENGTH = 20
+MAX_LEN = 30
+BEAM_SIZE = 4
+SRC_VOCAB_SIZE = 5000
+TRG_VOCAB_SIZE = 2000
+
+
+def seconds(translate) -> float:
+    start = time.perf_counter()
+    translate()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    torch.manual_seed(0)
+    models = {
+        "Transformer": Transformer.Transformer(
+            SRC_VOCAB_SIZE, TRG_VOCAB_SIZE, 0, 0, embed_size=256, device="cpu",
+            max_length=52, fused_attention=True),
+        "TorchTransformer": TorchTransformer.Transformer(
+            SRC_VOCAB_SIZE, TRG_VOCAB_SIZE, max_length=52, embed_size=256, device="cpu"),
+    }
+    src = torch.randint(3, SRC_VOCAB_SIZE, (N_SENTENCES, SRC_LENGTH))
+
+    print("---------------------------------------------------------------")
+    print(str(N_SENTENCES) + " sentences, up to " + str(MAX_LEN) +
+          " tokens, ms per sentence")
+    for name, model in models.items():
+        model.eval()
+        greedy = seconds(lambda: model.translate(src, MAX_LEN))
+        batched = seconds(lambda: model.translate(src, MAX_LEN, beam_size=BEAM_SIZE))
+        single = seconds(lambda: [model.translate(src[i:i + 1], MAX_LEN, beam_size=BEAM_SIZE)
+                                  for i in range(N_SENTENCES)])
+        print(name + ": greedy batched " + str(round(1000 * greedy / N_SENTENCES, 1)) +
+              ", beam " + str(BEAM_SIZE) + " batched " +
+              str(round(1000 * batched / N_SENTENCES, 1)) +
+              ", beam " + str(BEAM_SIZE) + " one sentence at a time " +
+              str(round(1000 * single / N_SENTENCES, 1)))
+    print("---------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Helpers shared by the benchmarks, which run from the root of the
+repository with this directory first on the path.
+"""
+# longest sentences kept, in words, as filter_pairs in the notebooks
+MAX_LENGTH = 50
+
+
+def read_pairs(path: str, n_pairs: int) -> tuple[list[str], list[str]]:
+    """
+    Reads the first n_pairs of a dataset written by the generators
+    where both sentences have less than MAX_LENGTH words.
+    """
+    src, trg = [], []
+    with open(path) as data_file:
+        for line in data_file:
+            s, t = line.rstrip("\n").split("\t")
+            if len(s.split()) < MAX_LENGTH and len(t.split()) < MAX_LENGTH:
+                src.append(s)
+                trg.append(t)
+            if len(src) == n_pairs:
+                break
+    return src, trg
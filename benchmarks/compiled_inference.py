@@ -0,0 +1,80 @@
+"""
+Benchmark of the teacher forced inference latency of both model classes
+with embed_size=512, as in the notebooks, run eagerly on every batch
+trimmed to its own length against CompiledTransformer from compiled.py,
+which pads the batches to length buckets compiled once at warm up, and
+against running eagerly on the same padded batches, and of greedy
+translation by translate of the models against that of CompiledTransformer.
+Batches are taken from the Atomic validation split, generated from
+v4_atomic_dev.csv, in the small batch sizes of serving. Run from the
+root of the repository, after generating the Atomic datasets:
+python ./benchmarks/compiled_inference.py [dataset.csv] [n_batches]
+"""
+import sys
+import time
+import warnings
+
+import torch
+
+sys.path.append(".")
+from common import MAX_LENGTH, read_pairs  # noqa: E402
+import Transformer  # noqa: E402
+import TorchTransformer  # noqa: E402
+from batching import trim_padding  # noqa: E402
+from compiled import CompiledTransformer  # noqa: E402
+from vocabulary import PAD_IDX, Vocabulary  # noqa: E402
+
+BATCH_SIZES = (1, 8)
+
+
+def latency_ms(run, batches) -> float:
+    with torch.no_grad():
+        start = time.perf_counter()
+        for source, target in batches:
+            run(source, target)
+    return (time.perf_counter() - start) / len(batches) * 1000
+
+
+def main(path="./atomic_datasets/all_dataset.csv", n_batches=50) -> None:
+    warnings.filterwarnings("ignore", message=".*nested tensors.*")
+    src, trg = read_pairs(path, n_batches * max(BATCH_SIZES))
+    src_vocab = Vocabulary.build(src)
+    trg_vocab = Vocabulary.build(trg)
+    src_ids = src_vocab.encode_tensor(src, length=MAX_LENGTH + 2)[:, 1:]
+    trg_ids = trg_vocab.encode_tensor(trg, length=MAX_LENGTH + 2)[:, :-1]
+
+    torch.manual_seed(0)
+    models = {
+        "Transformer": Transformer.Transformer(
+            len(src_vocab), len(trg_vocab), PAD_IDX, PAD_IDX, embed_size=512,
+            device="cpu", max_length=MAX_LENGTH + 2),
+        "TorchTransformer": TorchTransformer.Transformer(
+            len(src_vocab), len(trg_vocab), MAX_LENGTH + 2, embed_size=512,
+            pad_idx=PAD_IDX, device="cpu", mask_padding=True),
+    }
+    print("---------------------------------------------------------------")
+    print("Teacher forced inference, embed_size=512, " + str(n_batches) +
+          " batches of pairs of " + path + ", ms per batch")
+    for name, model in models.items():
+        model.eval()
+        compiled = CompiledTransformer(model)
+        seconds = compiled.warm_up(BATCH_SIZES)
+        print(name + ": warm up of " + str(len(compiled.buckets)) + " buckets x " +
+              str(len(BATCH_SIZES)) + " batch sizes in " + str(round(seconds)) + " s")
+        for batch_size in BATCH_SIZES:
+            batches = [(trim_padding(src_ids[i:i + batch_size]),
+                        trim_padding(trg_ids[i:i + batch_size]))
+                       for i in range(0, n_batches * batch_size, batch_size)]
+            padded = [compiled.pad_pair(source, target) for source, target in batches]
+            print("  batch " + str(batch_size) + ": eager " +
+                  str(round(latency_ms(model, batches), 1)) + ", eager padded " +
+                  str(round(latency_ms(model, padded), 1)) + ", compiled " +
+                  str(round(latency_ms(compiled, batches), 1)) + ", translate " +
+                  str(round(latency_ms(lambda source, _: model.translate(source), batches), 1)) +
+                  ", compiled translate " +
+                  str(round(latency_ms(lambda source, _: compiled.translate(source), batches), 1)))
+    print("---------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main(*[int(a) if a.isdigit() else a for a in sys.argv[1:]])
@@ -0,0 +1,133 @@
+"""
+Micro-benchmark of AtomicPreprocessor.correct_individuals on the
+inferences of the Atomic dev split, against the previous loop based
+implementation. Run from the root of the repository:
+python ./benchmarks/correct_individuals.py
+"""
+import sys
+import time
+
+sys.path.append(".")
+sys.path.append("./generation")
+from atomic_preprocessor import AtomicPreprocessor  # noqa: E402
+
+
+def reference_correct_individuals(inference: str) -> str:
+    """
+    The previous implementation of AtomicPreprocessor.correct_individuals,
+    which loops over every spelling of person for every word.
+    """
+
+    # all versions of the words person of Edit Distance 1
+    person_spellings = ["person", "eprson", "preson", "pesron", "perosn", "persno", "perons",
+                        "erson", "prson", "peson", "peron", "perso"]
+
+    words = inference.lower().replace('.', "").split()
+    corrected_inference = []
+    i = 0
+    while i < len(words):
+        # check if person has been been misspelled and a space
+        # exists between it and the individual variable
+        if words[i] in person_spellings:
+            if i != len(words) - 1:
+                if words[i+1] == 'x':
+                    corrected_inference.append("PersonX")
+                    i += 2
+                    continue
+                elif words[i+1] == 'y':
+                    corrected_inference.append("PersonY")
+                    i += 2
+                    continue
+                elif words[i+1] == 'z':
+                    corrected_inference.append("PersonZ")
+                    i += 2
+                    continue
+                elif words[i+1] == "x's" or words[i+1] == "xs":
+                    corrected_inference.append("PersonX's")
+                    i += 2
+                    continue
+                elif words[i+1] == "y's" or words[i+1] == "ys":
+                    corrected_inference.append("PersonY's")
+                    i += 2
+                    continue
+                elif words[i+1] == "z's" or words[i+1] == "zs":
+                    corrected_inference.append("PersonZ's")
+                    i += 2
+                    continue
+                else:
+                    corrected_inference.append("person")
+            else:
+                corrected_inference.append("person")
+
+        else:
+            # check for misspelling of personx, persony and personz
+            for person_spelling in person_spellings:
+                if words[i] == person_spelling + "x":
+                    corrected_inference.append("PersonX")
+                    break
+                elif words[i] == person_spelling + "y":
+                    corrected_inference.append("PersonY")
+                    break
+
+                elif words[i] == person_spelling + "z":
+                    corrected_inference.append("PersonZ")
+                    break
+
+                elif words[i] == person_spelling + "xs" or words[i] == person_spelling + "x's":
+                    corrected_inference.append("PersonX's")
+                    break
+                elif words[i] == person_spelling + "ys" or words[i] == person_spelling + "y's":
+                    corrected_inference.append("PersonY's")
+                    break
+
+                elif words[i] == person_spelling + "zs" or words[i] == person_spelling + "z's":
+                    corrected_inference.append("PersonZ's")
+                    break
+
+            else:
+                # check if the "person" part has been omitted
+                if words[i] == 'x':
+                    corrected_inference.append("PersonX")
+                elif words[i] == 'y':
+                    corrected_inference.append("PersonY")
+                elif words[i] == 'z':
+                    corrected_inference.append("PersonZ")
+
+                elif words[i] == "x's" or words[i] == "xs":
+                    corrected_inference.append("PersonX's")
+                elif words[i] == "y's" or words[i] == "ys":
+                    corrected_inference.append("PersonY's")
+                elif words[i] == "z's" or words[i] == "zs":
+                    corrected_inference.append("PersonZ's")
+                else:
+                    corrected_inference.append(words[i])
+        i += 1
+
+    return " ".join(corrected_inference)
+
+
+def read_inferences(preprocessor: AtomicPreprocessor, file_name: str) -> list[str]:
+    inferences = []
+    for record in preprocessor.filehandler.iter_atomic_csv(file_name):
+        for relation_inferences in record.inferences.values():
+            inferences.extend(relation_inferences)
+    return inferences
+
+
+if __name__ == "__main__":
+    ap = AtomicPreprocessor()
+    inferences = read_inferences(ap, "v4_atomic_dev.csv")
+
+    start = time.perf_counter()
+    reference = [reference_correct_individuals(i) for i in inferences]
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    corrected = [ap.correct_individuals(i) for i in inferences]
+    lookup_time = time.perf_counter() - start
+
+    assert corrected == reference, "outputs differ from the reference implementation"
+    print("inferences:", len(inferences))
+    print("reference: {:.3f}s".format(reference_time))
+    print("lookup:    {:.3f}s".format(lookup_time))
+    print("speedup:   {:.1f}x".format(reference_time / lookup_time))
@@ -0,0 +1,82 @@
+"""
+Benchmark of training an epoch with length bucketed, token budget
+batches against the fixed length DataLoader of the notebooks, which
+pads every pair to MAX_LENGTH + 2 tokens. Run from the root of the
+repository, after generating the Atomic datasets:
+python ./benchmarks/dynamic_batching.py [dataset.csv] [n_pairs]
+"""
+import sys
+import time
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+sys.path.append(".")
+from common import MAX_LENGTH, read_pairs  # noqa: E402
+from batching import BucketBatchSampler, collate_batch  # noqa: E402
+from TorchTransformer import Transformer  # noqa: E402
+from vocabulary import PAD_IDX, Vocabulary  # noqa: E402
+
+BATCH_SIZE = 128
+MAX_TOKENS = 4096
+
+
+def train_epoch(model, loader, optimizer, loss_func) -> tuple[float, int, int]:
+    """
+    Trains one epoch the same way as train() in the notebooks,
+    returning the time taken and the number of real and padded
+    source and target tokens fed to the model.
+    """
+    model.train()
+    real, padded = 0, 0
+    start = time.perf_counter()
+    for source, target in loader:
+        logits = model(source[:, 1:], target[:, :-1])
+        loss = loss_func(logits.reshape(-1, logits.shape[-1]), target[:, 1:].reshape(-1))
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        real += int((source != PAD_IDX).sum() + (target != PAD_IDX).sum())
+        padded += source.numel() + target.numel()
+    return time.perf_counter() - start, real, padded
+
+
+def main(path="./atomic_datasets/all_dataset.csv", n_pairs=10000) -> None:
+    torch.manual_seed(0)
+    src, trg = read_pairs(path, n_pairs)
+    src_vocab = Vocabulary.build(src)
+    trg_vocab = Vocabulary.build(trg)
+    dataset = TensorDataset(src_vocab.encode_tensor(src, length=MAX_LENGTH + 2),
+                            trg_vocab.encode_tensor(trg, length=MAX_LENGTH + 2))
+
+    loaders = {
+        "fixed length, batch_size=" + str(BATCH_SIZE):
+            DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True),
+        "bucketed, batch_size=" + str(BATCH_SIZE):
+            DataLoader(dataset, collate_fn=collate_batch,
+                       batch_sampler=BucketBatchSampler.from_dataset(
+                           dataset, batch_size=BATCH_SIZE, seed=0)),
+        "bucketed, max_tokens=" + str(MAX_TOKENS):
+            DataLoader(dataset, collate_fn=collate_batch,
+                       batch_sampler=BucketBatchSampler.from_dataset(
+                           dataset, max_tokens=MAX_TOKENS, seed=0)),
+    }
+
+    print("---------------------------------------------------------------")
+    print("Training one epoch on " + str(len(dataset)) + " pairs of " + path)
+    for name, loader in loaders.items():
+        torch.manual_seed(0)
+        model = Transformer(len(src_vocab), len(trg_vocab), max_length=MAX_LENGTH + 2,
+                            embed_size=128, n_heads=4, n_encoder_layers=2,
+                            n_decoder_layers=2, pad_idx=PAD_IDX, device="cpu")
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+        loss_func = torch.nn.CrossEntropyLoss(ignore_index=PAD_IDX)
+        seconds, real, padded = train_epoch(model, loader, optimizer, loss_func)
+        print(name + ": " + str(len(loader)) + " batches, " +
+              str(round(seconds, 2)) + "s, " + str(round(len(dataset) / seconds)) +
+              " pairs/s, " + str(round(100 * (1 - real / padded), 1)) + "% padding")
+    print("---------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main(*[int(a) if a.isdigit() else a for a in sys.argv[1:]])
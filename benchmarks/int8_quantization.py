@@ -0,0 +1,134 @@
+"""
+Benchmark of the dynamically int8 quantized copies of both model
+classes made by quantization.py against the float32 models on CPU.
+Reports the size of the saved state dicts and the latency of greedy
+translation of the models with embed_size=512, as in the notebooks, and
+the formula accuracy of small models trained on the Atomic validation
+split, generated from v4_atomic_dev.csv, before and after quantization.
+Run from the root of the repository, after generating the Atomic datasets:
+python ./benchmarks/int8_quantization.py [dataset.csv] [n_pairs] [epochs]
+"""
+import io
+import sys
+import time
+import warnings
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, TensorDataset
+
+sys.path.append(".")
+from common import MAX_LENGTH, read_pairs  # noqa: E402
+import Transformer  # noqa: E402
+import TorchTransformer  # noqa: E402
+from batching import BucketBatchSampler, collate_batch  # noqa: E402
+from evaluation import average_formula_accuracy, average_token_accuracy  # noqa: E402
+from quantization import quantize  # noqa: E402
+from vocabulary import PAD_IDX, Vocabulary  # noqa: E402
+
+BATCH_SIZE = 128
+LATENCY_BATCH_SIZES = [1, 32]
+REPEATS = 5
+
+
+def size_mb(model) -> float:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def latency_ms(model, src) -> float:
+    """
+    Returns the mean time of greedily translating src, the same
+    number of tokens for every model, as <EOS> is never produced.
+    """
+    model.translate(src, eos_idx=-1)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        model.translate(src, eos_idx=-1)
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def train(model, loader, epochs) -> None:
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3, betas=(0.9, 0.98), eps=1e-9)
+    model.train()
+    for _ in range(epochs):
+        for source, target in loader:
+            logits = model(source[:, 1:], target[:, :-1])
+            loss = F.cross_entropy(logits.reshape(-1, logits.shape[-1]),
+                                   target[:, 1:].reshape(-1), ignore_index=PAD_IDX,
+                                   label_smoothing=0.1)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+
+def accuracy(model, loader, trg_vocab) -> tuple[float, float]:
+    """
+    Returns the formula and token accuracy of greedy translations.
+    """
+    model.eval()
+    predicted, golden = [], []
+    for source, target in loader:
+        ids, _ = model.translate(source[:, 1:])
+        predicted += trg_vocab.decode(ids, strip_sos=False, include_eos=True)
+        golden += trg_vocab.decode(target, include_eos=True)
+    return (float(average_formula_accuracy(predicted, golden)),
+            float(average_token_accuracy(predicted, golden)))
+
+
+def main(path="./atomic_datasets/all_dataset.csv", n_pairs=4096, epochs=30) -> None:
+    warnings.filterwarnings("ignore", category=UserWarning)
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    src, trg = read_pairs(path, n_pairs)
+    src_vocab = Vocabulary.build(src)
+    trg_vocab = Vocabulary.build(trg)
+    dataset = TensorDataset(src_vocab.encode_tensor(src, length=MAX_LENGTH + 2),
+                            trg_vocab.encode_tensor(trg, length=MAX_LENGTH + 2))
+    train_set, val_set = torch.utils.data.random_split(
+        dataset, [0.85, 0.15], generator=torch.Generator().manual_seed(0))
+
+    def models(embed_size, n_heads, n_layers):
+        return {
+            "Transformer": Transformer.Transformer(
+                len(src_vocab), len(trg_vocab), PAD_IDX, PAD_IDX, embed_size=embed_size,
+                num_layers=n_layers, heads=n_heads, device="cpu", max_length=MAX_LENGTH + 2),
+            "TorchTransformer": TorchTransformer.Transformer(
+                len(src_vocab), len(trg_vocab), MAX_LENGTH + 2, embed_size=embed_size,
+                n_heads=n_heads, n_encoder_layers=n_layers, n_decoder_layers=n_layers,
+                pad_idx=PAD_IDX, device="cpu"),
+        }
+
+    print("---------------------------------------------------------------")
+    print("embed_size=512, greedy translation of " + str(MAX_LENGTH + 2) + " tokens")
+    torch.manual_seed(0)
+    for name, model in models(512, 8, 6).items():
+        model.eval()
+        quantized = quantize(model)
+        print(name + ": " + str(round(size_mb(model))) + " MB float32, " +
+              str(round(size_mb(quantized))) + " MB int8")
+        for batch_size in LATENCY_BATCH_SIZES:
+            source = torch.stack([val_set[i][0][1:] for i in range(batch_size)])
+            print("  batch " + str(batch_size) + ": " +
+                  str(round(latency_ms(model, source))) + " ms float32, " +
+                  str(round(latency_ms(quantized, source))) + " ms int8")
+
+    print("Formula and token accuracy on " + str(len(val_set)) + " held out pairs after " +
+          str(epochs) + " epochs on " + str(len(train_set)) + ", embed_size=128")
+    loader = DataLoader(train_set, collate_fn=collate_batch,
+                        batch_sampler=BucketBatchSampler.from_dataset(
+                            train_set, batch_size=BATCH_SIZE, seed=0))
+    val_loader = DataLoader(val_set, batch_size=BATCH_SIZE)
+    torch.manual_seed(0)
+    for name, model in models(128, 4, 2).items():
+        train(model, loader, epochs)
+        model.eval()
+        for precision_name, evaluated in [("float32", model), ("int8", quantize(model))]:
+            formula, token = accuracy(evaluated, val_loader, trg_vocab)
+            print(name + ", " + precision_name + ": formula " + str(round(formula, 3)) +
+                  ", token " + str(round(token, 3)))
+    print("---------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main(*[int(a) if a.isdigit() else a for a in sys.argv[1:]])
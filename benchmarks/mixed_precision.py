@@ -0,0 +1,137 @@
+"""
+Benchmark of mixed precision training and decoding on the Atomic
+validation split, generated from v4_atomic_dev.csv. Reports the time
+and memory of training steps of both model classes with embed_size=512,
+as in the notebooks, in float32 and under bfloat16 autocast, and the
+formula accuracy of a small TorchTransformer trained and decoded in
+either precision from the same initialization. Run from the root of the
+repository, after generating the Atomic datasets:
+python ./benchmarks/mixed_precision.py [dataset.csv] [n_pairs] [epochs]
+"""
+import sys
+import time
+import warnings
+
+import torch
+import torch.nn.functional as F
+from torch.profiler import ProfilerActivity, profile
+from torch.utils.data import DataLoader, TensorDataset
+
+sys.path.append(".")
+from common import MAX_LENGTH, read_pairs  # noqa: E402
+import Transformer  # noqa: E402
+import TorchTransformer  # noqa: E402
+from batching import BucketBatchSampler, collate_batch  # noqa: E402
+from evaluation import average_formula_accuracy, average_token_accuracy  # noqa: E402
+from precision import MixedPrecision  # noqa: E402
+from vocabulary import PAD_IDX, Vocabulary  # noqa: E402
+
+BATCH_SIZE = 128
+TIMED_STEPS = 5
+
+
+def train_step(model, source, target, optimizer, precision) -> float:
+    """
+    Trains on one batch the same way as train() in the notebooks.
+    """
+    with precision.autocast():
+        logits = model(source[:, 1:], target[:, :-1])
+        loss = F.cross_entropy(logits.reshape(-1, logits.shape[-1]).float(),
+                               target[:, 1:].reshape(-1), ignore_index=PAD_IDX,
+                               label_smoothing=0.1)
+    optimizer.zero_grad()
+    precision.backward(loss, optimizer)
+    return loss.item()
+
+
+def step_cost(model, batches, precision) -> tuple[float, float]:
+    """
+    Returns the mean time of a training step in ms, and the memory
+    allocated by the operators of a step in MB.
+    """
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    model.train()
+    train_step(model, *batches[0], optimizer, precision)
+    start = time.perf_counter()
+    for source, target in batches:
+        train_step(model, source, target, optimizer, precision)
+    elapsed = (time.perf_counter() - start) / len(batches) * 1000
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        train_step(model, *batches[0], optimizer, precision)
+    allocated = sum(max(event.self_cpu_memory_usage, 0) for event in prof.events())
+    return elapsed, allocated / 2**20
+
+
+def accuracy(model, loader, trg_vocab, dtype) -> tuple[float, float]:
+    """
+    Returns the formula and token accuracy of greedy translations.
+    """
+    model.eval()
+    predicted, golden = [], []
+    for source, target in loader:
+        ids, _ = model.translate(source[:, 1:], dtype=dtype)
+        predicted += trg_vocab.decode(ids, strip_sos=False, include_eos=True)
+        golden += trg_vocab.decode(target, include_eos=True)
+    return (float(average_formula_accuracy(predicted, golden)),
+            float(average_token_accuracy(predicted, golden)))
+
+
+def main(path="./atomic_datasets/all_dataset.csv", n_pairs=4096, epochs=30) -> None:
+    warnings.filterwarnings("ignore", message=".*nested tensors.*")
+    src, trg = read_pairs(path, n_pairs)
+    src_vocab = Vocabulary.build(src)
+    trg_vocab = Vocabulary.build(trg)
+    dataset = TensorDataset(src_vocab.encode_tensor(src, length=MAX_LENGTH + 2),
+                            trg_vocab.encode_tensor(trg, length=MAX_LENGTH + 2))
+    train_set, val_set = torch.utils.data.random_split(
+        dataset, [0.85, 0.15], generator=torch.Generator().manual_seed(0))
+    loader = DataLoader(train_set, collate_fn=collate_batch,
+                        batch_sampler=BucketBatchSampler.from_dataset(
+                            train_set, batch_size=BATCH_SIZE, seed=0))
+    batches = [batch for _, batch in zip(range(TIMED_STEPS), loader)]
+    precisions = {"float32": MixedPrecision("cpu", enabled=False),
+                  "bfloat16 autocast": MixedPrecision("cpu", torch.bfloat16)}
+
+    print("---------------------------------------------------------------")
+    print("Training steps of " + str(BATCH_SIZE) + " pairs of " + path +
+          ", embed_size=512")
+    for name, make_model in [
+            ("Transformer", lambda: Transformer.Transformer(
+                len(src_vocab), len(trg_vocab), PAD_IDX, PAD_IDX, embed_size=512,
+                device="cpu", max_length=MAX_LENGTH + 2, fused_attention=True)),
+            ("TorchTransformer", lambda: TorchTransformer.Transformer(
+                len(src_vocab), len(trg_vocab), MAX_LENGTH + 2, embed_size=512,
+                pad_idx=PAD_IDX, device="cpu"))]:
+        for precision_name, precision in precisions.items():
+            torch.manual_seed(0)
+            ms, mb = step_cost(make_model(), batches, precision)
+            print(name + ", " + precision_name + ": " + str(round(ms)) + " ms/step, " +
+                  str(round(mb)) + " MB allocated/step")
+
+    print("Formula and token accuracy on " + str(len(val_set)) + " held out pairs after " +
+          str(epochs) + " epochs on " + str(len(train_set)) + ", embed_size=128")
+    val_loader = DataLoader(val_set, batch_size=BATCH_SIZE)
+    for precision_name, precision in precisions.items():
+        torch.manual_seed(0)
+        model = TorchTransformer.Transformer(len(src_vocab), len(trg_vocab), MAX_LENGTH + 2,
+                                             embed_size=128, n_heads=4, n_encoder_layers=2,
+                                             n_decoder_layers=2, pad_idx=PAD_IDX,
+                                             device="cpu")
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-3, betas=(0.9, 0.98), eps=1e-9)
+        start = time.perf_counter()
+        model.train()
+        for _ in range(epochs):
+            for source, target in loader:
+                loss = train_step(model, source, target, optimizer, precision)
+        minutes = (time.perf_counter() - start) / 60
+        for decode_name, dtype in [("float32", None), ("bfloat16", torch.bfloat16)]:
+            formula, token = accuracy(model, val_loader, trg_vocab, dtype)
+            print("trained in " + precision_name + " (" + str(round(minutes, 1)) +
+                  " min, last loss " + str(round(loss, 3)) + "), decoded in " +
+                  decode_name + ": formula " + str(round(formula, 3)) +
+                  ", token " + str(round(token, 3)))
+    print("---------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main(*[int(a) if a.isdigit() else a for a in sys.argv[1:]])
@@ -0,0 +1,131 @@
+"""
+Benchmark of greedy translation with both model classes, with
+embed_size=512 as in the notebooks, run by PyTorch against the ONNX
+export of onnx_export.py run by OnnxTranslator from onnx_engine.py.
+Cold start is measured in a new process, from the imports to the
+first translation, loading the saved model and vocabularies, along
+with the memory of the process after it. Latency is measured on sources
+of the Atomic validation split, generated from v4_atomic_dev.csv, in
+the small batch sizes of serving. Run from the root of the repository,
+after generating the Atomic datasets:
+python ./benchmarks/onnx_inference.py [dataset.csv] [n_batches]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import torch
+
+sys.path.append(".")
+from common import MAX_LENGTH, read_pairs  # noqa: E402
+import Transformer  # noqa: E402
+import TorchTransformer  # noqa: E402
+from onnx_engine import OnnxTranslator  # noqa: E402
+from onnx_export import export_onnx  # noqa: E402
+from vocabulary import PAD_IDX, Vocabulary  # noqa: E402
+
+BATCH_SIZES = (1, 8)
+
+# run in a new process, printing the seconds to the first translation
+# and the resident memory in MB after it, as the peak of ru_maxrss
+# would include that of this process, which the new one is forked from
+COLD_START = {
+    "PyTorch": """
+import sys, time
+start = time.perf_counter()
+sys.path.append(".")
+import torch
+import {module}
+from vocabulary import Vocabulary
+src_vocab = Vocabulary.load("{directory}/src_vocab.txt")
+trg_vocab = Vocabulary.load("{directory}/trg_vocab.txt")
+model = {module}.Transformer({arguments})
+model.load_state_dict(torch.load("{directory}/model.pt"))
+model.eval()
+ids, _ = model.translate(src_vocab.encode_tensor(["{sentence}"])[:, 1:])
+trg_vocab.decode(ids, strip_sos=False)
+seconds = time.perf_counter() - start
+with open("/proc/self/status") as status:
+    rss = next(line.split()[1] for line in status if line.startswith("VmRSS"))
+print(seconds, int(rss) / 1024)
+""",
+    "ONNX": """
+import sys, time
+start = time.perf_counter()
+sys.path.append(".")
+from onnx_engine import OnnxTranslator
+OnnxTranslator("{directory}").translate(["{sentence}"])
+assert "torch" not in sys.modules
+seconds = time.perf_counter() - start
+with open("/proc/self/status") as status:
+    rss = next(line.split()[1] for line in status if line.startswith("VmRSS"))
+print(seconds, int(rss) / 1024)
+""",
+}
+
+
+def cold_start(code: str) -> tuple[float, float]:
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            check=True).stdout
+    seconds, megabytes = output.split()
+    return float(seconds), float(megabytes)
+
+
+def latency_ms(translate, batches) -> float:
+    start = time.perf_counter()
+    for batch in batches:
+        translate(batch)
+    return (time.perf_counter() - start) / len(batches) * 1000
+
+
+def main(path="./atomic_datasets/all_dataset.csv", n_batches=20) -> None:
+    warnings.filterwarnings("ignore")
+    sources, _ = read_pairs(path, n_batches * max(BATCH_SIZES))
+    src_vocab = Vocabulary.from_dataset(path, 0)
+    trg_vocab = Vocabulary.from_dataset(path, 1)
+    arguments = {
+        "Transformer": ((len(src_vocab), len(trg_vocab), PAD_IDX, PAD_IDX),
+                        dict(embed_size=512, device="cpu", max_length=MAX_LENGTH + 2)),
+        "TorchTransformer": ((len(src_vocab), len(trg_vocab), MAX_LENGTH + 2),
+                             dict(embed_size=512, pad_idx=PAD_IDX, device="cpu",
+                                  mask_padding=True)),
+    }
+
+    print("---------------------------------------------------------------")
+    print("Greedy translation, embed_size=512, sources of " + path)
+    for name, module in [("Transformer", Transformer), ("TorchTransformer", TorchTransformer)]:
+        torch.manual_seed(0)
+        args, kwargs = arguments[name]
+        model = module.Transformer(*args, **kwargs).eval()
+        with tempfile.TemporaryDirectory() as directory:
+            torch.save(model.state_dict(), os.path.join(directory, "model.pt"))
+            export_onnx(model, directory, src_vocab, trg_vocab)
+            print(name + ": cold start to the first translation")
+            for engine, code in COLD_START.items():
+                seconds, megabytes = cold_start(code.format(
+                    module=name, directory=directory,
+                    arguments=", ".join([repr(a) for a in args] +
+                                        [k + "=" + repr(v) for k, v in kwargs.items()]),
+                    sentence=json.dumps(sources[0])[1:-1]))
+                print("  " + engine + ": " + str(round(seconds, 2)) + " s, " +
+                      str(round(megabytes)) + " MB")
+            translator = OnnxTranslator(directory)
+
+            print(name + ": ms per batch of " + str(n_batches) + " batches")
+            for batch_size in BATCH_SIZES:
+                batches = [src_vocab.encode(sources[i:i + batch_size])[:, 1:]
+                           for i in range(0, n_batches * batch_size, batch_size)]
+                pytorch = latency_ms(lambda src: model.translate(torch.from_numpy(src)),
+                                     batches)
+                onnx = latency_ms(translator.translate_ids, batches)
+                print("  batch " + str(batch_size) + ": PyTorch " + str(round(pytorch, 1)) +
+                      ", ONNX " + str(round(onnx, 1)))
+    print("---------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main(*[int(a) if a.isdigit() else a for a in sys.argv[1:]])
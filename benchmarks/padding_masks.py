@@ -0,0 +1,64 @@
+"""
+Benchmark of inference throughput of TorchTransformer on the Atomic
+validation split, generated from v4_atomic_dev.csv, with and without
+mask_padding. Every pair is padded to MAX_LENGTH + 2 tokens as in the
+notebooks, and the model is run with teacher forcing as in their
+evaluation. Run from the root of the repository, after generating the
+Atomic datasets:
+python ./benchmarks/padding_masks.py [dataset.csv] [n_pairs]
+"""
+import sys
+import time
+import warnings
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+sys.path.append(".")
+from common import MAX_LENGTH, read_pairs  # noqa: E402
+from batching import BucketBatchSampler, collate_batch  # noqa: E402
+from TorchTransformer import Transformer  # noqa: E402
+from vocabulary import PAD_IDX, Vocabulary  # noqa: E402
+
+BATCH_SIZE = 128
+
+
+def pairs_per_second(model, loader) -> float:
+    n_pairs = 0
+    start = time.perf_counter()
+    with torch.no_grad():
+        for source, target in loader:
+            model(source[:, 1:], target[:, :-1])
+            n_pairs += source.shape[0]
+    return n_pairs / (time.perf_counter() - start)
+
+
+def main(path="./atomic_datasets/all_dataset.csv", n_pairs=2048) -> None:
+    # the nested tensors of the encoder warn that their API is a prototype
+    warnings.filterwarnings("ignore", message=".*nested tensors.*")
+    torch.manual_seed(0)
+    src, trg = read_pairs(path, n_pairs)
+    src_vocab = Vocabulary.build(src)
+    trg_vocab = Vocabulary.build(trg)
+    dataset = TensorDataset(src_vocab.encode_tensor(src, length=MAX_LENGTH + 2),
+                            trg_vocab.encode_tensor(trg, length=MAX_LENGTH + 2))
+    fixed = DataLoader(dataset, batch_size=BATCH_SIZE)
+    bucketed = DataLoader(dataset, collate_fn=collate_batch,
+                          batch_sampler=BucketBatchSampler.from_dataset(
+                              dataset, batch_size=BATCH_SIZE, shuffle=False))
+
+    model = Transformer(len(src_vocab), len(trg_vocab), max_length=MAX_LENGTH + 2,
+                        pad_idx=PAD_IDX, device="cpu").eval()
+    print("---------------------------------------------------------------")
+    print("Teacher forced inference on " + str(len(dataset)) + " pairs of " + path)
+    for name, mask_padding, loader in [("no padding masks, fixed length", False, fixed),
+                                       ("mask_padding, fixed length", True, fixed),
+                                       ("no padding masks, bucketed", False, bucketed),
+                                       ("mask_padding, bucketed", True, bucketed)]:
+        model.mask_padding = mask_padding
+        print(name + ": " + str(round(pairs_per_second(model, loader))) + " pairs/s")
+    print("---------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    main(*[int(a) if a.isdigit() else a for a in sys.argv[1:]])
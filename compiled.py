@@ -0,0 +1,189 @@
+import time
+
+import torch
+
+from vocabulary import EOS_IDX, SOS_IDX
+
+# the lengths the sources and targets are padded to, where most Atomic
+# formulas are 20 to 40 tokens, up to MAX_LENGTH + 2 of the notebooks
+BUCKETS = (24, 32, 40, 52)
+
+
+class StaticCache:
+    """
+    Stands in for decoding.DecoderCache when decoding with the compiled
+    decode_step, one token at a time. The self-attention keys and values
+    are allocated for capacity tokens at once, and every step writes those
+    of the new token at position, a tensor, and attends over the whole
+    buffers with the positions not decoded yet masked out, so that every
+    step has the same shapes and runs the same compiled graph.
+    """
+
+    def __init__(self, cache, capacity: int) -> None:
+        self.memory = cache.memory
+        self.src = cache.src
+        self.src_mask = cache.src_mask
+        self.cross_keys = cache.cross_keys
+        self.cross_values = cache.cross_values
+        N, _, heads, head_dim = cache.cross_keys[0].shape
+        self.self_keys = [keys.new_zeros((N, capacity, heads, head_dim))
+                          for keys in cache.cross_keys]
+        self.self_values = [values.new_zeros((N, capacity, heads, head_dim))
+                            for values in cache.cross_values]
+        self.capacity = capacity
+        self.position = torch.zeros((), dtype=torch.long, device=cache.src.device)
+
+    def tensors(self) -> list[torch.Tensor]:
+        """
+        Returns the tensors of the cache with the batch as first dimension.
+        """
+        tensors = [self.memory, self.src, *self.cross_keys, *self.cross_values,
+                   *self.self_keys, *self.self_values]
+        if self.src_mask is not None:
+            tensors.append(self.src_mask)
+        return tensors
+
+    def append(self, layer: int, keys: torch.Tensor,
+               values: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        if keys.shape[1] != 1:
+            raise ValueError("The static cache only decodes one token at a time")
+        written = torch.arange(self.capacity, device=keys.device) == self.position
+        written = written.view(1, -1, 1, 1)
+        self.self_keys[layer] = torch.where(written, keys, self.self_keys[layer])
+        self.self_values[layer] = torch.where(written, values, self.self_values[layer])
+        return self.self_keys[layer], self.self_values[layer]
+
+    def advance(self, n_tokens: int) -> None:
+        self.position = self.position + n_tokens
+
+    def positions(self, N: int, n_tokens: int, device) -> torch.Tensor:
+        return (self.position + torch.arange(n_tokens, device=device)).expand(N, n_tokens)
+
+    def step_mask(self, n_tokens: int, device) -> torch.Tensor:
+        # True for the tokens decoded so far and the new one
+        return (torch.arange(self.capacity, device=device) <= self.position).view(1, 1, 1, -1)
+
+
+class CompiledTransformer:
+    """
+    Inference entry point of a Transformer or TorchTransformer.Transformer
+    compiled with torch.compile, for teacher forced inference and greedy
+    translation. Sources and targets are padded to the smallest of a few
+    bucket lengths that fits both, and the batch is compiled as a dynamic
+    dimension, so that warm_up compiles the model once for every bucket at
+    startup, and once more for batches of a single sentence, instead of for
+    every batch size and pair of lengths it is called with. Padding the
+    target does not change the logits of its positions, as they do not
+    attend to later positions. Padding the source only leaves them
+    unchanged if the model ignores source padding, as Transformer does,
+    and TorchTransformer with mask_padding, so other models are rejected.
+    Runs under torch.no_grad(), with the model in eval().
+    """
+
+    def __init__(self, model, buckets=BUCKETS, **compile_options) -> None:
+        if not getattr(model, "mask_padding", True):
+            raise ValueError("Padding to the buckets changes the outputs of models "
+                             "without mask_padding")
+        # every bucket is compiled for batches of one sentence and of more
+        limit = torch._dynamo.config.recompile_limit
+        if 2 * len(buckets) > limit:
+            raise ValueError(str(len(buckets)) + " buckets need more compilations than "
+                             "torch._dynamo.config.recompile_limit, " + str(limit))
+        self.model = model.eval()
+        self.buckets = sorted(buckets)
+        self.src_pad_idx = getattr(model, "pad_idx", getattr(model, "src_pad_idx", 0))
+        self.trg_pad_idx = getattr(model, "pad_idx", getattr(model, "trg_pad_idx", 0))
+        self.forward = torch.compile(model, dynamic=False, **compile_options)
+        self.decode_step = torch.compile(model.decode_step, dynamic=False, **compile_options)
+
+    def bucket(self, length: int) -> int:
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        raise ValueError("Cannot pad " + str(length) + " tokens to the longest bucket " +
+                         str(self.buckets[-1]))
+
+    def pad(self, ids: torch.Tensor, length: int, pad_idx: int) -> torch.Tensor:
+        # always copied, as the compiled model is only reused for the strides
+        # it was compiled for, which a slice of a longer batch does not have
+        padded = ids.new_full((ids.shape[0], length), pad_idx)
+        padded[:, :ids.shape[1]] = ids
+        return padded
+
+    def pad_pair(self, src: torch.Tensor, trg: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Pads the source and target to the smallest bucket fitting both.
+        """
+        length = self.bucket(max(src.shape[1], trg.shape[1]))
+        return self.pad(src, length, self.src_pad_idx), self.pad(trg, length, self.trg_pad_idx)
+
+    def dynamic_batch(self, *tensors: torch.Tensor) -> None:
+        # a batch of one sentence is always compiled on its own,
+        # as torch.compile specializes dimensions of size 1
+        for tensor in tensors:
+            if tensor.shape[0] > 1:
+                torch._dynamo.mark_dynamic(tensor, 0)
+
+    def __call__(self, src: torch.Tensor, trg: torch.Tensor) -> torch.Tensor:
+        """
+        Returns the logits of forward(src, trg), computed over the
+        source and target padded to their bucket.
+        """
+        src_padded, trg_padded = self.pad_pair(src, trg)
+        self.dynamic_batch(src_padded, trg_padded)
+        with torch.no_grad():
+            logits = self.forward(src_padded, trg_padded)
+        return logits[:, :trg.shape[1]]
+
+    def translate(self, src: torch.Tensor, max_len: int = None, sos_idx=SOS_IDX,
+                  eos_idx=EOS_IDX) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Greedily translates a batch of sources (N, src_len), as translate
+        of the model, with the source padded to its bucket, encoded eagerly
+        by init_cache, and decoded by the compiled decode_step over a
+        StaticCache allocated for the longest bucket. The whole batch is
+        decoded until every sentence has produced <EOS>, as dropping the
+        finished ones would change the shapes. Returns the ids (N, max_len)
+        and the length of every translation including <EOS>.
+        """
+        N = src.shape[0]
+        with torch.no_grad():
+            cache = self.model.init_cache(self.pad(src, self.bucket(src.shape[1]),
+                                                   self.src_pad_idx))
+            capacity = min(cache.capacity, self.buckets[-1])
+            if max_len is None or max_len > capacity:
+                max_len = capacity
+            cache = StaticCache(cache, capacity)
+            ids = torch.full((N, max_len), self.trg_pad_idx, dtype=torch.long,
+                             device=src.device)
+            lengths = torch.full((N,), max_len, dtype=torch.long, device=src.device)
+            finished = torch.zeros(N, dtype=torch.bool, device=src.device)
+            tokens = torch.full((N, 1), sos_idx, dtype=torch.long, device=src.device)
+            for step in range(max_len):
+                self.dynamic_batch(tokens, *cache.tensors())
+                tokens = self.decode_step(tokens, cache)[:, -1].argmax(dim=-1)
+                # finished sentences are only continued with padding
+                tokens = tokens.masked_fill(finished, self.trg_pad_idx)
+                ids[:, step] = tokens
+                ended = tokens == eos_idx
+                lengths[ended] = step + 1
+                finished |= ended
+                if finished.all():
+                    break
+                tokens = tokens.unsqueeze(1)
+        return ids, lengths
+
+    def warm_up(self, batch_sizes=(1, 2), device="cpu") -> float:
+        """
+        Compiles forward and decode_step for every bucket, for batches of
+        every size in batch_sizes, returning the seconds it took. Batches
+        of one sentence and of more are compiled separately, and any size
+        above 1 covers all the others, so later calls do not recompile.
+        """
+        start = time.perf_counter()
+        for batch_size in batch_sizes:
+            for length in self.buckets:
+                ids = torch.full((batch_size, length), self.src_pad_idx + 3, device=device)
+                self(ids, ids)
+                self.translate(ids, max_len=1)
+        return time.perf_counter() - start
@@ -0,0 +1,237 @@
+from typing import Optional
+
+import torch
+
+from precision import autocast
+
+
+class DecoderCache:
+    """
+    State of a batch of sentences being decoded one token at a time,
+    shared by Transformer.py and TorchTransformer.py. Holds the output
+    of the encoder, the keys and values of the cross-attention of every
+    decoder layer, projected once per source, and the keys and values of
+    the self-attention of every decoder layer for the tokens decoded so far.
+    Keys and values are stored as (N, length, heads, head_dim).
+    """
+
+    def __init__(self, cross_keys: list[torch.Tensor], cross_values: list[torch.Tensor],
+                 capacity: int, memory: torch.Tensor, src: torch.Tensor,
+                 src_mask: Optional[torch.Tensor] = None) -> None:
+        self.cross_keys = cross_keys
+        self.cross_values = cross_values
+        # the self-attention keys and values are allocated
+        # for capacity tokens at the first step
+        self.self_keys = [None] * len(cross_keys)
+        self.self_values = [None] * len(cross_keys)
+        self.capacity = capacity
+        self.length = 0
+        self.memory = memory
+        self.src = src
+        self.src_mask = src_mask
+
+    def __len__(self) -> int:
+        return self.length
+
+    def batch_size(self) -> int:
+        return self.src.shape[0]
+
+    def append(self, layer: int, keys: torch.Tensor,
+               values: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Stores the keys and values of the new tokens of a layer and
+        returns those of all tokens decoded so far, including the new.
+        """
+        new_length = self.length + keys.shape[1]
+        if new_length > self.capacity:
+            raise ValueError("Cannot decode more than " + str(self.capacity) + " tokens")
+        if self.self_keys[layer] is None:
+            shape = (keys.shape[0], self.capacity) + keys.shape[2:]
+            self.self_keys[layer] = keys.new_zeros(shape)
+            self.self_values[layer] = values.new_zeros(shape)
+        self.self_keys[layer][:, self.length:new_length] = keys
+        self.self_values[layer][:, self.length:new_length] = values
+        return self.self_keys[layer][:, :new_length], self.self_values[layer][:, :new_length]
+
+    def advance(self, n_tokens: int) -> None:
+        """
+        Moves past the new tokens once every layer has appended them.
+        """
+        self.length += n_tokens
+
+    def positions(self, N: int, n_tokens: int, device) -> torch.Tensor:
+        """
+        Returns the positions (N, n_tokens) of n_tokens new tokens.
+        """
+        return torch.arange(self.length, self.length + n_tokens, device=device).expand(
+            N, n_tokens)
+
+    def step_mask(self, n_tokens: int, device) -> Optional[torch.Tensor]:
+        """
+        Returns the causal mask of n_tokens new tokens over all tokens
+        decoded so far, True where attending is allowed, or None
+        for a single token, which may attend to every token.
+        """
+        if n_tokens == 1:
+            return None
+        return torch.ones((n_tokens, self.length + n_tokens), dtype=torch.bool,
+                          device=device).tril(diagonal=self.length)
+
+    def select(self, indices: torch.Tensor) -> None:
+        """
+        Keeps only the sentences at indices, in their order, for
+        dropping finished sentences or reordering beams.
+        """
+        def index(tensor):
+            return None if tensor is None else tensor.index_select(0, indices)
+        self.cross_keys = [index(t) for t in self.cross_keys]
+        self.cross_values = [index(t) for t in self.cross_values]
+        self.self_keys = [index(t) for t in self.self_keys]
+        self.self_values = [index(t) for t in self.self_values]
+        self.memory = index(self.memory)
+        self.src = index(self.src)
+        self.src_mask = index(self.src_mask)
+
+
+def greedy_decode(model, src: torch.Tensor, max_len: int = None, sos_idx=1, eos_idx=2,
+                  pad_idx=0, constraint=None, dtype=None) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Translates a batch of sources greedily with a model having init_cache
+    and decode_step. The source is encoded once, and the sentences are
+    decoded in lockstep, one token per step, with every sentence dropped
+    from the batch and its cache once it has produced <EOS>.
+    Returns the ids (N, max_len), without <SOS> and padded after <EOS>,
+    and the length of every sentence including its <EOS>.
+    A constraint, as grammar.FormulaAutomaton, restricts every
+    step to the tokens allowed by the state of each sentence.
+    With a dtype, as torch.bfloat16, the model runs under autocast to it.
+    """
+    with torch.no_grad(), autocast(src.device, dtype):
+        cache = model.init_cache(src)
+        if max_len is None or max_len > cache.capacity:
+            max_len = cache.capacity
+        N = src.shape[0]
+        ids = torch.full((N, max_len), pad_idx, dtype=torch.long, device=src.device)
+        lengths = torch.full((N,), max_len, dtype=torch.long, device=src.device)
+        # rows of the batch still being decoded
+        active = torch.arange(N, device=src.device)
+        tokens = torch.full((N,), sos_idx, dtype=torch.long, device=src.device)
+        if constraint is not None:
+            constraint = constraint.to(src.device)
+            states = constraint.initial_states(N, src.device)
+        for step in range(max_len):
+            logits = model.decode_step(tokens.unsqueeze(1), cache)[:, -1]
+            if constraint is not None:
+                logits = constraint.mask(logits, states)
+            tokens = logits.argmax(dim=-1)
+            if constraint is not None:
+                states = constraint.advance(states, tokens)
+            ids[active, step] = tokens
+            finished = tokens == eos_idx
+            if finished.any():
+                lengths[active[finished]] = step + 1
+                keep = (~finished).nonzero().squeeze(1)
+                if len(keep) == 0:
+                    break
+                active = active[keep]
+                tokens = tokens[keep]
+                if constraint is not None:
+                    states = states[keep]
+                cache.select(keep)
+        return ids, lengths
+
+
+def beam_search(model, src: torch.Tensor, beam_size: int, max_len: int = None,
+                length_penalty=1.0, sos_idx=1, eos_idx=2,
+                pad_idx=0, constraint=None, dtype=None) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Translates a batch of sources with beam search, with the beams of all
+    sentences flattened into one batch of N * beam_size rows, decoded in
+    lockstep with the same model calls as greedy_decode. Every step takes
+    the topk of the scores of all continuations of the beams of a sentence,
+    and reorders the hypotheses and the cache with index_select.
+    Hypotheses are ranked by their summed log probability divided by
+    length ** length_penalty. A sentence is finished, and dropped from the
+    batch, once all its beams have produced <EOS>. Returns the ids and
+    lengths of the best hypothesis of every sentence, as greedy_decode.
+    With a constraint, beams are only spent on the tokens it allows.
+    The scores are accumulated in float32, also under a dtype.
+    """
+    with torch.no_grad(), autocast(src.device, dtype):
+        cache = model.init_cache(src)
+        if max_len is None or max_len > cache.capacity:
+            max_len = cache.capacity
+        N, device = src.shape[0], src.device
+        # every sentence starts as beam_size copies of its source
+        cache.select(torch.arange(N, device=device).repeat_interleave(beam_size))
+
+        ids = torch.full((N, max_len), pad_idx, dtype=torch.long, device=device)
+        lengths = torch.full((N,), max_len, dtype=torch.long, device=device)
+        active = torch.arange(N, device=device)
+        hypotheses = torch.full((N * beam_size, max_len), pad_idx, dtype=torch.long, device=device)
+        hypothesis_lengths = torch.zeros((N, beam_size), dtype=torch.long, device=device)
+        finished = torch.zeros((N, beam_size), dtype=torch.bool, device=device)
+        # only the first beam is expanded at the first step,
+        # the others would only give copies of its hypotheses
+        scores = torch.full((N, beam_size), float("-inf"), device=device)
+        scores[:, 0] = 0
+        tokens = torch.full((N * beam_size,), sos_idx, dtype=torch.long, device=device)
+        if constraint is not None:
+            constraint = constraint.to(device)
+            states = constraint.initial_states(N * beam_size, device)
+
+        for step in range(max_len):
+            n_active = len(active)
+            logits = model.decode_step(tokens.unsqueeze(1), cache)[:, -1].float()
+            if constraint is not None:
+                logits = constraint.mask(logits, states)
+            log_probs = torch.log_softmax(logits, dim=-1)
+            vocab_size = log_probs.shape[-1]
+            # finished hypotheses are only continued with padding, at no cost
+            done = finished.view(-1)
+            log_probs[done] = float("-inf")
+            log_probs[done, pad_idx] = 0
+
+            candidate_scores = (scores.view(-1, 1) + log_probs).view(n_active, -1)
+            candidate_lengths = (hypothesis_lengths + ~finished).view(-1, 1).expand(-1, vocab_size)
+            candidate_lengths = candidate_lengths.reshape(n_active, -1)
+            normalized = candidate_scores / candidate_lengths.float() ** length_penalty
+            _, best = normalized.topk(beam_size, dim=1)
+
+            beams = best // vocab_size
+            tokens = (best % vocab_size).view(-1)
+            rows = (torch.arange(n_active, device=device).unsqueeze(1) * beam_size + beams).view(-1)
+            scores = candidate_scores.gather(1, best)
+            hypothesis_lengths = candidate_lengths.gather(1, best)
+            hypotheses = hypotheses.index_select(0, rows)
+            hypotheses[:, step] = tokens
+            if constraint is not None:
+                states = constraint.advance(states.index_select(0, rows), tokens)
+            finished = finished.view(-1).index_select(0, rows).view(n_active, beam_size) | \
+                (tokens == eos_idx).view(n_active, beam_size)
+
+            # the sentences whose beams have all finished, or the last step
+            done_sentences = finished.all(dim=1) if step < max_len - 1 else \
+                torch.ones(n_active, dtype=torch.bool, device=device)
+            if done_sentences.any():
+                normalized = scores / hypothesis_lengths.float() ** length_penalty
+                top = normalized.argmax(dim=1)
+                for i in done_sentences.nonzero().squeeze(1).tolist():
+                    ids[active[i]] = hypotheses[i * beam_size + top[i]]
+                    lengths[active[i]] = hypothesis_lengths[i, top[i]]
+                keep = (~done_sentences).nonzero().squeeze(1)
+                if len(keep) == 0:
+                    break
+                keep_rows = (keep.unsqueeze(1) * beam_size +
+                             torch.arange(beam_size, device=device)).view(-1)
+                active = active[keep]
+                scores = scores[keep]
+                finished = finished[keep]
+                hypothesis_lengths = hypothesis_lengths[keep]
+                hypotheses = hypotheses[keep_rows]
+                tokens = tokens[keep_rows]
+                rows = rows[keep_rows]
+                if constraint is not None:
+                    states = states[keep_rows]
+            cache.select(rows)
+        return ids, lengths
@@ -1,72 +1,181 @@
+import os
+import sys
 from re import L
-from filehandler import FileHandler
-from atomic_preprocessor import AtomicPreprocessor
-from atomic_logifier import AtomicLogifier
 
-import nltk
+from tqdm import tqdm
+
+if __name__ == "__main__":
+    # run as a script from generation/, the vocabularies of the
+    # models are in the root of the repository
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import filehandler  # noqa: E402
+import atomic_preprocessor  # noqa: E402
+import atomic_logifier  # noqa: E402
+import tagged_corpus  # noqa: E402
+import vocabulary  # noqa: E402
+from filehandler import FileHandler  # noqa: E402
+from atomic_preprocessor import AtomicPreprocessor  # noqa: E402
+from atomic_logifier import AtomicLogifier  # noqa: E402
+from manifest import Manifest, stage_versions  # noqa: E402
+from tagged_corpus import TaggedCorpus, TaggedIfThen  # noqa: E402
 
 
 class AtomicGenerator():
 
     def __init__(self,
                  in_dir='./atomic_data/',
-                 out_dir='./atomic_datasets/') -> None:
-        self.filehandler = FileHandler(in_dir=in_dir, out_dir=out_dir)
-        self.preprocessor = AtomicPreprocessor()
+                 out_dir='./atomic_datasets/',
+                 workers=1,
+                 tag_cache=None,
+                 write_tokens=False) -> None:
+        self.filehandler = FileHandler(
+            in_dir=in_dir, out_dir=out_dir, write_tokens=write_tokens)
+        self.workers = workers
+        self.preprocessor = AtomicPreprocessor(tag_cache=tag_cache)
         self.logifier = AtomicLogifier()
+        self.manifest = Manifest(out_dir + "manifest.json")
 
-    def untag_if_then(self, if_then_list: list[str]) -> list[str]:
-        untagged = []
+    def stage_versions(self) -> dict[str, str]:
+        versions = stage_versions({
+            "filehandler": filehandler,
+            "preprocessor": atomic_preprocessor,
+            "tagged_corpus": tagged_corpus,
+            "logifier": atomic_logifier,
+            "vocabulary": vocabulary,
+            "generator": sys.modules[__name__],
+        })
+        # the tags also depend on the NLTK version and the tagger model,
+        # which are not part of the source of any stage
+        versions["tagger"] = self.preprocessor.POStagger.tagger_version()
+        return versions
 
-        for sentence in if_then_list:
-            sentence = sentence.lower().replace(',', " ")
-            tagged_tupes = [nltk.tag.str2tuple(t) for t in sentence.split()]
-            untagged_sentence = [word for word, _ in tagged_tupes]
-            untagged.append(" ".join(untagged_sentence))
-        return untagged
+    def dataset_paths(self) -> list[str]:
+        names = ["all"] + list(self.preprocessor.categories.keys())
+        return [path for suffix in ["_dataset", "_dataset_wo_q"] for name in names
+                for path in self.filehandler.dataset_paths(name + suffix)]
 
-    def generate_atomic_datasets(self, file_name: str):
-        self.logifier.add_quantifiers = True
-        data = self.filehandler.read_from_csv(file_name)
-        if_then_all = self.preprocessor.preprocess_atomic(data[1:])
-        if_then_categories = self.preprocessor.split__atomic_by_categories(
-            if_then_all)
+    def untag_if_then(self, if_then_list: list[TaggedIfThen]) -> list[str]:
+        return [if_then.untagged() for if_then in if_then_list]
+
+    def preprocess_file(self, file_name: str) -> TaggedCorpus:
+        """
+        Reads the Atomic file and splits, corrects
+        and POS-tags its if-then relations.
+        """
+        data = list(self.filehandler.iter_atomic_csv(file_name))
+        return self.preprocessor.preprocess_atomic(
+            data, workers=self.workers)
+
+    def category_indices(self, if_then_list: TaggedCorpus) -> dict[str, list[int]]:
+        """
+        Returns the indices of the if-then relations
+        belonging to each of the categories.
+        """
+        indices = {k: [] for k in self.preprocessor.categories.keys()}
+        for i, if_then in enumerate(if_then_list):
+            dim = if_then.relation.name
+            for key in self.preprocessor.categories.keys():
+                if dim in self.preprocessor.categories[key]:
+                    indices[key].append(i)
+        return indices
+
+    def write_datasets(self, if_then_all: TaggedCorpus, untagged_all: list[str],
+                       indices: dict[str, list[int]], add_quantifiers: bool) -> None:
+        """
+        Logifies the preprocessed if-then relations once and writes
+        the dataset of all relations and of every category.
+        The category datasets reuse the formulas of the full dataset,
+        and the vocabularies of its token ids.
+        """
+        self.logifier.add_quantifiers = add_quantifiers
+        suffix = "_dataset" if add_quantifiers else "_dataset_wo_q"
 
         print("---Creating dataset for all if-then relations---")
         logic = self.logifier.atomic_data_to_logic(if_then_all)
-        self.filehandler.write_dataset_to_csv(
-            self.untag_if_then(if_then_all), logic, "all_dataset")
+        vocabs = self.filehandler.write_dataset(
+            untagged_all, logic, "all" + suffix)
 
-        for category in if_then_categories.keys():
+        for category in indices.keys():
             print("---Creating dataset for " +
                   category + " if-then relations---")
-            logic = self.logifier.atomic_data_to_logic(
-                if_then_categories[category])
-            self.filehandler.write_dataset_to_csv(
-                self.untag_if_then(if_then_categories[category]), logic, category + "_dataset")
+            self.filehandler.write_dataset(
+                [untagged_all[i] for i in indices[category]],
+                [logic[i] for i in indices[category]],
+                category + suffix, vocabs=vocabs)
+
+    def generate_all_atomic_datasets(self, file_name: str, force=False):
+        """
+        Reads and preprocesses the Atomic file once, and writes the
+        datasets both with and without quantifiers from the result.
+        Skips the generation if the manifest shows the datasets were
+        made from the same input and code, unless force is set.
+        """
+        inputs = [self.filehandler.in_dir + file_name]
+        outputs = self.dataset_paths()
+        stages = self.stage_versions()
+        if not force and self.manifest.is_up_to_date(file_name, inputs, stages, outputs):
+            print("---Datasets of " + file_name + " are up to date---")
+            return
+
+        if_then_all = self.preprocess_file(file_name)
+        untagged_all = self.untag_if_then(if_then_all)
+        indices = self.category_indices(if_then_all)
+        self.write_datasets(if_then_all, untagged_all,
+                            indices, add_quantifiers=True)
+        self.write_datasets(if_then_all, untagged_all,
+                            indices, add_quantifiers=False)
+
+        self.manifest.record(file_name, inputs, stages, outputs)
+        self.manifest.save()
+
+    def generate_atomic_datasets(self, file_name: str):
+        if_then_all = self.preprocess_file(file_name)
+        self.write_datasets(if_then_all, self.untag_if_then(if_then_all),
+                            self.category_indices(if_then_all), add_quantifiers=True)
 
     def generate_atomic_datasets_wo_quantifiers(self, file_name: str):
-        self.logifier.add_quantifiers = False
-        data = self.filehandler.read_from_csv(file_name)
-        if_then_all = self.preprocessor.preprocess_atomic(data[1:])
-        if_then_categories = self.preprocessor.split__atomic_by_categories(
-            if_then_all)
+        if_then_all = self.preprocess_file(file_name)
+        self.write_datasets(if_then_all, self.untag_if_then(if_then_all),
+                            self.category_indices(if_then_all), add_quantifiers=False)
 
-        print("---Creating dataset for all if-then relations---")
-        logic = self.logifier.atomic_data_to_logic(if_then_all)
-        self.filehandler.write_dataset_to_csv(
-            self.untag_if_then(if_then_all), logic, "all_dataset_wo_q")
+    def stream_all_atomic_datasets(self, file_name: str, buffer_size=5000):
+        """
+        Streaming version of generate_all_atomic_datasets. The records flow
+        through splitting, tagging, logification and writing in chunks
+        of about buffer_size relations that are appended to the dataset
+        files, so memory use stays flat for any size of input.
+        Only the csv files are written, not the token ids.
+        """
+        records = self.filehandler.iter_atomic_csv(file_name)
 
-        for category in if_then_categories.keys():
-            print("---Creating dataset for " +
-                  category + " if-then relations---")
-            logic = self.logifier.atomic_data_to_logic(
-                if_then_categories[category])
-            self.filehandler.write_dataset_to_csv(
-                self.untag_if_then(if_then_categories[category]), logic, category + "_dataset_wo_q")
+        names = ["all"] + list(self.preprocessor.categories.keys())
+        # start every dataset as an empty file before appending
+        for suffix in ["_dataset", "_dataset_wo_q"]:
+            for name in names:
+                self.filehandler.write_dataset_to_csv([], [], name + suffix)
+
+        print("---Streaming Atomic datasets in chunks of " +
+              str(buffer_size) + " if-then relations---")
+        chunks = self.preprocessor.preprocess_atomic_stream(
+            records, buffer_size=buffer_size)
+        for if_then_chunk in tqdm(chunks):
+            untagged = self.untag_if_then(if_then_chunk)
+            indices = self.category_indices(if_then_chunk)
+            for add_quantifiers in [True, False]:
+                self.logifier.add_quantifiers = add_quantifiers
+                suffix = "_dataset" if add_quantifiers else "_dataset_wo_q"
+                logic = self.logifier.atomic_data_to_logic(if_then_chunk)
+                self.filehandler.write_dataset_to_csv(
+                    untagged, logic, "all" + suffix, append=True)
+                for category in indices.keys():
+                    self.filehandler.write_dataset_to_csv(
+                        [untagged[i] for i in indices[category]],
+                        [logic[i] for i in indices[category]],
+                        category + suffix, append=True)
 
 
 if __name__ == "__main__":
-    ag = AtomicGenerator()
-    ag.generate_atomic_datasets("v4_atomic_all.csv")
-    ag.generate_atomic_datasets_wo_quantifiers("v4_atomic_all.csv")
+    ag = AtomicGenerator(workers=os.cpu_count(),
+                         tag_cache="./generated/pos_tag_cache.sqlite")
+    ag.generate_all_atomic_datasets("v4_atomic_all.csv")
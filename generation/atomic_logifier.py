@@ -1,7 +1,10 @@
+import functools
 import nltk
 from sortedcollections import OrderedSet
+from typing import Sequence, Union
 
 from filehandler import FileHandler
+from tagged_corpus import TaggedIfThen, TaggedSentence, TaggedTokens
 
 
 class AtomicLogifier:
@@ -16,12 +19,44 @@ class AtomicLogifier:
     def __init__(self,
                  in_dir='./generated/',
                  out_dir='./atomic_dataset/',
-                 add_quantifiers=True) -> None:
+                 add_quantifiers=True,
+                 event_cache_size=65536) -> None:
         self.add_quantifiers = add_quantifiers
+        # the same event is shared by many inferences, so its logic is
+        # cached on its (word, tag) tuples or the tagged event string
+        self.cached_event_to_logic = functools.lru_cache(
+            maxsize=event_cache_size)(self.frozen_event_to_logic)
 
-    def event_to_logic(self, event: list[str]) -> tuple[list[str], list[str]]:
+    def event_cache_info(self):
+        """
+        Returns the hits, misses and size of the event logic cache,
+        as the named tuple of functools.lru_cache.
+        """
+        return self.cached_event_to_logic.cache_info()
+
+    def frozen_event_to_logic(self, event: Union[TaggedTokens, str]) -> tuple[tuple[str, ...], tuple[str, ...]]:
+        """
+        Returns the atoms and variables of event_to_logic as tuples,
+        so the results shared by the cache cannot be changed by callers.
+        """
+        event_logic, variables = self.event_to_logic(event)
+        return tuple(event_logic), tuple(variables)
+
+    def tag_tuples(self, sentence: Union[TaggedSentence, TaggedTokens, str]) -> list[tuple[str, str]]:
+        """
+        Returns the (word, tag) tuples of a tagged sentence, as a
+        list that can be changed, or of a string in the format
+        "word/TAG word/TAG".
+        """
+        if isinstance(sentence, TaggedSentence):
+            return sentence.tuples()
+        if isinstance(sentence, tuple):
+            return list(sentence)
+        return [nltk.tag.str2tuple(t) for t in sentence.split()]
+
+    def event_to_logic(self, event: Union[TaggedSentence, TaggedTokens, str]) -> tuple[list[str], list[str]]:
         event_logic = []
-        tagged_tupes = [nltk.tag.str2tuple(t) for t in event.split()]
+        tagged_tupes = self.tag_tuples(event)
 
         individuals = OrderedSet([word[0:7].lower()
                                   for word, tag in tagged_tupes if tag == "IND"])
@@ -68,9 +103,9 @@ class AtomicLogifier:
 
         return event_logic, variables
 
-    def inference_to_logic(self, inference: list[str], event_logic: list[str], subject="x") -> tuple[list[str], list[str]]:
+    def inference_to_logic(self, inference: Union[TaggedSentence, str], event_logic: Sequence[str], subject="x") -> tuple[list[str], list[str]]:
         inference_logic = []
-        tagged_tupes = [nltk.tag.str2tuple(t) for t in inference.split()]
+        tagged_tupes = self.tag_tuples(inference)
 
         individuals = OrderedSet([word[0:7].lower()
                                   for word, tag in tagged_tupes if tag == "IND"])
@@ -215,14 +250,20 @@ class AtomicLogifier:
 
         return inference_logic, concept_variables
 
-    def atomic_if_then_to_logic(self, if_then: str) -> str:
+    def atomic_if_then_to_logic(self, if_then: Union[TaggedIfThen, str]) -> str:
         """
-        Given a if-then-relation in the format
+        Given a tagged if-then-relation, or one in the format
         "event,relation_dimension,inference" returns
         an equivalent logical formula.
         """
-        event, dim, inference = if_then.split(',')
-        event_logic, event_vars = self.event_to_logic(event)
+        if isinstance(if_then, TaggedIfThen):
+            # the cache is keyed on the content of the event and not its
+            # view, which would keep the whole corpus of the view alive
+            event = tuple(if_then.event.tuples())
+            dim, inference = if_then.relation.name, if_then.inference
+        else:
+            event, dim, inference = if_then.split(',')
+        event_logic, event_vars = self.cached_event_to_logic(event)
 
         # construct the body by conjuncting the atoms in the event
         body_logic = " & ".join(event_logic)
@@ -246,10 +287,11 @@ class AtomicLogifier:
 
         return if_then_logic
 
-    def atomic_data_to_logic(self, data: list[str]) -> list[str]:
+    def atomic_data_to_logic(self, data: list[Union[TaggedIfThen, str]]) -> list[str]:
         """
-        Given a list of  if-then relations in the format "event,relation_dimension,inference"
-        returns their equivalent logical formulas in a list.
+        Given a list of tagged if-then relations, or ones in the format
+        "event,relation_dimension,inference" returns their equivalent
+        logical formulas in a list.
         """
         logic_data = []
         for d in data:
@@ -1,50 +1,268 @@
 import enum
-import re
+import hashlib
+import os
+import pathlib
+import sqlite3
+import sys
+import time
 import nltk
-from typing import Tuple
+from multiprocessing import Pool
+from typing import Iterator, Tuple
 from tqdm import tqdm
 
-from filehandler import FileHandler
+if __name__ == "__main__":
+    # run as a script from generation/, the vocabularies of the
+    # models are in the root of the repository
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from filehandler import AtomicRecord, FileHandler  # noqa: E402
+from tagged_corpus import (Relation, TaggedCorpus, TaggedIfThen, TaggedRelation,  # noqa: E402
+                           TaggedTokens, TokenTable)
+
+
+# words that are always tagged as individuals (IND) instead of their NLTK tag
+INDIVIDUALS = ["personx", "persony", "personz", "personx's", "persony's", "personz's"]
+
+
+class POSTagCache:
+    """
+    Persistent cache in a single SQLite file mapping normalized
+    sentences, keyed by their hash, to the tags of their words.
+    The cache is emptied when it was made with another version
+    of the tagger or list of individuals, or of its own format.
+    The workers of a process pool open it read-only, after the
+    parent has created and checked it, and leave the writes
+    of their new tags to the parent, its only writer.
+    """
+
+    # changed whenever the layout of the tables changes
+    FORMAT = "2"
+
+    def __init__(self, path: str, version: str = None, read_only=False) -> None:
+        self.read_only = read_only
+        if read_only:
+            uri = pathlib.Path(path).absolute().as_uri() + "?mode=ro"
+            self.connection = sqlite3.connect(uri, uri=True, timeout=60)
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True, mode=0o755)
+        self.connection = sqlite3.connect(path, timeout=60)
+        # readers are not blocked while the parent writes
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        version = self.FORMAT + ":" + version
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != version:
+                self.connection.execute("DROP TABLE IF EXISTS tags")
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS tags (hash TEXT PRIMARY KEY, tags TEXT)")
+
+    def sentence_hash(self, sentence: str) -> str:
+        return hashlib.sha1(sentence.encode("utf-8")).hexdigest()
+
+    def lookup(self, sentences: list[str], batch_size=500) -> dict[str, TaggedTokens]:
+        """
+        Returns the tagged sentences for all of the given
+        sentences that are found in the cache.
+        """
+        hashes = {self.sentence_hash(s): s for s in sentences}
+        keys = list(hashes.keys())
+        found = {}
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i:i + batch_size]
+            query = "SELECT hash, tags FROM tags WHERE hash IN (" + \
+                ",".join("?" * len(batch)) + ")"
+            for sentence_hash, tags in self.connection.execute(query, batch):
+                sentence = hashes[sentence_hash]
+                found[sentence] = tuple(zip(sentence.split(), tags.split()))
+        return found
+
+    def insert(self, tagged_sentences: dict[str, TaggedTokens]) -> None:
+        if self.read_only:
+            raise ValueError("Cannot insert into a read-only tag cache")
+        # the words are those of the normalized sentence, so only the tags are stored
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tags VALUES (?, ?)",
+                [(self.sentence_hash(s), " ".join(tag for _, tag in t))
+                 for s, t in tagged_sentences.items()])
+
+    def close(self) -> None:
+        self.connection.close()
 
 
 class POStagger:
     """
     Class meant for taking if-then relations from Atomic
     and part-of-speech tagging them.
+    Tagged sentences can optionally be stored in a
+    persistent cache file, so reruns skip the tagging.
+    With a read-only cache the new tagged sentences are
+    kept in new_tags instead, for the owner of the cache.
+    Creating a cache needs the tagger model to be installed,
+    to check that the cached tags were made by it.
     """
 
-    def pos_tag_sentence(self, sentence: str) -> str:
+    def __init__(self, cache_path=None, read_only_cache=False) -> None:
+        self.tagger = None
+        self.cache = None
+        self.cache_hits = 0
+        self.new_tags = {}
+        if cache_path is not None:
+            if read_only_cache:
+                self.cache = POSTagCache(cache_path, read_only=True)
+            else:
+                self.cache = POSTagCache(cache_path, self.tagger_version())
+
+    def load_tagger(self) -> nltk.tag.PerceptronTagger:
+        """
+        Loads the NLTK tagger model the first time it is needed,
+        so each process only reads it from disk once.
+        """
+        if self.tagger is None:
+            self.tagger = nltk.tag.PerceptronTagger()
+        return self.tagger
+
+    def model_files(self) -> list[str]:
+        """
+        Returns the paths of the files of the tagger model, found
+        the way nltk.tag.PerceptronTagger of the installed NLTK finds
+        them: the json files of NLTK 3.9 and later, or the pickle of
+        earlier versions, or the zip file holding either.
+        Raises LookupError if the model is not installed.
+        """
+        if hasattr(nltk.tag.PerceptronTagger, "load_from_json"):
+            model = nltk.data.find("taggers/averaged_perceptron_tagger_eng/")
+        else:
+            model = nltk.data.find(
+                "taggers/averaged_perceptron_tagger/averaged_perceptron_tagger.pickle")
+        if isinstance(model, nltk.data.ZipFilePathPointer):
+            # read from the zip file of the model, not unpacked
+            return [model.zipfile.filename]
+        if os.path.isdir(model.path):
+            return [os.path.join(model.path, file_name)
+                    for file_name in sorted(os.listdir(model.path))]
+        return [model.path]
+
+    def tagger_version(self) -> str:
+        """
+        Identifies the tagger model and list of individuals,
+        without loading the model, so cached tags can be invalidated.
+        Raises LookupError if the model is not installed, as
+        the tags could not be told apart from those of another.
+        """
+        version = hashlib.sha1()
+        version.update(nltk.__version__.encode("utf-8"))
+        version.update(" ".join(INDIVIDUALS).encode("utf-8"))
+        for path in self.model_files():
+            with open(path, "rb") as model_file:
+                version.update(model_file.read())
+        return version.hexdigest()
+
+    def tag_individuals(self, sentence_tag_tuples: list[Tuple[str, str]]) -> TaggedTokens:
+        """
+        Returns the output of the tagger as (word, tag) tuples,
+        with the individuals PersonX, PersonY and PersonZ tagged as IND.
+        """
+        return tuple((word, "IND") if word.lower() in INDIVIDUALS else (word, tag)
+                     for word, tag in sentence_tag_tuples)
+
+    def pos_tag_sentence(self, sentence: str) -> TaggedTokens:
         sentence = sentence.split()
-        sentence_tag_tuples = nltk.pos_tag(sentence)
-        tagged_sentence = []
-        for word, tag in sentence_tag_tuples:
-            if word.lower() in ["personx", "persony", "personz", "personx's", "persony's", "personz's"]:
-                tagged_sentence.append(word + "/" + "IND")
+        sentence_tag_tuples = self.load_tagger().tag(sentence)
+        return self.tag_individuals(sentence_tag_tuples)
+
+    def pos_tag_sentences(self, sentences: list[str], batch_size=1000,
+                          verbose=True) -> dict[str, TaggedTokens]:
+        """
+        Tags every unique sentence exactly once with pos_tag_sents
+        and returns a mapping from sentence to tagged sentence.
+        Sentences are keyed on their whitespace separated tokens,
+        as that is all the tagger sees.
+        Sentences found in the cache are not tagged again.
+        """
+        unique_sentences = list(dict.fromkeys(" ".join(s.split()) for s in sentences))
+        tagged_sentences = {}
+        if self.cache is not None:
+            tagged_sentences = self.cache.lookup(unique_sentences)
+            self.cache_hits = len(tagged_sentences)
+            unique_sentences = [s for s in unique_sentences
+                                if s not in tagged_sentences]
+
+        batches = range(0, len(unique_sentences), batch_size)
+        if verbose:
+            batches = tqdm(batches)
+
+        new_tagged_sentences = {}
+        for i in batches:
+            batch = unique_sentences[i:i + batch_size]
+            batch_tag_tuples = self.load_tagger().tag_sents(
+                [sentence.split() for sentence in batch])
+            for sentence, sentence_tag_tuples in zip(batch, batch_tag_tuples):
+                new_tagged_sentences[sentence] = self.tag_individuals(
+                    sentence_tag_tuples)
+
+        if self.cache is not None and new_tagged_sentences:
+            if self.cache.read_only:
+                self.new_tags.update(new_tagged_sentences)
             else:
-                tagged_sentence.append(word + "/" + tag)
-        return " ".join(tagged_sentence)
+                self.cache.insert(new_tagged_sentences)
+        tagged_sentences.update(new_tagged_sentences)
+        return tagged_sentences
 
-    def pos_tag_if_then_relation(self, if_then: str) -> str:
+    def pos_tag_if_then_relation(self, if_then: str) -> TaggedRelation:
         event, relation, inference = if_then.split(',')
         event_tagged = self.pos_tag_sentence(event)
         inference_tagged = self.pos_tag_sentence(inference)
-        return ",".join([event_tagged, relation, inference_tagged])
+        return event_tagged, Relation[relation], inference_tagged
 
-    def pos_tag_if_then_relations(self, if_then_list: list[str]) -> list[str]:
+    def pos_tag_if_then_relations(self, if_then_list: list[str],
+                                  verbose=True) -> list[TaggedRelation]:
+        """
+        POS-tags a list of if-then relations in one batch, where
+        every unique event and inference is only tagged once
+        and the result is fanned back out to all relations using it.
+        """
+        if verbose:
+            print("---POS-tagging if-then relations---")
+        start = time.perf_counter()
+        if_then_triples = [if_then.split(',') for if_then in if_then_list]
+        sentences = []
+        for event, _, inference in if_then_triples:
+            sentences.append(event)
+            sentences.append(inference)
+        tagged_sentences = self.pos_tag_sentences(sentences, verbose=verbose)
+
+        # every unique sentence is one tuple shared by all relations using it
         tagged_if_then_relations = []
-        print("---POS-tagging if-then relations---")
-        for if_then in tqdm(if_then_list):
-            tagged_if_then = self.pos_tag_if_then_relation(if_then)
-            tagged_if_then_relations.append(tagged_if_then)
+        for event, relation, inference in if_then_triples:
+            tagged_if_then_relations.append((
+                tagged_sentences[" ".join(event.split())],
+                Relation[relation],
+                tagged_sentences[" ".join(inference.split())]))
+
+        if verbose and sentences:
+            elapsed = time.perf_counter() - start
+            print("---Tagged " + str(len(tagged_sentences)) + " unique of " + str(len(sentences)) +
+                  " sentences (dedupe ratio " + "{:.2f}".format(len(sentences) / len(tagged_sentences)) +
+                  ", " + "{:.0f}".format(len(sentences) / elapsed) + " sentences/s)---")
+            if self.cache is not None:
+                print("---" + str(self.cache_hits) + " unique sentences found in the tag cache---")
         return tagged_if_then_relations
 
 
 class AtomicPreprocessor:
 
     def __init__(self,
-                 in_dir='./atomic_data/', out_dir='./generated/') -> None:
+                 in_dir='./atomic_data/', out_dir='./generated/', tag_cache=None) -> None:
         self.filehandler = FileHandler(in_dir=in_dir, out_dir=out_dir)
-        self.POStagger = POStagger()
+        self.tag_cache = tag_cache
+        self.POStagger = POStagger(cache_path=tag_cache)
         self.relations = [
             "oEffect",
             "oReact",
@@ -61,8 +279,9 @@ class AtomicPreprocessor:
             "mental": ["xIntent", "xReact", "oReact"],
             "event": ["xEffect", "oEffect", "xNeed", "xWant", "oWant"]
         }
+        self.build_individual_spellings()
 
-    def split_open_closed(self, data: list[str], return_open=False) -> None:
+    def split_open_closed(self, data: list[AtomicRecord], return_open=False) -> list[AtomicRecord]:
         """
         Splits a given dataset into a closed and open dataset,
         based on if there exists an unknown word in it or not.
@@ -77,17 +296,41 @@ class AtomicPreprocessor:
             print("---Obtaining closed if-then-inferences---")
 
         for d in tqdm(data):
-            sentence = d[0]
-            if "___" in sentence:
-                open_data.append(sentence)
+            if "___" in d.event:
+                open_data.append(d)
             else:
-                closed_data.append(sentence)
+                closed_data.append(d)
 
         if return_open:
             return open_data
 
         return closed_data
 
+    def build_individual_spellings(self) -> None:
+        """
+        Precomputes the lookup tables used by correct_individuals,
+        mapping every known misspelling of the individuals to
+        their correct spelling.
+        """
+        # all versions of the words person of Edit Distance 1
+        self.person_spellings = {"person", "eprson", "preson", "pesron", "perosn", "persno", "perons",
+                                 "erson", "prson", "peson", "peron", "perso"}
+
+        # the individual variables, when the "person" part
+        # is omitted or seperated from it by a space
+        self.individual_suffixes = {}
+        for variable in ["x", "y", "z"]:
+            self.individual_suffixes[variable] = "Person" + variable.upper()
+            for possessive in [variable + "'s", variable + "s"]:
+                self.individual_suffixes[possessive] = "Person" + \
+                    variable.upper() + "'s"
+
+        # misspellings of personx, persony and personz
+        self.individual_spellings = dict(self.individual_suffixes)
+        for person_spelling in self.person_spellings:
+            for suffix, individual in self.individual_suffixes.items():
+                self.individual_spellings[person_spelling + suffix] = individual
+
     def correct_individuals(self, inference):
         """
         Standardizes and corrects the spellings of the
@@ -95,90 +338,23 @@ class AtomicPreprocessor:
         The spell correction handles all cases of an edit distance
         of 1 from the correct spelling.
         """
-
-        # all versions of the words person of Edit Distance 1
-        person_spellings = ["person", "eprson", "preson", "pesron", "perosn", "persno", "perons",
-                            "erson", "prson", "peson", "peron", "perso"]
-
         words = inference.lower().replace('.', "").split()
         corrected_inference = []
         i = 0
         while i < len(words):
+            word = words[i]
             # check if person has been been misspelled and a space
             # exists between it and the individual variable
-            if words[i] in person_spellings:
-                if i != len(words) - 1:
-                    if words[i+1] == 'x':
-                        corrected_inference.append("PersonX")
-                        i += 2
-                        continue
-                    elif words[i+1] == 'y':
-                        corrected_inference.append("PersonY")
-                        i += 2
-                        continue
-                    elif words[i+1] == 'z':
-                        corrected_inference.append("PersonZ")
-                        i += 2
-                        continue
-                    elif words[i+1] == "x's" or words[i+1] == "xs":
-                        corrected_inference.append("PersonX's")
-                        i += 2
-                        continue
-                    elif words[i+1] == "y's" or words[i+1] == "ys":
-                        corrected_inference.append("PersonY's")
-                        i += 2
-                        continue
-                    elif words[i+1] == "z's" or words[i+1] == "zs":
-                        corrected_inference.append("PersonZ's")
-                        i += 2
-                        continue
-                    else:
-                        corrected_inference.append("person")
-                else:
-                    corrected_inference.append("person")
-
+            if word in self.person_spellings:
+                if i != len(words) - 1 and words[i+1] in self.individual_suffixes:
+                    corrected_inference.append(
+                        self.individual_suffixes[words[i+1]])
+                    i += 2
+                    continue
+                corrected_inference.append("person")
             else:
-                # check for misspelling of personx, persony and personz
-                for person_spelling in person_spellings:
-                    if words[i] == person_spelling + "x":
-                        corrected_inference.append("PersonX")
-                        break
-                    elif words[i] == person_spelling + "y":
-                        corrected_inference.append("PersonY")
-                        break
-
-                    elif words[i] == person_spelling + "z":
-                        corrected_inference.append("PersonZ")
-                        break
-
-                    elif words[i] == person_spelling + "xs" or words[i] == person_spelling + "x's":
-                        corrected_inference.append("PersonX's")
-                        break
-                    elif words[i] == person_spelling + "ys" or words[i] == person_spelling + "y's":
-                        corrected_inference.append("PersonY's")
-                        break
-
-                    elif words[i] == person_spelling + "zs" or words[i] == person_spelling + "z's":
-                        corrected_inference.append("PersonZ's")
-                        break
-
-                else:
-                    # check if the "person" part has been omitted
-                    if words[i] == 'x':
-                        corrected_inference.append("PersonX")
-                    elif words[i] == 'y':
-                        corrected_inference.append("PersonY")
-                    elif words[i] == 'z':
-                        corrected_inference.append("PersonZ")
-
-                    elif words[i] == "x's" or words[i] == "xs":
-                        corrected_inference.append("PersonX's")
-                    elif words[i] == "y's" or words[i] == "ys":
-                        corrected_inference.append("PersonY's")
-                    elif words[i] == "z's" or words[i] == "zs":
-                        corrected_inference.append("PersonZ's")
-                    else:
-                        corrected_inference.append(words[i])
+                corrected_inference.append(
+                    self.individual_spellings.get(word, word))
             i += 1
 
         return " ".join(corrected_inference)
@@ -199,43 +375,43 @@ class AtomicPreprocessor:
         else:
             return False
 
-    def split_inferences_into_list(self, inferences_prefix_set) -> list[list[str]]:
+    def split_into_if_then(self, record: AtomicRecord, remove_none=True) -> list[str]:
         """
-        Splits the input format of the inferences + prefix + dataset_tag to
-        just be a list of all nine relation types, where each entry is a list
-        consisting of that relations inferences
+        Splits an Atomic record into if-then relations in the
+        format "event,relation_dimension,inference".
+        As commas seperate the parts of the relation, commas
+        inside the event and inferences are replaced by spaces,
+        and unexpected " are removed.
         """
-        ips = inferences_prefix_set.replace("\"", "")
-        ips = re.split(',(?! .+\])', ips)
-        return ips[0:9]
-
-    def split_into_if_then(self, data: str, remove_none=True) -> list[str]:
         if_then_list = []
-        event, *inferences_prefix_set = data.split(',', maxsplit=1)
-        # remove unexpected " from events
-        event = event.replace('"', "")
-        inference_list = self.split_inferences_into_list(
-            inferences_prefix_set[0])
-        for index, inferences in enumerate(inference_list):
-            if inferences != "[]":
-                stripped_inferences = inferences.replace(
-                    '[', "").replace(']', "")
-                stripped_inferences = [x.strip()
-                                       for x in stripped_inferences.split(',')]
-                for inference in stripped_inferences:
-                    corrected_inference = self.correct_individuals(inference)
-                    # skip examples that are not desired
-                    if self.exclude_example(event, corrected_inference, remove_none):
-                        continue
-                    if_then_list.append(
-                        ",".join([event, self.relations[index], corrected_inference]))
+        event = " ".join(record.event.replace(',', " ").replace('"', "").split())
+        for relation in self.relations:
+            for inference in record.inferences.get(relation, []):
+                corrected_inference = self.correct_individuals(
+                    inference.replace(',', " ").replace('"', ""))
+                # skip examples that are not desired
+                if self.exclude_example(event, corrected_inference, remove_none):
+                    continue
+                if_then_list.append(
+                    ",".join([event, relation, corrected_inference]))
 
         return if_then_list
 
-    def preprocess_atomic(self, data: list[str], open_data=False, remove_none=True) -> list[str]:
+    def preprocess_atomic(self, data: list[AtomicRecord], open_data=False, remove_none=True,
+                          workers=1, chunk_size=500) -> TaggedCorpus:
+        """
+        Splits, corrects and POS-tags the Atomic data.
+        With more than one worker the rows are split into chunks of
+        chunk_size and processed in a process pool, the results are
+        joined back in the original order.
+        """
         # split the Atomic data and only keep the closed set
         data = self.split_open_closed(data, return_open=open_data)
 
+        if workers > 1:
+            return self.preprocess_atomic_parallel(
+                data, remove_none=remove_none, workers=workers, chunk_size=chunk_size)
+
         # reformat from all inferences of the event being in one list
         # into every index being a seperate if-then relation
         if_then_relations = []
@@ -249,30 +425,120 @@ class AtomicPreprocessor:
         # POS tag the if-then relations
         tagged_if_then_relations = self.POStagger.pos_tag_if_then_relations(
             if_then_relations)
-        return tagged_if_then_relations
+        corpus = TaggedCorpus()
+        corpus.extend(tagged_if_then_relations)
+        corpus.release_sentence_ids()
+        return corpus
 
-    def split__atomic_by_categories(self, if_then_list: list[str]) -> dict[str]:
+    def preprocess_atomic_stream(self, records: Iterator[AtomicRecord], open_data=False,
+                                 remove_none=True, buffer_size=5000) -> Iterator[TaggedCorpus]:
+        """
+        Streaming version of preprocess_atomic. Records are split as they
+        are read, and the if-then relations are tagged and yielded in
+        chunks of about buffer_size, so memory use does not grow with
+        the size of the input.
+        """
+        # the chunks share their token table, which only
+        # grows with the vocabulary and not the input size
+        table = TokenTable()
+        buffer = []
+        for record in records:
+            if ("___" in record.event) != open_data:
+                continue
+            buffer.extend(self.split_into_if_then(
+                record, remove_none=remove_none))
+            if len(buffer) >= buffer_size:
+                corpus = TaggedCorpus(table)
+                corpus.extend(self.POStagger.pos_tag_if_then_relations(
+                    buffer, verbose=False))
+                corpus.release_sentence_ids()
+                yield corpus
+                buffer = []
+        if buffer:
+            corpus = TaggedCorpus(table)
+            corpus.extend(self.POStagger.pos_tag_if_then_relations(
+                buffer, verbose=False))
+            corpus.release_sentence_ids()
+            yield corpus
+
+    def preprocess_chunk(self, data: list[AtomicRecord],
+                         remove_none=True) -> tuple[list[TaggedRelation], dict[str, TaggedTokens]]:
+        """
+        Splits and POS-tags a chunk of Atomic rows without any
+        progress output, used by the workers of the process pool.
+        Also returns the sentences tagged that were not in the
+        read-only tag cache, for the parent to write.
+        """
+        if_then_relations = []
+        for if_then_collection in data:
+            if_then_relations.extend(self.split_into_if_then(
+                if_then_collection, remove_none=remove_none))
+        tagged = self.POStagger.pos_tag_if_then_relations(if_then_relations, verbose=False)
+        new_tags, self.POStagger.new_tags = self.POStagger.new_tags, {}
+        return tagged, new_tags
+
+    def preprocess_atomic_parallel(self, data: list[AtomicRecord], remove_none=True,
+                                   workers=2, chunk_size=500) -> TaggedCorpus:
+        chunks = [data[i:i + chunk_size]
+                  for i in range(0, len(data), chunk_size)]
+        corpus = TaggedCorpus()
+        print("---Splitting and POS-tagging if-then relations with " +
+              str(workers) + " workers---")
+        # the cache was created and checked against the tagger version
+        # by the POStagger of this process, before the workers open it
+        with Pool(workers, initializer=_init_worker, initargs=(remove_none, self.tag_cache)) as pool:
+            # imap keeps the chunks in their original order
+            for tagged_chunk, new_tags in tqdm(pool.imap(_preprocess_chunk, chunks),
+                                               total=len(chunks)):
+                corpus.extend(tagged_chunk)
+                if new_tags:
+                    self.POStagger.cache.insert(new_tags)
+        corpus.release_sentence_ids()
+        return corpus
+
+    def split__atomic_by_categories(self, if_then_list: TaggedCorpus) -> dict[str, list[TaggedIfThen]]:
         if_then_categories = {k: [] for k in self.categories.keys()}
 
         for if_then in if_then_list:
-            _, dim, _ = if_then.split(',')
+            dim = if_then.relation.name
             for key in self.categories.keys():
                 if dim in self.categories[key]:
                     if_then_categories[key].append(if_then)
         return if_then_categories
 
-    def read_data_write_dataset(self, filename: str, open_data=False, remove_none=True) -> None:
+    def read_data_write_dataset(self, filename: str, open_data=False, remove_none=True, workers=1) -> None:
         # get the Atomic data, and only keep the closed set
-        data = self.filehandler.read_from_csv(filename)
-        data = data[1:]  # remove header
+        data = list(self.filehandler.iter_atomic_csv(filename))
         data = self.preprocess_atomic(
-            data, open_data=open_data, remove_none=remove_none)
-        if open_data:
-            self.filehandler.write_list_to_csv(data, "atomic_open")
-        else:
-            self.filehandler.write_list_to_csv(data, "atomic_closed")
+            data, open_data=open_data, remove_none=remove_none, workers=workers)
+        name = "atomic_open" if open_data else "atomic_closed"
+        self.filehandler.write_list_to_csv([str(d) for d in data], name)
+        self.filehandler.write_tagged_corpus(data, name)
+
+
+# state of each worker in the process pool of preprocess_atomic_parallel
+_worker_preprocessor = None
+_worker_remove_none = True
+
+
+def _init_worker(remove_none: bool, tag_cache: str) -> None:
+    global _worker_preprocessor, _worker_remove_none
+    _worker_preprocessor = AtomicPreprocessor()
+    if tag_cache is None:
+        _worker_preprocessor.POStagger.load_tagger()
+    else:
+        # the tagger is only loaded if a sentence is missing from the cache,
+        # and the sentences tagged are written by the parent
+        _worker_preprocessor.tag_cache = tag_cache
+        _worker_preprocessor.POStagger = POStagger(cache_path=tag_cache, read_only_cache=True)
+    _worker_remove_none = remove_none
+
+
+def _preprocess_chunk(chunk: list[AtomicRecord]) -> tuple[list[TaggedRelation],
+                                                         dict[str, TaggedTokens]]:
+    return _worker_preprocessor.preprocess_chunk(chunk, remove_none=_worker_remove_none)
 
 
 if __name__ == "__main__":
     ap = AtomicPreprocessor()
-    ap.read_data_write_dataset("v4_atomic_all.csv")
+    ap.read_data_write_dataset("v4_atomic_all.csv", workers=os.cpu_count())
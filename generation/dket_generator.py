@@ -1,13 +1,32 @@
-from filehandler import FileHandler
+import os
+import sys
+from multiprocessing import Pool
 from typing import Tuple
 import nltk
 from tqdm import tqdm
 
+if __name__ == "__main__":
+    # run as a script from generation/, the vocabularies of the
+    # models are in the root of the repository
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import filehandler  # noqa: E402
+import pointers  # noqa: E402
+import vocabulary  # noqa: E402
+from filehandler import FileHandler  # noqa: E402
+from manifest import Manifest, stage_versions  # noqa: E402
+from pointers import pointer_vocabulary  # noqa: E402
+from vocabulary import Vocabulary  # noqa: E402
 
-class DketGenerator():
 
-    def __init__(self, in_dir='./dket_data/', out_dir='./dket_datasets/') -> None:
-        self.filehandler = FileHandler(in_dir=in_dir, out_dir=out_dir)
+class DketCleaner():
+    """
+    Cleans the lines of the DKET data, kept apart from DketGenerator
+    so it can be sent to the workers of a process pool as it is.
+    """
+
+    def __init__(self, pointer_targets=False) -> None:
+        self.pointer_targets = pointer_targets
 
     def _logic_replace_indices(self, text: list[str], logic: list[str]) -> list[str]:
         """Replaces logic where words are represented as indices
@@ -37,6 +56,9 @@ class DketGenerator():
         and logic for use in Transformers."""
         text = self._remove_pos_tags(text)
 
+        if self.pointer_targets:
+            return (" ".join(text), " ".join(logic.replace("<EOS>", "").split()))
+
         # Remove <EOS> tag and the LOC# identifier for indices
         logic = logic.replace("LOC#", "").replace("<EOS>", "")
         logic_list = logic.split()
@@ -44,28 +66,158 @@ class DketGenerator():
         corrected_logic = self._logic_replace_indices(text, logic_list)
         return (" ".join(text), " ".join(corrected_logic))
 
-    def read_data_write_dataset(self, dataset_name: str) -> None:
+
+class DketGenerator():
+
+    def __init__(self, in_dir='./dket_data/', out_dir='./dket_datasets/', write_tokens=False,
+                 pointer_targets=False, max_length=50) -> None:
+        """
+        With pointer_targets the logic keeps the LOC#i references to
+        the words of the text instead of the words themselves, and
+        the datasets are written as "dket_pointer_<dataset>".
+        max_length is the MAX_LENGTH of the models trained on the
+        token ids, whose pointer targets refer to up to max_length + 2
+        positions, <SOS> and <EOS> included.
+        """
+        self.filehandler = FileHandler(
+            in_dir=in_dir, out_dir=out_dir, write_tokens=write_tokens)
+        self.manifest = Manifest(out_dir + "manifest.json")
+        self.pointer_targets = pointer_targets
+        self.max_length = max_length
+        self.cleaner = DketCleaner(pointer_targets)
+
+    def stage_versions(self) -> dict[str, str]:
+        return stage_versions({
+            "filehandler": filehandler,
+            "vocabulary": vocabulary,
+            "pointers": pointers,
+            "generator": sys.modules[__name__],
+        })
+
+    def output_name(self, dataset_name: str) -> str:
+        return ("dket_pointer_" if self.pointer_targets else "dket_") + dataset_name
+
+    def manifest_key(self, dataset_name: str) -> str:
+        return ("pointer_" if self.pointer_targets else "") + dataset_name
+
+    def clean_data(self, text: str, logic: str) -> Tuple[str, str]:
+        return self.cleaner.clean_data(text, logic)
+
+    def read_data_write_dataset(self, dataset_name: str, force=False) -> None:
         """
         Loads DKET data from input directory
         and creates dataset with clean format ii 
         output directory.
+        Skips datasets the manifest shows are up to date, unless forced.
         """
-        training_data = self.filehandler.read_from_csv(
-            dataset_name + ".tsv")
-        text_data = []
-        logic_data = []
-        for text, logic in tqdm(training_data):
-            td, ld = self.clean_data(text, logic)
-            text_data.append(td)
-            logic_data.append(ld)
+        self.generate_dket_datasets([dataset_name], force=force)
+
+    def group_name(self, dataset_name: str) -> str:
+        """
+        Returns the size of a split like "train_2k", the splits
+        of the same size sharing the vocabularies of their ids.
+        """
+        return dataset_name.split("_", 1)[-1]
+
+    def build_vocabs(self, text_data: list[str], logic_data: list[str]) -> tuple[Vocabulary, Vocabulary]:
+        """
+        Builds the vocabularies of all splits of a size from the
+        lines of every split, as the DKET notebook builds them from
+        the train and validation data. The pointer targets get the
+        references to every source position the model can point to.
+        """
+        if self.pointer_targets:
+            return (self.filehandler.build_vocab(text_data),
+                    pointer_vocabulary(logic_data, self.max_length + 2))
+        return (self.filehandler.build_vocab(text_data),
+                self.filehandler.build_vocab(logic_data))
+
+    def generate_dket_datasets(self, dataset_names: list[str], workers=1, chunk_size=2000, force=False) -> None:
+        """
+        Creates several DKET datasets at once. The splits share many
+        lines, so every unique (text, logic) line is cleaned only once,
+        with the unique lines spread over a process pool if workers > 1.
+        The splits of the same size are written with shared vocabularies,
+        and are all regenerated if the manifest shows any of them is out
+        of date, unless forced.
+        """
+        stages = self.stage_versions()
+        groups = {}
+        for dataset_name in dataset_names:
+            groups.setdefault(self.group_name(dataset_name), []).append(dataset_name)
+        group_inputs = {group: [self.filehandler.in_dir + dataset_name + ".tsv"
+                                for dataset_name in group_names]
+                        for group, group_names in groups.items()}
+
+        datasets = {}
+        for group, group_names in groups.items():
+            if not force and all(self.manifest.is_up_to_date(
+                    self.manifest_key(dataset_name), group_inputs[group], stages,
+                    self.filehandler.dataset_paths(self.output_name(dataset_name)))
+                    for dataset_name in group_names):
+                print("---Datasets " + ", ".join(group_names) + " are up to date---")
+                continue
+            for dataset_name in group_names:
+                datasets[dataset_name] = [tuple(line) for line in
+                                          self.filehandler.read_from_csv(dataset_name + ".tsv")]
+        if not datasets:
+            return
+
+        unique_lines = list(dict.fromkeys(
+            line for lines in datasets.values() for line in lines))
+        print("---Cleaning " + str(len(unique_lines)) + " unique of " +
+              str(sum(len(lines) for lines in datasets.values())) + " lines---")
+        if workers > 1:
+            chunks = [unique_lines[i:i + chunk_size]
+                      for i in range(0, len(unique_lines), chunk_size)]
+            cleaned = []
+            with Pool(workers, initializer=_init_worker, initargs=(self.cleaner,)) as pool:
+                for cleaned_chunk in tqdm(pool.imap(_clean_chunk, chunks), total=len(chunks)):
+                    cleaned.extend(cleaned_chunk)
+        else:
+            cleaned = [self.clean_data(text, logic)
+                       for text, logic in tqdm(unique_lines)]
+        cleaned_lines = dict(zip(unique_lines, cleaned))
+
+        for group, group_names in groups.items():
+            if group_names[0] not in datasets:
+                continue
+            vocabs = None
+            if self.filehandler.write_tokens:
+                group_lines = [cleaned_lines[line] for dataset_name in group_names
+                               for line in datasets[dataset_name]]
+                vocabs = self.build_vocabs([text for text, _ in group_lines],
+                                           [logic for _, logic in group_lines])
+            for dataset_name in group_names:
+                lines = datasets[dataset_name]
+                self.filehandler.write_dataset(
+                    [cleaned_lines[line][0] for line in lines],
+                    [cleaned_lines[line][1] for line in lines],
+                    self.output_name(dataset_name), vocabs=vocabs)
+                self.manifest.record(self.manifest_key(dataset_name),
+                                     group_inputs[group],
+                                     stages,
+                                     self.filehandler.dataset_paths(self.output_name(dataset_name)))
+        self.manifest.save()
+
+
+# state of each worker in the process pool of generate_dket_datasets
+_worker_cleaner = None
+
+
+def _init_worker(cleaner: DketCleaner) -> None:
+    global _worker_cleaner
+    _worker_cleaner = cleaner
+
 
-        self.filehandler.write_dataset_to_csv(
-            text_data, logic_data, "dket_" + dataset_name)
+def _clean_chunk(chunk: list[Tuple[str, str]]) -> list[Tuple[str, str]]:
+    return [_worker_cleaner.clean_data(text, logic) for text, logic in chunk]
 
 
 if __name__ == "__main__":
-    dg = DketGenerator()
     datasets = ["2k", "5k", "10k", "20k"]  # all dataset sizes
-    for d in datasets:
-        dg.read_data_write_dataset("train_" + d)
-        dg.read_data_write_dataset("validation_" + d)
+    for pointer_targets in [False, True]:
+        dg = DketGenerator(pointer_targets=pointer_targets)
+        dg.generate_dket_datasets(
+            [split + "_" + d for d in datasets for split in ["train", "validation"]],
+            workers=os.cpu_count())
@@ -1,11 +1,31 @@
 import os
 import csv
+import json
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from tagged_corpus import TaggedCorpus
+# the vocabularies of the datasets are those the models are trained with,
+# from the root of the repository
+from vocabulary import Vocabulary
+
+
+class AtomicRecord(NamedTuple):
+    """
+    An event of the Atomic knowledge base with the inferences
+    of every relation dimension, and the split it belongs to.
+    """
+    event: str
+    inferences: dict[str, list[str]]
+    split: str
 
 
 class FileHandler:
-    def __init__(self, in_dir='./in/', out_dir='./out/') -> None:
+    def __init__(self, in_dir='./in/', out_dir='./out/', write_tokens=False) -> None:
         self.in_dir = in_dir
         self.out_dir = out_dir
+        self.write_tokens = write_tokens
 
     def read_from_csv(self, file_path: str) -> list[str]:
         """
@@ -19,6 +39,22 @@ class FileHandler:
                 data.append(line)
         return data
 
+    def iter_atomic_csv(self, file_path: str) -> Iterator[AtomicRecord]:
+        """
+        Reads an Atomic csv file from input directory lazily,
+        decoding the inferences of every relation from their
+        JSON lists, yielding one record per line.
+        """
+        with open(self.in_dir + file_path, newline='') as file:
+            reader = csv.DictReader(file)
+            relations = [f for f in reader.fieldnames
+                         if f not in ["event", "prefix", "split"]]
+            for line in reader:
+                yield AtomicRecord(
+                    line["event"],
+                    {r: json.loads(line[r]) for r in relations},
+                    line["split"])
+
     def write_list_to_csv(self, data: list[str], name: str) -> None:
         data_path = self.out_dir + name + '.csv'
         os.makedirs(os.path.dirname(data_path), exist_ok="True", mode=0o755)
@@ -26,14 +62,94 @@ class FileHandler:
             writer = csv.writer(data_file, delimiter='\n')
             writer.writerow(data)
 
-    def write_dataset_to_csv(self, contexts: list[str], targets: list[str], name: str) -> None:
+    def write_dataset_to_csv(self, contexts: list[str], targets: list[str], name: str, append=False) -> None:
         """
         Writes dataset into csv file where contexts
         and targets are seperated by tabs.
+        If append is set the rows are added to the end of the file.
         """
         data_path = self.out_dir + name + '.csv'
         os.makedirs(os.path.dirname(data_path), exist_ok="True", mode=0o755)
-        with open(data_path, 'w', newline='') as data_file:
+        with open(data_path, 'a' if append else 'w', newline='') as data_file:
             writer = csv.writer(data_file, delimiter='\t')
             for c, t in zip(contexts, targets):
                 writer.writerow([c, t])
+
+    def build_vocab(self, sentences: list[str]) -> Vocabulary:
+        """
+        Returns the vocabulary of the sentences, built by
+        Vocabulary.build as the notebooks build theirs.
+        """
+        return Vocabulary.build(sentences)
+
+    def write_dataset_to_tokens(self, contexts: list[str], targets: list[str], name: str,
+                                vocabs: Optional[tuple[Vocabulary, Vocabulary]] = None
+                                ) -> tuple[Vocabulary, Vocabulary]:
+        """
+        Writes dataset as token ids into the directory name_tokens,
+        for loading with numpy.memmap without any parsing. For the
+        contexts (src) and targets (trg) it contains the vocabulary
+        with one token per line, a flat array of the ids of every
+        sentence wrapped in <SOS> and <EOS>, and the offsets where
+        each sentence starts, with the total length at the end.
+        The splits of a dataset must share their vocabularies, so the
+        ids of one mean the same in the other. Pass the (src, trg)
+        vocabularies returned for the first split when writing the
+        others, otherwise they are built from these sentences.
+        """
+        if vocabs is None:
+            vocabs = (self.build_vocab(contexts), self.build_vocab(targets))
+        data_dir = self.out_dir + name + "_tokens/"
+        os.makedirs(data_dir, exist_ok=True, mode=0o755)
+        for side, sentences, vocab in [("src", contexts, vocabs[0]), ("trg", targets, vocabs[1])]:
+            lengths = np.array([len(sentence.split()) + 2 for sentence in sentences],
+                               dtype=np.int64)
+            # the rows of the padded ids, without their padding, one after another
+            ids = vocab.encode(sentences)
+            ids = ids[np.arange(ids.shape[1]) < lengths[:, None]]
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+            np.save(data_dir + side + "_ids.npy", ids.astype(np.uint32))
+            np.save(data_dir + side + "_offsets.npy", offsets)
+            vocab.save(data_dir + side + "_vocab.txt")
+        return vocabs
+
+    def dataset_paths(self, name: str) -> list[str]:
+        """
+        Returns the paths of all files written by write_dataset.
+        """
+        paths = [self.out_dir + name + '.csv']
+        if self.write_tokens:
+            data_dir = self.out_dir + name + "_tokens/"
+            paths += [data_dir + side + suffix for side in ["src", "trg"]
+                      for suffix in ["_ids.npy", "_offsets.npy", "_vocab.txt"]]
+        return paths
+
+    def write_dataset(self, contexts: list[str], targets: list[str], name: str,
+                      vocabs: Optional[tuple[Vocabulary, Vocabulary]] = None
+                      ) -> Optional[tuple[Vocabulary, Vocabulary]]:
+        """
+        Writes dataset into csv file, and as token ids
+        as well if the file handler is set to write tokens,
+        returning the vocabularies of the ids to share with
+        the other splits (see write_dataset_to_tokens).
+        """
+        self.write_dataset_to_csv(contexts, targets, name)
+        if self.write_tokens:
+            return self.write_dataset_to_tokens(contexts, targets, name, vocabs)
+        return None
+
+    def write_tagged_corpus(self, corpus: TaggedCorpus, name: str) -> None:
+        """
+        Writes a tagged corpus in its binary format
+        into the output directory.
+        """
+        data_path = self.out_dir + name + '.bin'
+        os.makedirs(os.path.dirname(data_path), exist_ok="True", mode=0o755)
+        corpus.save(data_path)
+
+    def read_tagged_corpus(self, file_path: str) -> TaggedCorpus:
+        """
+        Reads a tagged corpus in its binary format
+        from the input directory.
+        """
+        return TaggedCorpus.load(self.in_dir + file_path)
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+from types import ModuleType
+
+
+def file_hash(path: str) -> str:
+    """
+    Returns the sha256 hash of the content of a file.
+    """
+    file_sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            file_sha.update(block)
+    return file_sha.hexdigest()
+
+
+def stage_versions(stages: dict[str, ModuleType]) -> dict[str, str]:
+    """
+    Versions every generation stage by the hash of the source
+    file of its module, so any change to the code of a stage
+    makes the outputs depending on it out of date.
+    """
+    return {name: file_hash(module.__file__) for name, module in stages.items()}
+
+
+class Manifest:
+    """
+    JSON file recording, for every generated group of outputs,
+    the hashes of its input files, the versions of the stages
+    that made it and the hashes of the output files. Used to only
+    regenerate outputs whose inputs or stages have changed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.entries = json.load(file)["entries"]
+
+    def is_up_to_date(self, key: str, inputs: list[str],
+                      stages: dict[str, str], outputs: list[str]) -> bool:
+        """
+        Checks if the outputs recorded under key were made from the
+        same inputs and stage versions, and have not been changed since.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry["stages"] != stages:
+            return False
+        if sorted(entry["inputs"]) != sorted(inputs) or sorted(entry["outputs"]) != sorted(outputs):
+            return False
+        for path, recorded_hash in list(entry["inputs"].items()) + list(entry["outputs"].items()):
+            if not os.path.exists(path) or file_hash(path) != recorded_hash:
+                return False
+        return True
+
+    def record(self, key: str, inputs: list[str],
+               stages: dict[str, str], outputs: list[str]) -> None:
+        self.entries[key] = {
+            "inputs": {path: file_hash(path) for path in inputs},
+            "stages": stages,
+            "outputs": {path: file_hash(path) for path in outputs},
+        }
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".",
+                    exist_ok=True, mode=0o755)
+        with open(self.path, "w") as file:
+            json.dump({"entries": self.entries}, file, indent=2, sort_keys=True)
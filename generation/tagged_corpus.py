@@ -0,0 +1,279 @@
+import enum
+import struct
+import sys
+from array import array
+from typing import Iterable, Iterator, Union
+
+
+class Relation(enum.IntEnum):
+    """
+    The nine relation dimensions of the Atomic knowledge base.
+    """
+    oEffect = 0
+    oReact = 1
+    oWant = 2
+    xAttr = 3
+    xEffect = 4
+    xIntent = 5
+    xNeed = 6
+    xReact = 7
+    xWant = 8
+
+
+# (word, tag) tuples of a POS-tagged sentence, as given by the tagger
+TaggedTokens = tuple[tuple[str, str], ...]
+# a POS-tagged if-then relation of an event, dimension and inference
+TaggedRelation = tuple[TaggedTokens, Relation, TaggedTokens]
+
+
+class TokenTable:
+    """
+    Interns the words and POS-tags of a tagged corpus,
+    so sentences can store them as integer ids.
+    """
+
+    def __init__(self) -> None:
+        self.words = []
+        self.word_ids = {}
+        self.tags = []
+        self.tag_ids = {}
+
+    def word_id(self, word: str) -> int:
+        if word not in self.word_ids:
+            self.word_ids[word] = len(self.words)
+            self.words.append(word)
+        return self.word_ids[word]
+
+    def tag_id(self, tag: str) -> int:
+        if tag not in self.tag_ids:
+            self.tag_ids[tag] = len(self.tags)
+            self.tags.append(tag)
+        return self.tag_ids[tag]
+
+
+class TaggedSentence:
+    """
+    A POS-tagged sentence of a tagged corpus, viewing its
+    word and tag ids in the flat arrays of the corpus.
+    Sentences are compared and hashed on their word and tag ids,
+    so only sentences sharing a token table can be equal,
+    whichever corpus and index they are stored at.
+    """
+    __slots__ = ("corpus", "index")
+
+    def __init__(self, corpus: "TaggedCorpus", index: int) -> None:
+        self.corpus = corpus
+        self.index = index
+
+    def __len__(self) -> int:
+        offsets = self.corpus.offsets
+        return offsets[self.index + 1] - offsets[self.index]
+
+    def key(self) -> tuple:
+        start = self.corpus.offsets[self.index]
+        end = self.corpus.offsets[self.index + 1]
+        return (self.corpus.table,
+                self.corpus.word_ids[start:end].tobytes(),
+                self.corpus.tag_ids[start:end].tobytes())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, TaggedSentence):
+            return NotImplemented
+        if self.corpus is other.corpus and self.index == other.index:
+            return True
+        return self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def __str__(self) -> str:
+        return " ".join(word + "/" + tag for word, tag in self.tuples())
+
+    def words(self) -> list[str]:
+        start = self.corpus.offsets[self.index]
+        end = self.corpus.offsets[self.index + 1]
+        words = self.corpus.table.words
+        return [words[i] for i in self.corpus.word_ids[start:end]]
+
+    def tuples(self) -> list[tuple[str, str]]:
+        """
+        Returns the sentence as (word, tag) tuples,
+        the same as they were added to the corpus.
+        """
+        start = self.corpus.offsets[self.index]
+        end = self.corpus.offsets[self.index + 1]
+        words = self.corpus.table.words
+        tags = self.corpus.table.tags
+        return [(words[w], tags[t]) for w, t in
+                zip(self.corpus.word_ids[start:end], self.corpus.tag_ids[start:end])]
+
+
+class TaggedIfThen:
+    """
+    A POS-tagged if-then relation of an event,
+    a relation dimension and an inference.
+    """
+    __slots__ = ("event", "relation", "inference")
+
+    def __init__(self, event: TaggedSentence, relation: Relation, inference: TaggedSentence) -> None:
+        self.event = event
+        self.relation = relation
+        self.inference = inference
+
+    def __str__(self) -> str:
+        """
+        Returns the relation in the format
+        "word/TAG word/TAG,relation_dimension,word/TAG".
+        """
+        return ",".join([str(self.event), self.relation.name, str(self.inference)])
+
+    def untagged(self) -> str:
+        """
+        Returns the lowercased words of the event,
+        relation dimension and inference without tags.
+        """
+        words = self.event.words() + \
+            [self.relation.name] + self.inference.words()
+        return " ".join(words).lower()
+
+
+# Relation members by value, faster than calling Relation(value)
+RELATIONS = list(Relation)
+
+
+class TaggedCorpus:
+    """
+    Sequence of POS-tagged if-then relations. Every unique sentence
+    is parsed once and stored as word and tag ids in flat arrays,
+    and every relation as the ids of its sentences and dimension.
+    Can be saved to and loaded from a compact binary file.
+    """
+    MAGIC = b"ATIC"
+    VERSION = 1
+
+    def __init__(self, table: TokenTable = None) -> None:
+        self.table = table if table is not None else TokenTable()
+        # tokens of all sentences, sentence i is offsets[i]:offsets[i + 1]
+        self.offsets = array("I", [0])
+        self.word_ids = array("I")
+        self.tag_ids = array("H")
+        # sentence ids and relation dimension of every if-then relation
+        self.events = array("I")
+        self.relations = array("B")
+        self.inferences = array("I")
+        # tagged sentences to their sentence id, used while adding
+        self.sentence_ids = {}
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def __iter__(self) -> Iterator[TaggedIfThen]:
+        for i in range(len(self.events)):
+            yield self[i]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[TaggedIfThen, list[TaggedIfThen]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return TaggedIfThen(TaggedSentence(self, self.events[index]),
+                            RELATIONS[self.relations[index]],
+                            TaggedSentence(self, self.inferences[index]))
+
+    def n_sentences(self) -> int:
+        return len(self.offsets) - 1
+
+    def sentence_id(self, tagged_sentence: TaggedTokens) -> int:
+        """
+        Returns the id of a sentence of (word, tag) tuples,
+        adding it if it is new. Every word must have a tag.
+        """
+        sentence_id = self.sentence_ids.get(tagged_sentence)
+        if sentence_id is None:
+            for word, tag in tagged_sentence:
+                if not tag:
+                    raise ValueError("Untagged word " + repr(word) + " in " +
+                                     repr(tagged_sentence))
+                self.word_ids.append(self.table.word_id(word))
+                self.tag_ids.append(self.table.tag_id(tag))
+            sentence_id = self.sentence_ids[tagged_sentence] = self.n_sentences()
+            self.offsets.append(len(self.word_ids))
+        return sentence_id
+
+    def add(self, event: TaggedTokens, relation: Relation, inference: TaggedTokens) -> None:
+        """
+        Adds an if-then relation of a tagged event, relation dimension
+        and tagged inference, interning the ids of new sentences.
+        """
+        self.events.append(self.sentence_id(event))
+        self.relations.append(relation)
+        self.inferences.append(self.sentence_id(inference))
+
+    def extend(self, tagged_relations: Iterable[TaggedRelation]) -> None:
+        for event, relation, inference in tagged_relations:
+            self.add(event, relation, inference)
+
+    def release_sentence_ids(self) -> None:
+        """
+        Frees the lookup from tagged sentences to ids once
+        no more relations are added. Adding afterwards
+        still works, but stores new copies of known sentences.
+        """
+        self.sentence_ids = {}
+
+    def save(self, path: str) -> None:
+        """
+        Writes the corpus to a little-endian binary file
+        with the token tables followed by the arrays.
+        """
+        with open(path, "wb") as file:
+            file.write(self.MAGIC + struct.pack("<I", self.VERSION))
+            for tokens in [self.table.words, self.table.tags]:
+                blob = "\n".join(tokens).encode("utf-8")
+                file.write(struct.pack("<II", len(tokens), len(blob)))
+                file.write(blob)
+            file.write(struct.pack("<II", self.n_sentences(), len(self.word_ids)))
+            for a in [self.offsets, self.word_ids, self.tag_ids]:
+                _write_array(file, a)
+            file.write(struct.pack("<I", len(self)))
+            for a in [self.events, self.relations, self.inferences]:
+                _write_array(file, a)
+
+    @classmethod
+    def load(cls, path: str) -> "TaggedCorpus":
+        corpus = cls()
+        with open(path, "rb") as file:
+            if file.read(4) != cls.MAGIC:
+                raise ValueError(path + " is not a tagged corpus file")
+            version, = struct.unpack("<I", file.read(4))
+            if version != cls.VERSION:
+                raise ValueError(
+                    "Unsupported tagged corpus version " + str(version))
+            for tokens, ids in [(corpus.table.words, corpus.table.word_ids),
+                                (corpus.table.tags, corpus.table.tag_ids)]:
+                count, size = struct.unpack("<II", file.read(8))
+                if count:
+                    tokens.extend(file.read(size).decode("utf-8").split("\n"))
+                ids.update((t, i) for i, t in enumerate(tokens))
+            n_sentences, n_tokens = struct.unpack("<II", file.read(8))
+            corpus.offsets = _read_array(file, "I", n_sentences + 1)
+            corpus.word_ids = _read_array(file, "I", n_tokens)
+            corpus.tag_ids = _read_array(file, "H", n_tokens)
+            n_if_then, = struct.unpack("<I", file.read(4))
+            corpus.events = _read_array(file, "I", n_if_then)
+            corpus.relations = _read_array(file, "B", n_if_then)
+            corpus.inferences = _read_array(file, "I", n_if_then)
+        return corpus
+
+
+def _write_array(file, a: array) -> None:
+    if sys.byteorder == "big":
+        a = array(a.typecode, a)
+        a.byteswap()
+    a.tofile(file)
+
+
+def _read_array(file, typecode: str, length: int) -> array:
+    a = array(typecode)
+    a.fromfile(file, length)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
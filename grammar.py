@@ -0,0 +1,146 @@
+import re
+
+import torch
+
+from vocabulary import EOS_IDX, SPECIALS, Vocabulary
+
+# tuples of variables closing an atom, as "(x)" or "(x,z,y)"
+VARIABLE_TUPLE = re.compile(r"^\([a-z](,[a-z])*\)$")
+STRUCTURE = ["A", "E", "(", ")", "->", "&"]
+
+# the grammar of the formulas of AtomicLogifier.atomic_if_then_to_logic:
+#   with quantifiers     A vars ( ( atoms ) -> head )
+#   without quantifiers  atoms -> atoms
+# where head is either atoms or E vars ( atoms ),
+# atoms are atoms conjuncted by &, and an atom is words followed by a tuple
+# of variables. Every state lists the token classes it accepts and the
+# state each leads to, "word" being any token outside the other classes.
+QUANTIFIED_GRAMMAR = {
+    "start": {"A": "universal"},
+    "universal": {"variable": "universal_vars"},
+    "universal_vars": {"variable": "universal_vars", "(": "open_body"},
+    "open_body": {"(": "body"},
+    "body": {"word": "body_words"},
+    "body_words": {"word": "body_words", "tuple": "body_atom"},
+    "body_atom": {"&": "body", ")": "implies"},
+    "implies": {"->": "head"},
+    "head": {"E": "existential", "word": "head_words"},
+    "head_words": {"word": "head_words", "tuple": "head_atom"},
+    "head_atom": {"&": "head_next", ")": "end"},
+    "head_next": {"word": "head_words"},
+    "existential": {"variable": "existential_vars"},
+    "existential_vars": {"variable": "existential_vars", "(": "existential_head"},
+    "existential_head": {"word": "existential_words"},
+    "existential_words": {"word": "existential_words", "tuple": "existential_atom"},
+    "existential_atom": {"&": "existential_head", ")": "close"},
+    "close": {")": "end"},
+    "end": {"<EOS>": "done"},
+    "done": {"<PAD>": "done"},
+}
+
+UNQUANTIFIED_GRAMMAR = {
+    "start": {"word": "body_words"},
+    "body_words": {"word": "body_words", "tuple": "body_atom"},
+    "body_atom": {"&": "start", "->": "head"},
+    "head": {"word": "head_words"},
+    "head_words": {"word": "head_words", "tuple": "head_atom"},
+    "head_atom": {"&": "head", "<EOS>": "done"},
+    "done": {"<PAD>": "done"},
+}
+
+
+def token_classes(token: str) -> list[str]:
+    """
+    Returns the classes of a target token in the grammars,
+    single letters being both variables and words.
+    """
+    if token in STRUCTURE or token in SPECIALS:
+        return [token]
+    if VARIABLE_TUPLE.match(token):
+        return ["tuple"]
+    if len(token) == 1 and "a" <= token <= "z":
+        return ["variable", "word"]
+    return ["word"]
+
+
+class FormulaAutomaton:
+    """
+    The grammar of the Atomic formulas compiled over a target vocabulary
+    into a table of the allowed tokens of every state, and a table of the
+    next state for every state and token. Constrained decoding keeps one
+    state per sentence, masks the logits of the tokens its state does
+    not allow with a single masked_fill, and advances the states with a
+    single lookup once the tokens are chosen.
+    """
+
+    def __init__(self, vocab: Vocabulary, quantifiers=True) -> None:
+        grammar = QUANTIFIED_GRAMMAR if quantifiers else UNQUANTIFIED_GRAMMAR
+        self.states = list(grammar)
+        state_ids = {state: i for i, state in enumerate(self.states)}
+        self.start = state_ids["start"]
+        self.done = state_ids["done"]
+        # next state of every state and token, -1 where not allowed
+        self.transitions = torch.full((len(self.states), len(vocab)), -1, dtype=torch.long)
+        for token_id, token in enumerate(vocab.get_itos()):
+            for token_class in token_classes(token):
+                for state, edges in grammar.items():
+                    if token_class in edges:
+                        self.transitions[state_ids[state], token_id] = state_ids[edges[token_class]]
+        self.allowed = self.transitions >= 0
+
+    @classmethod
+    def for_vocabulary(cls, vocab: Vocabulary) -> "FormulaAutomaton":
+        """
+        Compiles the grammar with quantifiers if the vocabulary
+        has them, as made from the datasets with quantifiers.
+        """
+        return cls(vocab, quantifiers="A" in vocab)
+
+    def to(self, device) -> "FormulaAutomaton":
+        self.transitions = self.transitions.to(device)
+        self.allowed = self.allowed.to(device)
+        return self
+
+    def initial_states(self, n: int, device=None) -> torch.Tensor:
+        return torch.full((n,), self.start, dtype=torch.long, device=device)
+
+    def mask(self, logits: torch.Tensor, states: torch.Tensor) -> torch.Tensor:
+        """
+        Masks the logits (N, vocab_size) of the tokens
+        the states of the sentences do not allow.
+        """
+        return logits.masked_fill(~self.allowed[states], float("-inf"))
+
+    def advance(self, states: torch.Tensor, tokens: torch.Tensor) -> torch.Tensor:
+        """
+        Returns the states after the chosen tokens, -1 for a token
+        the state does not allow.
+        """
+        return self.transitions[states, tokens]
+
+    def accepts(self, tokens: list[str], vocab: Vocabulary) -> bool:
+        """
+        Checks if a formula, without <SOS> and with or
+        without <EOS>, is well-formed.
+        """
+        state = self.start
+        for token in tokens:
+            if token not in vocab:
+                return False
+            state = int(self.transitions[state, vocab[token]])
+            if state < 0:
+                return False
+        return state == self.done or bool(self.allowed[state, EOS_IDX])
+
+    def valid_prefix(self, ids: torch.Tensor) -> torch.Tensor:
+        """
+        Checks for every row of ids (N, T), without <SOS> and padded
+        after <EOS>, if it is a prefix of a well-formed formula, so
+        that malformed outputs can be rejected as early as possible.
+        """
+        states = self.initial_states(ids.shape[0], ids.device)
+        valid = torch.ones(ids.shape[0], dtype=torch.bool, device=ids.device)
+        for step in range(ids.shape[1]):
+            states = self.advance(states.clamp(min=0), ids[:, step])
+            valid &= states >= 0
+        return valid
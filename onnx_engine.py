@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy as np
+import onnxruntime
+
+from vocabulary import Vocabulary
+
+# the files of a model exported by onnx_export.export_onnx
+ENCODER_FILE = "encoder.onnx"
+DECODER_STEP_FILE = "decoder_step.onnx"
+CONFIG_FILE = "config.json"
+SRC_VOCAB_FILE = "src_vocab.txt"
+TRG_VOCAB_FILE = "trg_vocab.txt"
+# the outputs of the encoder indexed by the layer first, (layers, N, ...)
+LAYER_FIRST = ("cross_keys", "cross_values")
+
+
+class OnnxTranslator:
+    """
+    Greedy translation with the encoder and decoder step of a Transformer
+    or TorchTransformer.Transformer exported by onnx_export.export_onnx,
+    run by onnxruntime on the CPU without PyTorch, for serving. Decodes
+    the same as decoding.greedy_decode: the source is encoded once and
+    the sentences are decoded in lockstep, every sentence dropped from
+    the batch once it has produced <EOS>. The self-attention keys and
+    values of the tokens decoded so far are passed to every step and
+    returned by it with those of the new token.
+    """
+
+    def __init__(self, directory: str, n_threads: int = None) -> None:
+        options = onnxruntime.SessionOptions()
+        if n_threads is not None:
+            options.intra_op_num_threads = n_threads
+        providers = ["CPUExecutionProvider"]
+        self.encoder = onnxruntime.InferenceSession(
+            os.path.join(directory, ENCODER_FILE), options, providers=providers)
+        self.decoder_step = onnxruntime.InferenceSession(
+            os.path.join(directory, DECODER_STEP_FILE), options, providers=providers)
+        with open(os.path.join(directory, CONFIG_FILE)) as config_file:
+            self.config = json.load(config_file)
+        self.src_vocab = self.trg_vocab = None
+        if os.path.exists(os.path.join(directory, SRC_VOCAB_FILE)):
+            self.src_vocab = Vocabulary.load(os.path.join(directory, SRC_VOCAB_FILE))
+        if os.path.exists(os.path.join(directory, TRG_VOCAB_FILE)):
+            self.trg_vocab = Vocabulary.load(os.path.join(directory, TRG_VOCAB_FILE))
+        self.encoder_outputs = [o.name for o in self.encoder.get_outputs()]
+        self.step_inputs = [i.name for i in self.decoder_step.get_inputs()]
+
+    def encode(self, src: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Runs the encoder on the source ids (N, src_len), without <SOS>,
+        returning the inputs of the decoder step before the first token.
+        """
+        src = np.ascontiguousarray(src, dtype=np.int64)
+        state = dict(zip(self.encoder_outputs, self.encoder.run(None, {"src": src})))
+        state["src"] = src
+        shape = (self.config["n_layers"], src.shape[0], 0,
+                 self.config["heads"], self.config["head_dim"])
+        state["past_keys"] = np.zeros(shape, dtype=np.float32)
+        state["past_values"] = np.zeros(shape, dtype=np.float32)
+        return {name: state[name] for name in self.step_inputs if name != "tokens"}
+
+    def step(self, tokens: np.ndarray, state: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Returns the logits (N, trg_vocab_size) of the next tokens (N,),
+        which follow the tokens in state, and adds them to it.
+        """
+        logits, state["past_keys"], state["past_values"] = self.decoder_step.run(
+            None, dict(state, tokens=tokens[:, None]))
+        return logits
+
+    def select(self, state: dict[str, np.ndarray], keep: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Keeps only the sentences at keep in the state.
+        """
+        return {name: value[:, keep] if name in LAYER_FIRST or name.startswith("past_")
+                else value[keep] for name, value in state.items()}
+
+    def translate_ids(self, src: np.ndarray, max_len: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Greedily translates a batch of source ids (N, src_len), without
+        <SOS>, as the models are trained. Returns the ids (N, max_len),
+        without <SOS> and padded after <EOS>, and the length of every
+        translation including <EOS>, as Transformer.translate.
+        """
+        if max_len is None or max_len > self.config["max_length"]:
+            max_len = self.config["max_length"]
+        state = self.encode(src)
+        N = src.shape[0]
+        ids = np.full((N, max_len), self.config["trg_pad_idx"], dtype=np.int64)
+        lengths = np.full(N, max_len, dtype=np.int64)
+        # rows of the batch still being decoded
+        active = np.arange(N)
+        tokens = np.full(N, self.config["sos_idx"], dtype=np.int64)
+        for step in range(max_len):
+            tokens = self.step(tokens, state).argmax(axis=-1)
+            ids[active, step] = tokens
+            finished = tokens == self.config["eos_idx"]
+            if finished.any():
+                lengths[active[finished]] = step + 1
+                keep = np.flatnonzero(~finished)
+                if len(keep) == 0:
+                    break
+                active = active[keep]
+                tokens = tokens[keep]
+                state = self.select(state, keep)
+        return ids, lengths
+
+    def translate(self, sentences: list[str], max_len: int = None) -> list[list[str]]:
+        """
+        Translates sentences with the vocabularies exported with the
+        model, returning the tokens of every translation, without <EOS>.
+        """
+        if self.src_vocab is None or self.trg_vocab is None:
+            raise ValueError("The model was exported without its vocabularies")
+        src = self.src_vocab.encode(sentences, pad_idx=self.config["src_pad_idx"])[:, 1:]
+        ids, _ = self.translate_ids(src, max_len)
+        return self.trg_vocab.decode(ids, strip_sos=False)
+
@@ -0,0 +1,159 @@
+import json
+import os
+
+import torch
+import torch.nn as nn
+
+from onnx_engine import (CONFIG_FILE, DECODER_STEP_FILE, ENCODER_FILE, SRC_VOCAB_FILE,
+                         TRG_VOCAB_FILE)
+from vocabulary import EOS_IDX, SOS_IDX, Vocabulary
+
+
+class GraphCache:
+    """
+    Stands in for decoding.DecoderCache while exporting decode_step, with
+    the self-attention keys and values of the tokens before the new ones
+    given as inputs of the graph, (layers, N, length, heads, head_dim),
+    and those including the new tokens concatenated to them instead of
+    written into buffers allocated for the whole translation.
+    """
+
+    def __init__(self, memory, src, src_mask, cross_keys, cross_values,
+                 past_keys, past_values) -> None:
+        self.memory = memory
+        self.src = src
+        self.src_mask = src_mask
+        self.cross_keys = list(cross_keys.unbind(0))
+        self.cross_values = list(cross_values.unbind(0))
+        self.self_keys = list(past_keys.unbind(0))
+        self.self_values = list(past_values.unbind(0))
+
+    @property
+    def length(self):
+        # a dimension of the inputs, not a constant of the graph
+        return self.self_keys[0].shape[1]
+
+    def append(self, layer: int, keys: torch.Tensor,
+               values: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        self.self_keys[layer] = torch.cat([self.self_keys[layer], keys], dim=1)
+        self.self_values[layer] = torch.cat([self.self_values[layer], values], dim=1)
+        return self.self_keys[layer], self.self_values[layer]
+
+    def positions(self, N: int, n_tokens: int, device) -> torch.Tensor:
+        return torch.arange(self.length, self.length + n_tokens, device=device).expand(
+            N, n_tokens)
+
+    def advance(self, n_tokens: int) -> None:
+        pass
+
+    def step_mask(self, n_tokens: int, device) -> None:
+        # a single new token attends to every token
+        return None
+
+
+class EncoderGraph(nn.Module):
+    """
+    The encoder of a model as exported, returning the inputs of the
+    decoder step computed once per source by init_cache.
+    """
+
+    def __init__(self, model: nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, src):
+        cache = self.model.init_cache(src)
+        outputs = (cache.memory, torch.stack(cache.cross_keys), torch.stack(cache.cross_values))
+        if cache.src_mask is not None:
+            outputs += (cache.src_mask,)
+        return outputs
+
+
+class DecoderStepGraph(nn.Module):
+    """
+    A single step of decode_step as exported, returning the logits of
+    the next token and the self-attention keys and values including it.
+    """
+
+    def __init__(self, model: nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens, src, memory, cross_keys, cross_values, past_keys, past_values,
+                src_mask=None):
+        cache = GraphCache(memory, src, src_mask, cross_keys, cross_values,
+                           past_keys, past_values)
+        logits = self.model.decode_step(tokens, cache)[:, -1]
+        return logits, torch.stack(cache.self_keys), torch.stack(cache.self_values)
+
+
+def export_onnx(model: nn.Module, directory: str, src_vocab: Vocabulary = None,
+                trg_vocab: Vocabulary = None, opset_version: int = None) -> None:
+    """
+    Exports the encoder and a single decoder step of a trained Transformer
+    or TorchTransformer.Transformer on the CPU to ONNX, with dynamic
+    batch, source and decoded lengths, for onnx_engine.OnnxTranslator.
+    Writes encoder.onnx, decoder_step.onnx, config.json with the special
+    ids and sizes the engine needs, and the vocabularies if given, into
+    directory. Puts the model in eval().
+    """
+    model.eval()
+    os.makedirs(directory, exist_ok=True)
+    pad_idx = getattr(model, "pad_idx", getattr(model, "src_pad_idx", 0))
+    # examples with batch and lengths other than 1, which would be specialized
+    src = torch.full((2, 7), pad_idx + 3, dtype=torch.long)
+    src[1, 5:] = pad_idx
+    tokens = torch.full((2, 1), SOS_IDX, dtype=torch.long)
+    N = torch.export.Dim("batch")
+    src_len = torch.export.Dim("src_len")
+    past_len = torch.export.Dim("past_len")
+
+    # the fast path of nn.TransformerEncoderLayer is not exportable
+    fastpath = getattr(model, "fastpath", None)
+    if fastpath is not None:
+        model.fastpath = False
+    try:
+        with torch.no_grad():
+            cache = model.init_cache(src)
+            memory, cross_keys, cross_values, *src_mask = EncoderGraph(model)(src)
+        n_layers, _, _, heads, head_dim = cross_keys.shape
+        past_keys = torch.zeros((n_layers, 2, 3, heads, head_dim))
+        past_values = torch.zeros((n_layers, 2, 3, heads, head_dim))
+
+        encoder_outputs = ["memory", "cross_keys", "cross_values"] + ["src_mask"] * len(src_mask)
+        torch.onnx.export(EncoderGraph(model).eval(), (src,),
+                          os.path.join(directory, ENCODER_FILE),
+                          input_names=["src"], output_names=encoder_outputs,
+                          dynamic_shapes={"src": {0: N, 1: src_len}},
+                          opset_version=opset_version, dynamo=True, external_data=False,
+                          verbose=False)
+
+        inputs = (tokens, src, memory, cross_keys, cross_values, past_keys, past_values,
+                  *src_mask)
+        dynamic_shapes = {"tokens": {0: N}, "src": {0: N, 1: src_len},
+                          "memory": {0: N, 1: src_len},
+                          "cross_keys": {1: N, 2: src_len}, "cross_values": {1: N, 2: src_len},
+                          "past_keys": {1: N, 2: past_len}, "past_values": {1: N, 2: past_len}}
+        if src_mask:
+            dynamic_shapes["src_mask"] = {0: N, 3: src_len}
+        torch.onnx.export(DecoderStepGraph(model).eval(), inputs,
+                          os.path.join(directory, DECODER_STEP_FILE),
+                          input_names=list(dynamic_shapes),
+                          output_names=["logits", "present_keys", "present_values"],
+                          dynamic_shapes=dynamic_shapes,
+                          opset_version=opset_version, dynamo=True, external_data=False,
+                          verbose=False)
+    finally:
+        if fastpath is not None:
+            model.fastpath = fastpath
+
+    config = {"max_length": cache.capacity, "n_layers": n_layers, "heads": heads,
+              "head_dim": head_dim, "src_pad_idx": pad_idx,
+              "trg_pad_idx": getattr(model, "pad_idx", getattr(model, "trg_pad_idx", 0)),
+              "sos_idx": SOS_IDX, "eos_idx": EOS_IDX}
+    with open(os.path.join(directory, CONFIG_FILE), "w") as config_file:
+        json.dump(config, config_file, indent=2)
+    if src_vocab is not None:
+        src_vocab.save(os.path.join(directory, SRC_VOCAB_FILE))
+    if trg_vocab is not None:
+        trg_vocab.save(os.path.join(directory, TRG_VOCAB_FILE))
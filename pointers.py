@@ -0,0 +1,38 @@
+from typing import Iterable
+
+from vocabulary import Vocabulary
+
+# prefix of the targets in the DKET data referring to a source position
+LOC_PREFIX = "LOC#"
+
+
+def is_pointer(token: str) -> bool:
+    return token.startswith(LOC_PREFIX) and token[len(LOC_PREFIX):].isdigit()
+
+
+def pointer_vocabulary(sentences: Iterable[str], n_pointers: int) -> Vocabulary:
+    """
+    Builds a target vocabulary for formulas with positional references,
+    the specials and operators in the order of Vocabulary.build, followed
+    by LOC#0 to LOC#n_pointers-1, so that id n_operators + i is source
+    position i. Used with the n_pointers of TorchTransformer.Transformer.
+    """
+    operators = [token for token in Vocabulary.build(sentences).itos
+                 if not is_pointer(token)]
+    return Vocabulary(operators + [LOC_PREFIX + str(i) for i in range(n_pointers)])
+
+
+def detokenize(tokens: list[str], source: list[str]) -> list[str]:
+    """
+    Replaces the positional references LOC#i of a formula with the
+    word at position i of its source sentence, the same words
+    DketGenerator writes without pointer targets. References past
+    the end of the source are kept as they are.
+    """
+    words = []
+    for token in tokens:
+        if is_pointer(token) and int(token[len(LOC_PREFIX):]) < len(source):
+            words.append(source[int(token[len(LOC_PREFIX):])])
+        else:
+            words.append(token)
+    return words
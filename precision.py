@@ -0,0 +1,52 @@
+from contextlib import nullcontext
+from typing import Optional
+
+import torch
+
+
+def default_dtype(device) -> torch.dtype:
+    """
+    Returns bfloat16 on CPU and on GPUs supporting it, float16 otherwise.
+    """
+    device = torch.device(device)
+    if device.type == "cuda" and not torch.cuda.is_bf16_supported():
+        return torch.float16
+    return torch.bfloat16
+
+
+def autocast(device, dtype: Optional[torch.dtype] = None):
+    """
+    Returns the autocast context of the device to dtype, or a context
+    doing nothing if dtype is None, leaving any enclosing autocast on.
+    """
+    if dtype is None:
+        return nullcontext()
+    return torch.autocast(torch.device(device).type, dtype=dtype)
+
+
+class MixedPrecision:
+    """
+    Mixed precision training of both models. The forward pass and the loss
+    run under autocast to dtype, bfloat16 by default, while the weights and
+    the optimizer stay in float32. float16, whose range is too small for
+    the gradients, gets a GradScaler, which bfloat16 does not need.
+    With enabled=False, everything runs in float32 as before.
+    """
+
+    def __init__(self, device, dtype: Optional[torch.dtype] = None, enabled=True) -> None:
+        self.device = torch.device(device)
+        self.dtype = (dtype or default_dtype(self.device)) if enabled else None
+        self.scaler = torch.amp.GradScaler(self.device.type,
+                                           enabled=self.dtype == torch.float16)
+
+    def autocast(self):
+        return autocast(self.device, self.dtype)
+
+    def backward(self, loss: torch.Tensor, optimizer: torch.optim.Optimizer) -> None:
+        """
+        Back-propagates the loss and steps the optimizer, through the
+        GradScaler, which skips the steps whose gradients overflowed.
+        """
+        self.scaler.scale(loss).backward()
+        self.scaler.step(optimizer)
+        self.scaler.update()
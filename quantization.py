@@ -0,0 +1,60 @@
+import copy
+from typing import Union
+
+import torch
+import torch.nn as nn
+# deprecated in favour of torchao, which is not a dependency of the project
+from torch.ao.quantization import quantize_dynamic
+
+
+def quantize(model: nn.Module) -> nn.Module:
+    """
+    Returns a copy of a trained Transformer or TorchTransformer.Transformer
+    for inference on CPU, with the weights of its nn.Linear layers stored
+    as int8 and the activations quantized on the fly, leaving the model
+    itself unchanged. In Transformer.py these are the value, key and query
+    projections and fc_out of every SelfAttention, the feed forward layers
+    and fc_out. In TorchTransformer.py the projections of
+    nn.MultiheadAttention are not nn.Linear layers and stay in float32,
+    so only the feed forward layers and fc_out are quantized.
+    """
+    # the attention weights kept by Transformer.forward are left out,
+    # as they cannot be copied while attached to the autograd graph
+    memo = {}
+    if getattr(model, "last_attention", None) is not None:
+        memo[id(model.last_attention)] = None
+    model = copy.deepcopy(model, memo).to("cpu").eval()
+    for module in model.modules():
+        if hasattr(module, "device"):
+            module.device = "cpu"
+    if hasattr(model, "fastpath"):
+        # the weights of quantized layers are not float tensors
+        model.fastpath = False
+    return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def save_quantized(model: nn.Module, path: str) -> None:
+    torch.save(model.state_dict(), path)
+
+
+def load_quantized(model: nn.Module, path: str) -> nn.Module:
+    """
+    Loads a quantized state dict saved by save_quantized into a quantized
+    copy of model, an untrained model of the same configuration.
+    """
+    quantized = quantize(model)
+    quantized.load_state_dict(torch.load(path, map_location="cpu"))
+    return quantized
+
+
+def export_quantized(model: nn.Module, state_dict: Union[str, dict], path: str) -> nn.Module:
+    """
+    Loads a trained float32 state dict, or the path of one saved by the
+    notebooks, into model, and saves and returns its quantized copy.
+    """
+    if isinstance(state_dict, str):
+        state_dict = torch.load(state_dict, map_location="cpu")
+    model.load_state_dict(state_dict)
+    quantized = quantize(model)
+    save_quantized(quantized, path)
+    return quantized
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+import torch
+
+# the modules of the models are at the root of the repository, and the
+# generators import each other from generation/, as when run as scripts
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "generation"))
+from TorchTransformer import Transformer as TorchTransformer  # noqa: E402
+from Transformer import Transformer  # noqa: E402
+
+
+@pytest.fixture
+def src():
+    # sources as the models are trained on, without <SOS>
+    return torch.tensor([[5, 6, 4, 3, 9, 5, 2, 0], [8, 7, 3, 4, 5, 6, 7, 2]])
+
+
+@pytest.fixture
+def trg():
+    return torch.tensor([[1, 7, 4, 3, 5, 9, 2], [1, 5, 6, 2, 0, 0, 0]])
+
+
+@pytest.fixture
+def small_model():
+    """
+    Returns a function making a small model of either class on the CPU,
+    initialized from seed, with its arguments overriding the sizes below.
+    """
+    def make(model_class, src_vocab_size=10, trg_vocab_size=10, seed=0, **kwargs):
+        torch.manual_seed(seed)
+        if model_class is Transformer:
+            kwargs = {"embed_size": 64, "num_layers": 2, "device": "cpu", **kwargs}
+            return Transformer(src_vocab_size, trg_vocab_size, 0, 0, **kwargs)
+        kwargs = {"max_length": 20, "embed_size": 64, "n_heads": 4, "n_encoder_layers": 2,
+                  "n_decoder_layers": 2, "device": "cpu", **kwargs}
+        return TorchTransformer(src_vocab_size, trg_vocab_size, **kwargs)
+    return make
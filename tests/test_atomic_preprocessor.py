@@ -0,0 +1,72 @@
+import pytest
+
+from atomic_preprocessor import AtomicPreprocessor, POStagger
+from filehandler import AtomicRecord
+
+EVENTS = ["PersonX eats an apple", "PersonX gives PersonY a gift", "PersonX goes to the store",
+          "PersonX reads a book", "PersonX calls PersonY", "PersonX takes ___ home"]
+INFERENCES = ["happy", "to thank personx", "none", "person x is tired", "to buy food",
+              "gets a gift", "preson y smiles", "to go home, then sleep"]
+
+
+class StubTagger:
+    """
+    Tags words by their suffix, in place of the NLTK model.
+    """
+
+    def tag(self, words: list[str]) -> list[tuple[str, str]]:
+        return [(word, "VBG" if word.endswith("ing") else "NNS" if word.endswith("s")
+                 else "NN") for word in words]
+
+    def tag_sents(self, sentences: list[list[str]]) -> list[list[tuple[str, str]]]:
+        return [self.tag(words) for words in sentences]
+
+
+@pytest.fixture
+def preprocessor(monkeypatch):
+    # patched on the class, so the forked workers of the pool use it as well
+    monkeypatch.setattr(POStagger, "load_tagger", lambda self: StubTagger())
+    return AtomicPreprocessor()
+
+
+@pytest.fixture
+def records(preprocessor):
+    records = []
+    for i in range(40):
+        inferences = {relation: [INFERENCES[(i + j) % len(INFERENCES)]]
+                      for j, relation in enumerate(preprocessor.relations) if (i + j) % 3}
+        records.append(AtomicRecord(EVENTS[i % len(EVENTS)], inferences, "trn"))
+    return records
+
+
+def test_parallel_and_streaming_match_serial(preprocessor, records, tmp_path):
+    serial = preprocessor.preprocess_atomic(records)
+    parallel = preprocessor.preprocess_atomic(records, workers=2, chunk_size=7)
+    chunks = list(preprocessor.preprocess_atomic_stream(iter(records), buffer_size=25))
+    assert len(serial) > 50 and len(chunks) > 1
+    lines = [str(if_then) for if_then in serial]
+    assert [str(if_then) for if_then in parallel] == lines
+    assert [str(if_then) for chunk in chunks for if_then in chunk] == lines
+    # the corpora are written byte for byte the same
+    serial.save(tmp_path / "serial.bin")
+    parallel.save(tmp_path / "parallel.bin")
+    assert (tmp_path / "serial.bin").read_bytes() == (tmp_path / "parallel.bin").read_bytes()
+
+
+def test_tagger_version(monkeypatch, tmp_path):
+    import nltk
+    monkeypatch.setattr(nltk.data, "path", [str(tmp_path)])
+    tagger = POStagger()
+    # without the model the cached tags could come from any model
+    with pytest.raises(LookupError):
+        tagger.tagger_version()
+    with pytest.raises(LookupError):
+        POStagger(cache_path=str(tmp_path / "cache.sqlite"))
+
+    model_dir = tmp_path / "taggers" / "averaged_perceptron_tagger_eng"
+    model_dir.mkdir(parents=True)
+    (model_dir / "averaged_perceptron_tagger_eng.weights.json").write_text("{}")
+    version = tagger.tagger_version()
+    assert tagger.tagger_version() == version
+    (model_dir / "averaged_perceptron_tagger_eng.weights.json").write_text('{"NN": {}}')
+    assert tagger.tagger_version() != version
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import torch
+
+from batching import BucketBatchSampler, collate_batch, dataset_lengths, trim_padding
+
+
+@pytest.fixture
+def lengths():
+    rng = np.random.default_rng(0)
+    return rng.integers(3, 20, 200), rng.integers(3, 30, 200)
+
+
+@pytest.mark.parametrize("limits", [{"max_tokens": 64}, {"batch_size": 16},
+                                    {"max_tokens": 64, "batch_size": 4}])
+def test_bucket_batch_sampler(lengths, limits):
+    src_lengths, trg_lengths = lengths
+    longest = np.maximum(src_lengths, trg_lengths)
+    sampler = BucketBatchSampler(src_lengths, trg_lengths, seed=0, **limits)
+    epochs = [list(sampler) for _ in range(2)]
+    assert epochs[0] != epochs[1]
+    for batches in epochs:
+        assert len(batches) == len(sampler)
+        # every pair exactly once per epoch
+        assert sorted(i for batch in batches for i in batch) == list(range(len(longest)))
+        for batch in batches:
+            assert len(batch) * longest[batch].max() <= limits.get("max_tokens", np.inf)
+            assert len(batch) <= limits.get("batch_size", np.inf)
+
+    unshuffled = BucketBatchSampler(src_lengths, trg_lengths, shuffle=False, **limits)
+    assert list(unshuffled) == list(unshuffled)
+
+
+def test_bucket_batch_sampler_limits():
+    assert list(BucketBatchSampler([], [], max_tokens=8)) == []
+    assert len(BucketBatchSampler([], [], batch_size=8)) == 0
+    with pytest.raises(ValueError):
+        BucketBatchSampler([3], [4])
+    with pytest.raises(ValueError):
+        BucketBatchSampler([3, 9], [4, 2], max_tokens=8)
+
+
+def test_collate_batch():
+    batch = [(torch.tensor([1, 5, 2]), torch.tensor([1, 6, 7, 2])),
+             (torch.tensor([1, 5, 5, 5, 2]), torch.tensor([1, 2]))]
+    src, trg = collate_batch(batch)
+    assert src.tolist() == [[1, 5, 2, 0, 0], [1, 5, 5, 5, 2]]
+    assert trg.tolist() == [[1, 6, 7, 2], [1, 2, 0, 0]]
+
+    # rows padded already, as in the notebooks' datasets, are cut down
+    padded = [(torch.nn.functional.pad(s, (0, 5)), torch.nn.functional.pad(t, (0, 5)))
+              for s, t in batch]
+    assert [t.tolist() for t in collate_batch(padded)] == [src.tolist(), trg.tolist()]
+    src, trg = collate_batch(batch, length=6)
+    assert src.shape == trg.shape == (2, 6)
+    with pytest.raises(ValueError):
+        collate_batch(batch, length=4)
+
+
+def test_trim_padding():
+    ids = torch.tensor([[1, 4, 0, 0, 0], [1, 0, 4, 0, 0]])
+    assert trim_padding(ids).tolist() == [[1, 4, 0], [1, 0, 4]]
+    assert trim_padding(torch.zeros(2, 3, dtype=torch.long)).shape == (2, 0)
+
+
+def test_dataset_lengths():
+    src = torch.tensor([[1, 5, 2, 0], [1, 2, 0, 0], [1, 5, 5, 2]])
+    trg = torch.tensor([[1, 2, 0], [1, 6, 2], [1, 2, 0]])
+    dataset = torch.utils.data.TensorDataset(src, trg)
+    assert [x.tolist() for x in dataset_lengths(dataset)] == [[3, 2, 4], [2, 3, 2]]
+    subset = torch.utils.data.Subset(dataset, [2, 0])
+    assert [x.tolist() for x in dataset_lengths(subset)] == [[4, 3], [2, 2]]
@@ -0,0 +1,38 @@
+import pytest
+import torch
+
+from compiled import CompiledTransformer
+from TorchTransformer import Transformer as TorchTransformer
+from Transformer import Transformer
+
+SMALL = {
+    Transformer: {"embed_size": 32, "num_layers": 1, "heads": 4, "max_length": 16},
+    TorchTransformer: {"max_length": 16, "embed_size": 32, "n_encoder_layers": 1,
+                       "n_decoder_layers": 1, "mask_padding": True},
+}
+
+
+@pytest.mark.parametrize("model_class", [Transformer, TorchTransformer])
+def test_compiled_transformer(small_model, trg, model_class):
+    model = small_model(model_class, **SMALL[model_class]).eval()
+    src = torch.tensor([[5, 6, 4, 3, 9, 5, 2, 0, 0], [8, 7, 3, 4, 5, 6, 7, 2, 0]])
+    compiled = CompiledTransformer(model, buckets=(8, 16))
+    compiled.warm_up()
+    with torch.no_grad():
+        expected = model(src, trg)
+    assert compiled.bucket(9) == 16 and compiled.bucket(8) == 8
+    # no batch size or length within the buckets compiles again
+    with torch.compiler.set_stance("fail_on_recompile"):
+        assert torch.allclose(compiled(src, trg), expected, atol=1e-5)
+        assert torch.allclose(compiled(src[:, :6], trg[:, :3]),
+                              model(src[:, :6], trg[:, :3]).detach(), atol=1e-5)
+        for batch in [src, src[:1], src.repeat(3, 1)]:
+            ids, lengths = compiled.translate(batch)
+            expected_ids, expected_lengths = model.translate(batch)
+            assert torch.equal(ids, expected_ids)
+            assert torch.equal(lengths, expected_lengths)
+
+
+def test_padding_changes_the_outputs(small_model):
+    with pytest.raises(ValueError):
+        CompiledTransformer(small_model(TorchTransformer, mask_padding=False))
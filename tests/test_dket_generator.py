@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from dket_generator import DketCleaner, DketGenerator
+from vocabulary import PAD_IDX, Vocabulary
+
+LINES = [
+    ("the/DT cat/NN sleeps/VBZ <EOS>/<EOS>", "exists LOC#1 ( LOC#2 LOC#1 ) <EOS>"),
+    ("a/DT dog/NN barks/VBZ <EOS>/<EOS>", "exists LOC#1 ( LOC#2 LOC#1 ) <EOS>"),
+    ("every/DT bird/NN flies/VBZ <EOS>/<EOS>", "forall LOC#1 ( LOC#2 LOC#1 ) <EOS>"),
+]
+
+
+def test_clean_data():
+    text, logic = LINES[0]
+    assert DketCleaner().clean_data(text, logic) == ("the cat sleeps", "exists cat ( sleeps cat )")
+    assert DketCleaner(pointer_targets=True).clean_data(text, logic) == \
+        ("the cat sleeps", "exists LOC#1 ( LOC#2 LOC#1 )")
+
+
+@pytest.fixture
+def dket_data(tmp_path):
+    in_dir = tmp_path / "dket_data"
+    in_dir.mkdir()
+    # the splits share lines, which are cleaned once
+    splits = {"train_2k": LINES * 10,
+              "validation_2k": LINES[1:] * 3 + [("some/DT fish/NN swims/VBZ <EOS>/<EOS>",
+                                                 "exists LOC#1 ( LOC#2 LOC#1 ) <EOS>")]}
+    for name, lines in splits.items():
+        (in_dir / (name + ".tsv")).write_text(
+            "".join(text + "\t" + logic + "\n" for text, logic in lines))
+    return str(in_dir) + "/", list(splits)
+
+
+@pytest.mark.parametrize("pointer_targets", [False, True])
+def test_parallel_matches_serial(dket_data, tmp_path, pointer_targets):
+    in_dir, names = dket_data
+    outputs = []
+    for workers in [1, 2]:
+        out_dir = str(tmp_path / ("workers_" + str(workers))) + "/"
+        generator = DketGenerator(in_dir=in_dir, out_dir=out_dir, write_tokens=True,
+                                  pointer_targets=pointer_targets)
+        generator.generate_dket_datasets(names, workers=workers, chunk_size=1)
+        outputs.append([open(path, "rb").read() for name in names
+                        for path in generator.filehandler.dataset_paths(
+                            generator.output_name(name))])
+    assert outputs[0] == outputs[1]
+
+
+def read_tokens(out_dir, name):
+    data_dir = out_dir + name + "_tokens/"
+    vocabs = [Vocabulary.load(data_dir + side + "_vocab.txt") for side in ["src", "trg"]]
+    ids = [np.load(data_dir + side + "_ids.npy") for side in ["src", "trg"]]
+    return vocabs, ids
+
+
+@pytest.mark.parametrize("pointer_targets", [False, True])
+def test_splits_share_vocabularies(dket_data, tmp_path, pointer_targets):
+    in_dir, names = dket_data
+    out_dir = str(tmp_path / "datasets") + "/"
+    generator = DketGenerator(in_dir=in_dir, out_dir=out_dir, write_tokens=True,
+                              pointer_targets=pointer_targets, max_length=4)
+    generator.generate_dket_datasets(names)
+    (train_vocabs, train_ids), (val_vocabs, val_ids) = [
+        read_tokens(out_dir, generator.output_name(name)) for name in names]
+    assert [v.itos for v in train_vocabs] == [v.itos for v in val_vocabs]
+    # the vocabularies cover the words of the validation split only
+    assert "fish" in train_vocabs[0] and "fish" not in open(in_dir + "train_2k.tsv").read()
+    if pointer_targets:
+        assert train_vocabs[1].itos[-6:] == ["LOC#" + str(i) for i in range(6)]
+    with open(out_dir + generator.output_name("validation_2k") + ".csv") as file:
+        rows = [line.rstrip("\n").split("\t") for line in file]
+    for side, (vocab, ids) in enumerate(zip(val_vocabs, val_ids)):
+        encoded = vocab.encode([row[side] for row in rows])
+        assert ids.tolist() == encoded[encoded != PAD_IDX].tolist()
+
+    # a change to one split regenerates the others of its size
+    with open(in_dir + "validation_2k.tsv", "a") as file:
+        file.write("some/DT frog/NN jumps/VBZ <EOS>/<EOS>\texists LOC#1 ( LOC#2 LOC#1 ) <EOS>\n")
+    generator.generate_dket_datasets(names)
+    assert "frog" in read_tokens(out_dir, generator.output_name("train_2k"))[0][0]
+
+
+def test_stage_versions(tmp_path):
+    # the token ids are written with the vocabularies of the models
+    stages = DketGenerator(out_dir=str(tmp_path) + "/").stage_versions()
+    assert {"filehandler", "vocabulary", "pointers", "generator"} <= set(stages)
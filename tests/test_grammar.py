@@ -0,0 +1,45 @@
+import torch
+
+from grammar import FormulaAutomaton
+from TorchTransformer import Transformer
+from vocabulary import Vocabulary
+
+FORMULAS = [
+    "A x z ( ( person (x) & makes (x,z) & work (z) ) -> E a ( to enjoy what (x,a) & made (a) ) )",
+    "A x y z ( ( person (x) & person (y) & takes (x,z,y) & test (z) ) -> relieved (y) )",
+    "A x z ( ( person (x) & calls my boss (x,z) ) -> inquisitive (x) & a (x) )",
+]
+
+
+def test_formula_automaton():
+    malformed = [
+        "A x z ( ( person (x) ) -> )",
+        "A ( ( person (x) ) -> calm (x) )",
+        "A x z ( ( person (x) & & calm (x) ) -> calm (x) )",
+        "A x z ( ( person (x) ) -> calm (x)",
+    ]
+    vocab = Vocabulary.build(FORMULAS + malformed)
+    automaton = FormulaAutomaton.for_vocabulary(vocab)
+    assert all(automaton.accepts(f.split() + ["<EOS>"], vocab) for f in FORMULAS)
+    assert not any(automaton.accepts(f.split() + ["<EOS>"], vocab) for f in malformed)
+    ids = vocab.encode_tensor(FORMULAS + malformed)[:, 1:]
+    assert automaton.valid_prefix(ids).tolist() == [True] * 3 + [False] * 4
+
+    unquantified = ["person (x) & makes (x,z) & work (z) -> calm (x) & made (a)"]
+    vocab = Vocabulary.build(unquantified)
+    automaton = FormulaAutomaton.for_vocabulary(vocab)
+    assert automaton.accepts(unquantified[0].split(), vocab)
+    assert not automaton.accepts(unquantified[0].split()[:-1], vocab)
+
+
+def test_constrained_decoding(small_model):
+    vocab = Vocabulary.build(FORMULAS[:2])
+    automaton = FormulaAutomaton.for_vocabulary(vocab)
+    model = small_model(Transformer, trg_vocab_size=len(vocab), max_length=30, embed_size=32,
+                        n_encoder_layers=1, n_decoder_layers=1).eval()
+    src = torch.randint(3, 10, (4, 6))
+    for beam_size in [1, 3]:
+        ids, lengths = model.translate(src, beam_size=beam_size, constraint=automaton)
+        assert automaton.valid_prefix(ids).all()
+        for tokens, length in zip(vocab.decode(ids, include_eos=True), lengths):
+            assert length == 30 or automaton.accepts(tokens, vocab)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import torch
+
+from onnx_engine import OnnxTranslator
+from onnx_export import export_onnx
+from TorchTransformer import Transformer as TorchTransformer
+from Transformer import Transformer
+from vocabulary import SOS_IDX, Vocabulary
+
+SMALL = [
+    (Transformer, {"embed_size": 32, "heads": 4, "max_length": 16}),
+    (TorchTransformer, {"max_length": 16, "embed_size": 32}),
+    (TorchTransformer, {"max_length": 16, "embed_size": 32, "mask_padding": True,
+                        "n_pointers": 10}),
+]
+
+
+@pytest.mark.parametrize("model_class, kwargs", SMALL)
+def test_onnx_export(small_model, tmp_path, model_class, kwargs):
+    src_vocab = Vocabulary.build(["a b c d e f g"])
+    trg_vocab = Vocabulary.build(["x ( y ) z , w v"])
+    sentences = ["a b c d e f", "g a", "c c b a d e f g g"]
+    src = src_vocab.encode_tensor(sentences)[:, 1:]
+    model = small_model(model_class, len(src_vocab), len(trg_vocab), **kwargs)
+    export_onnx(model, tmp_path, src_vocab, trg_vocab)
+    translator = OnnxTranslator(tmp_path)
+    with torch.no_grad():
+        cache = model.init_cache(src)
+        state = translator.encode(src.numpy())
+        # the encoder of TorchTransformer with mask_padding leaves
+        # the padding out, as nested tensors, but the graph does not
+        not_padding = (src != 0).numpy()
+        assert np.allclose(state["memory"][not_padding],
+                           cache.memory.numpy()[not_padding], atol=1e-5)
+        tokens = torch.full((3,), SOS_IDX)
+        for _ in range(4):
+            expected = model.decode_step(tokens[:, None], cache)[:, -1]
+            logits = translator.step(tokens.numpy(), state)
+            assert np.allclose(logits, expected.numpy(), atol=1e-4)
+            tokens = expected.argmax(dim=-1)
+        expected_ids, expected_lengths = model.translate(src)
+    ids, lengths = translator.translate_ids(src.numpy())
+    assert np.array_equal(ids, expected_ids.numpy())
+    assert np.array_equal(lengths, expected_lengths.numpy())
+    assert translator.translate(sentences) == trg_vocab.decode(ids, strip_sos=False)
+    # exporting leaves the fast path of the model on
+    assert getattr(model, "fastpath", True)
@@ -0,0 +1,76 @@
+import pytest
+import torch
+
+from precision import MixedPrecision, autocast
+from TorchTransformer import Transformer as TorchTransformer
+from Transformer import SelfAttention, Transformer
+
+
+@pytest.mark.parametrize("model_class, kwargs", [
+    (Transformer, {}),
+    (Transformer, {"fused_attention": True}),
+    (TorchTransformer, {"max_length": 10, "mask_padding": True}),
+])
+def test_mixed_precision(small_model, src, trg, model_class, kwargs):
+    model = small_model(model_class, **kwargs).eval()
+    with torch.no_grad():
+        expected = model(src, trg)
+        with autocast("cpu", torch.bfloat16):
+            logits = model(src, trg)
+    assert logits.dtype == torch.bfloat16
+    assert torch.isfinite(logits).all()
+    assert torch.allclose(logits.float(), expected, atol=0.1)
+
+    ids, lengths = model.translate(src, 8)
+    mixed_ids, mixed_lengths = model.translate(src, 8, dtype=torch.bfloat16)
+    assert mixed_ids.shape == ids.shape and mixed_lengths.shape == lengths.shape
+    mixed_ids, _ = model.translate(src, 8, beam_size=3, dtype=torch.bfloat16)
+    assert mixed_ids.shape == ids.shape
+
+    model.train()
+    precision = MixedPrecision("cpu")
+    optimizer = torch.optim.Adam(model.parameters())
+    with precision.autocast():
+        logits = model(src, trg[:, :-1])
+        loss = torch.nn.functional.cross_entropy(
+            logits.reshape(-1, logits.shape[-1]).float(), trg[:, 1:].reshape(-1))
+    optimizer.zero_grad()
+    precision.backward(loss, optimizer)
+    assert all(p.dtype == torch.float32 and torch.isfinite(p).all()
+               for p in model.parameters())
+
+
+def test_masked_attention_in_float16():
+    # masked positions stay finite in float16, where -1e20 is -inf
+    torch.manual_seed(0)
+    attention = SelfAttention(64, 8).half()
+    x = torch.randn(2, 5, 64).half()
+    mask = torch.tensor([[1, 1, 1, 0, 0], [0, 0, 0, 0, 0]]).bool().view(2, 1, 1, 5)
+    out, _ = attention(x, x, x, mask)
+    assert out.dtype == torch.float16 and torch.isfinite(out).all()
+
+
+def test_encoder_without_fastpath(small_model, src):
+    model = small_model(TorchTransformer, mask_padding=True).eval()
+    with torch.no_grad():
+        expected = model.init_cache(src).memory
+        model.fastpath = False
+        memory = model.init_cache(src).memory
+    # the unrolled layers compute the padding as well, the fast path zeros it
+    not_padding = src != 0
+    assert torch.allclose(memory[not_padding], expected[not_padding], atol=1e-5)
+    # without turning off the fast path of every other model
+    assert torch.backends.mha.get_fastpath_enabled()
+
+
+def test_encoder_dropout_in_mixed_precision(small_model, src):
+    model = small_model(TorchTransformer, mask_padding=True).train()
+    # only the dropout of the attention weights can differ between runs
+    for module in model.modules():
+        if isinstance(module, torch.nn.Dropout):
+            module.p = 0.0
+    with torch.no_grad(), autocast("cpu", torch.bfloat16):
+        first, second = model.encode(src), model.encode(src)
+        assert not torch.equal(first, second)
+        model.eval()
+        assert torch.equal(model.encode(src), model.encode(src))
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+import torch
+import torch.nn as nn
+
+from quantization import export_quantized, load_quantized, quantize
+from TorchTransformer import Transformer as TorchTransformer
+from Transformer import Transformer
+
+
+@pytest.mark.parametrize("model_class", [Transformer, TorchTransformer])
+def test_quantize(small_model, src, trg, tmp_path, model_class):
+    kwargs = {"max_length": 10, "mask_padding": True} if model_class is TorchTransformer else {}
+    model = small_model(model_class, **kwargs)
+    model(src, trg)
+    model.eval()
+    quantized = quantize(model)
+    assert all(type(m) is not nn.Linear for m in quantized.modules())
+    assert any(type(m) is nn.Linear for m in model.modules())
+    with torch.no_grad():
+        expected = model(src, trg)
+        logits = quantized(src, trg)
+    assert torch.allclose(logits, expected, atol=0.1)
+    ids, lengths = quantized.translate(src, 8)
+    assert ids.shape == (2, 8)
+
+    torch.save(model.state_dict(), tmp_path / "model.pt")
+    path = tmp_path / "model_int8.pt"
+    export_quantized(small_model(model_class, **kwargs), str(tmp_path / "model.pt"), path)
+    loaded = load_quantized(small_model(model_class, **kwargs), path)
+    assert os.path.getsize(path) < os.path.getsize(tmp_path / "model.pt")
+    with torch.no_grad():
+        assert torch.equal(loaded(src, trg), logits)
@@ -0,0 +1,84 @@
+import struct
+
+import pytest
+
+from tagged_corpus import Relation, TaggedCorpus, TokenTable
+
+PERSON_EATS = (("PersonX", "IND"), ("eats", "VBZ"), ("food", "NN"))
+FULL = (("full", "JJ"),)
+HAPPY = (("happy", "JJ"),)
+
+
+@pytest.fixture
+def corpus():
+    corpus = TaggedCorpus()
+    corpus.add(PERSON_EATS, Relation.xAttr, FULL)
+    corpus.add(PERSON_EATS, Relation.xReact, HAPPY)
+    corpus.add(HAPPY, Relation.oEffect, FULL)
+    return corpus
+
+
+def test_interning(corpus):
+    # every unique sentence is stored once
+    assert corpus.n_sentences() == 3 and len(corpus) == 3
+    assert corpus[0].event.index == corpus[1].event.index
+    assert corpus[1].inference.index == corpus[2].event.index
+    assert str(corpus[0]) == "PersonX/IND eats/VBZ food/NN,xAttr,full/JJ"
+    assert corpus[1].untagged() == "personx eats food xreact happy"
+    with pytest.raises(ValueError):
+        corpus.add((("food", ""),), Relation.xNeed, FULL)
+
+
+def test_save_load(corpus, tmp_path):
+    corpus.save(str(tmp_path / "corpus.bin"))
+    loaded = TaggedCorpus.load(str(tmp_path / "corpus.bin"))
+    assert [str(if_then) for if_then in loaded] == [str(if_then) for if_then in corpus]
+    assert [if_then.relation for if_then in loaded] == [Relation.xAttr, Relation.xReact,
+                                                        Relation.oEffect]
+    assert loaded.n_sentences() == corpus.n_sentences()
+    loaded.save(str(tmp_path / "again.bin"))
+    assert (tmp_path / "again.bin").read_bytes() == (tmp_path / "corpus.bin").read_bytes()
+
+
+def test_save_load_empty(tmp_path):
+    TaggedCorpus().save(str(tmp_path / "empty.bin"))
+    loaded = TaggedCorpus.load(str(tmp_path / "empty.bin"))
+    assert len(loaded) == 0 and loaded.n_sentences() == 0
+    assert list(loaded) == [] and loaded.table.words == []
+
+
+def test_load_rejects_other_files(corpus, tmp_path):
+    corpus.save(str(tmp_path / "corpus.bin"))
+    data = (tmp_path / "corpus.bin").read_bytes()
+    (tmp_path / "magic.bin").write_bytes(b"NOPE" + data[4:])
+    with pytest.raises(ValueError, match="not a tagged corpus"):
+        TaggedCorpus.load(str(tmp_path / "magic.bin"))
+    version = struct.pack("<I", TaggedCorpus.VERSION + 1)
+    (tmp_path / "version.bin").write_bytes(data[:4] + version + data[8:])
+    with pytest.raises(ValueError, match="version"):
+        TaggedCorpus.load(str(tmp_path / "version.bin"))
+
+
+def test_equality(corpus, tmp_path):
+    # sentences are equal by content within a token table,
+    # whichever corpus and index they are stored at
+    assert corpus[0].event == corpus[1].event
+    assert corpus[1].inference == corpus[2].event
+    assert corpus[0].event != corpus[0].inference
+    shared = TaggedCorpus(corpus.table)
+    shared.add(FULL, Relation.xNeed, PERSON_EATS)
+    assert shared[0].event == corpus[0].inference
+    assert shared[0].inference == corpus[0].event
+    assert hash(shared[0].event) == hash(corpus[0].inference)
+    assert len({corpus[0].event, corpus[1].event, shared[0].inference}) == 1
+
+    # a corpus with its own table, as every loaded one, is never equal,
+    # even with the same sentences and ids
+    other = TaggedCorpus(TokenTable())
+    other.add(PERSON_EATS, Relation.xAttr, FULL)
+    assert other[0].event != corpus[0].event
+    corpus.save(str(tmp_path / "corpus.bin"))
+    loaded = TaggedCorpus.load(str(tmp_path / "corpus.bin"))
+    assert loaded[0].event != corpus[0].event
+    assert loaded[0].event.tuples() == corpus[0].event.tuples()
+    assert loaded[0].event == loaded[1].event
@@ -0,0 +1,74 @@
+import torch
+
+from decoding import beam_search
+from TorchTransformer import Transformer
+
+SRC = torch.tensor([[1, 5, 6, 4, 3, 9, 5, 2, 0], [1, 8, 7, 3, 4, 5, 6, 7, 2],
+                    [1, 4, 2, 0, 0, 0, 0, 0, 0]])
+
+
+def test_decode_step(small_model):
+    src = SRC[:2]
+    trg = torch.tensor([[1, 7, 4, 3, 5, 12, 2], [1, 5, 6, 2, 14, 7, 6]])
+    for n_pointers in [0, 9]:
+        model = small_model(Transformer, trg_vocab_size=10 + n_pointers,
+                            n_pointers=n_pointers).eval()
+        trg_ids = trg % (10 + n_pointers)
+        with torch.no_grad():
+            out = model(src, trg_ids)
+            cache = model.init_cache(src)
+            steps = [model.decode_step(trg_ids[:, :2], cache)]
+            steps += [model.decode_step(trg_ids[:, i:i + 1], cache)
+                      for i in range(2, trg.shape[1])]
+            assert torch.allclose(out, torch.cat(steps, dim=1), atol=1e-5)
+
+
+def test_translate(small_model):
+    model = small_model(Transformer, max_length=12).eval()
+    # make <EOS> likely, so that sentences finish at different steps
+    with torch.no_grad():
+        model.fc_out.bias[2] += 0.5
+    ids, lengths = model.translate(SRC, max_len=10)
+    with torch.no_grad():
+        for i in range(SRC.shape[0]):
+            # greedy decoding of one sentence with a full forward pass per token
+            trg = torch.tensor([[1]])
+            while trg.shape[1] <= 10 and trg[0, -1] != 2:
+                next_token = model(SRC[i:i + 1], trg)[0, -1].argmax()
+                trg = torch.cat([trg, next_token.view(1, 1)], dim=1)
+            assert lengths[i] == trg.shape[1] - 1
+            assert torch.equal(ids[i, :lengths[i]], trg[0, 1:])
+            assert (ids[i, lengths[i]:] == 0).all()
+    assert len(set(lengths.tolist())) > 1
+
+
+def test_beam_search(small_model):
+    model = small_model(Transformer, max_length=12).eval()
+    ids, lengths = model.translate(SRC, max_len=10)
+    beam_ids, beam_lengths = beam_search(model, SRC, 1, max_len=10)
+    assert torch.equal(ids, beam_ids) and torch.equal(lengths, beam_lengths)
+    # the beams of a batch are independent of the other sentences
+    ids, lengths = model.translate(SRC, max_len=10, beam_size=3)
+    for i in range(SRC.shape[0]):
+        sentence_ids, sentence_lengths = model.translate(SRC[i:i + 1], max_len=10, beam_size=3)
+        assert torch.equal(ids[i], sentence_ids[0]) and lengths[i] == sentence_lengths[0]
+
+
+def test_padding_masks(small_model):
+    model = small_model(Transformer, mask_padding=True).eval()
+    src = torch.tensor([[5, 6, 7, 8, 2, 0, 0], [5, 6, 9, 9, 9, 9, 2]])
+    trg = torch.tensor([[1, 4, 5, 0, 0], [1, 4, 6, 7, 8]])
+    out = model(src, trg)
+    # padding changes nothing for the positions that are not padding
+    unpadded = model(src[:1, :5], trg[:1, :3])
+    assert torch.allclose(out[0, :3], unpadded[0], atol=1e-5)
+    with torch.no_grad():
+        # the encoder runs on nested tensors without gradients
+        assert torch.allclose(model(src, trg)[0, :3], out[0, :3], atol=1e-5)
+        assert torch.allclose(model(src, trg)[1], out[1], atol=1e-5)
+        cache = model.init_cache(src)
+        steps = torch.cat([model.decode_step(trg[:, i:i + 1], cache)
+                           for i in range(trg.shape[1])], dim=1)
+        assert torch.allclose(steps[0, :3], out[0, :3], atol=1e-5)
+        assert torch.allclose(steps[1], out[1], atol=1e-5)
+
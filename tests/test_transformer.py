@@ -0,0 +1,81 @@
+import torch
+
+from decoding import beam_search
+from Transformer import SelfAttention, Transformer
+
+# sources with <SOS>, as Transformer.py was first trained on
+SRC = torch.tensor([[1, 5, 6, 4, 3, 9, 5, 2, 0], [1, 8, 7, 3, 4, 5, 6, 7, 2],
+                    [1, 4, 2, 0, 0, 0, 0, 0, 0]])
+TRG = torch.tensor([[1, 7, 4, 3, 5, 9, 2], [1, 5, 6, 2, 4, 7, 6]])
+
+
+def test_fused_attention():
+    torch.manual_seed(0)
+    attention = SelfAttention(64, 8, fused=True).eval()
+    x = torch.randn(3, 7, 64)
+    enc = torch.randn(3, 5, 64)
+    src_mask = torch.tensor([[1, 1, 1, 1, 1], [1, 1, 1, 0, 0], [1, 0, 0, 0, 0]]).bool()
+    src_mask = src_mask.unsqueeze(1).unsqueeze(2)
+    trg_mask = torch.tril(torch.ones((7, 7))).expand(3, 1, 7, 7)
+    for values, keys, mask in [(x, x, None), (x, x, trg_mask), (enc, enc, src_mask)]:
+        out, weights = attention(values, keys, x, mask, need_weights=True)
+        fused_out, fused_weights = attention(values, keys, x, mask, need_weights=False)
+        assert weights is not None and fused_weights is None
+        assert torch.allclose(out, fused_out, atol=1e-5)
+
+
+def test_fused_transformer(small_model):
+    model = small_model(Transformer).eval()
+    fused_model = small_model(Transformer, fused_attention=True).eval()
+    fused_model.load_state_dict(model.state_dict())
+    src = SRC[:2]
+    with torch.no_grad():
+        out = model(src, TRG)
+        fused_out = fused_model(src, TRG)
+        assert torch.allclose(out, fused_out, atol=1e-4)
+        assert torch.allclose(model.last_attention, fused_model.last_attention, atol=1e-5)
+        fused_out = fused_model(src, TRG, need_weights=False)
+        assert torch.allclose(out, fused_out, atol=1e-4)
+        assert fused_model.last_attention is None
+
+
+def test_decode_step(small_model):
+    model = small_model(Transformer).eval()
+    src = SRC[:2]
+    with torch.no_grad():
+        out = model(src, TRG)
+        cache = model.init_cache(src)
+        steps = [model.decode_step(TRG[:, :2], cache)]
+        steps += [model.decode_step(TRG[:, i:i + 1], cache) for i in range(2, TRG.shape[1])]
+        assert torch.allclose(out, torch.cat(steps, dim=1), atol=1e-5)
+
+
+def test_translate(small_model):
+    model = small_model(Transformer, seed=5, max_length=12).eval()
+    # make <EOS> likely, so that sentences finish at different steps
+    with torch.no_grad():
+        model.decoder.fc_out.bias[2] += 2.5
+    ids, lengths = model.translate(SRC, max_len=10)
+    with torch.no_grad():
+        for i in range(SRC.shape[0]):
+            # greedy decoding of one sentence with a full forward pass per token
+            trg = torch.tensor([[1]])
+            while trg.shape[1] <= 10 and trg[0, -1] != 2:
+                next_token = model(SRC[i:i + 1], trg)[0, -1].argmax()
+                trg = torch.cat([trg, next_token.view(1, 1)], dim=1)
+            assert lengths[i] == trg.shape[1] - 1
+            assert torch.equal(ids[i, :lengths[i]], trg[0, 1:])
+            assert (ids[i, lengths[i]:] == 0).all()
+    assert len(set(lengths.tolist())) > 1
+
+
+def test_beam_search(small_model):
+    model = small_model(Transformer, max_length=12).eval()
+    ids, lengths = model.translate(SRC, max_len=10)
+    beam_ids, beam_lengths = beam_search(model, SRC, 1, max_len=10)
+    assert torch.equal(ids, beam_ids) and torch.equal(lengths, beam_lengths)
+    # the beams of a batch are independent of the other sentences
+    ids, lengths = model.translate(SRC, max_len=10, beam_size=3)
+    for i in range(SRC.shape[0]):
+        sentence_ids, sentence_lengths = model.translate(SRC[i:i + 1], max_len=10, beam_size=3)
+        assert torch.equal(ids[i], sentence_ids[0]) and lengths[i] == sentence_lengths[0]
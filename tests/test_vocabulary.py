@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+import torch
+
+from vocabulary import EOS_IDX, PAD_IDX, SOS_IDX, SPECIALS, Vocabulary
+
+SENTENCES = ["the cat sleeps", "the dog", "a cat sees the dog"]
+
+
+@pytest.fixture
+def vocab():
+    return Vocabulary.build(SENTENCES)
+
+
+def test_build(vocab, tmp_path):
+    assert vocab.itos[:3] == SPECIALS
+    assert [vocab[token] for token in SPECIALS] == [PAD_IDX, SOS_IDX, EOS_IDX]
+    # from most to least frequent, ties in alphabetical order
+    assert vocab.itos[3:] == ["the", "cat", "dog", "a", "sees", "sleeps"]
+    vocab.save(str(tmp_path / "vocab.txt"))
+    assert Vocabulary.load(str(tmp_path / "vocab.txt")).itos == vocab.itos
+
+
+def test_encode_decode(vocab):
+    ids = vocab.encode(SENTENCES)
+    assert ids.shape == (3, 7)
+    assert ids[1].tolist() == [SOS_IDX, vocab["the"], vocab["dog"], EOS_IDX, 0, 0, 0]
+    assert [" ".join(tokens) for tokens in vocab.decode(ids)] == SENTENCES
+    assert vocab.decode(torch.from_numpy(ids)) == vocab.decode(ids)
+    assert vocab.decode(ids, strip_sos=False)[1] == ["<SOS>", "the", "dog"]
+    assert vocab.decode(ids, include_eos=True)[1] == ["the", "dog", "<EOS>"]
+    assert vocab.encode(["the dog"], add_sequence_tokens=False, length=4).tolist() == \
+        [[vocab["the"], vocab["dog"], 0, 0]]
+    with pytest.raises(ValueError):
+        vocab.encode(SENTENCES, length=6)
+
+    # predictions are cut at their first <EOS>, with or without <SOS>
+    predicted = np.array([[vocab["cat"], EOS_IDX, vocab["dog"]]])
+    assert vocab.decode(predicted) == [["cat"]]
+    assert vocab.decode(np.zeros((2, 0), dtype=np.int64)) == [[], []]
+    assert vocab.encode([]).shape == (0, 0)
+
+
+def test_unknown_tokens(vocab):
+    with pytest.raises(KeyError):
+        vocab["bird"]
+    with pytest.raises(KeyError):
+        vocab.encode(["the bird"])
+    with pytest.raises(ValueError):
+        vocab.set_default_index(len(vocab))
+    vocab.set_default_index(PAD_IDX)
+    assert vocab["bird"] == PAD_IDX
+    assert vocab.encode(["the bird"])[0].tolist() == [SOS_IDX, vocab["the"], PAD_IDX, EOS_IDX]
+    vocab.set_default_index(None)
+    with pytest.raises(KeyError):
+        vocab["bird"]
@@ -0,0 +1,69 @@
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from vocabulary import Vocabulary
+
+
+class TokenizedDataset(Dataset):
+    """
+    Dataset reading the token ids written by the generators with
+    write_tokens=True from the directory "<dataset>_tokens/".
+    The id arrays are memory mapped, so nothing is parsed at startup,
+    and DataLoader workers share the same pages of the files.
+    Every item is a pair of source and target ids, both starting
+    with <SOS> and ending with <EOS>, which batching.collate_batch
+    pads into batches.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path if path.endswith("/") else path + "/"
+        self.src_vocab = Vocabulary.load(self.path + "src_vocab.txt")
+        self.trg_vocab = Vocabulary.load(self.path + "trg_vocab.txt")
+        self.arrays = None
+        self.load_arrays()
+
+    def load_arrays(self) -> dict[str, np.ndarray]:
+        """
+        Memory maps the id and offset arrays, once per process.
+        """
+        if self.arrays is None:
+            self.arrays = {
+                side + suffix: np.load(self.path + side + suffix + ".npy", mmap_mode="r")
+                for side in ["src", "trg"] for suffix in ["_ids", "_offsets"]
+            }
+        return self.arrays
+
+    def __getstate__(self) -> dict:
+        # workers map the files themselves instead of receiving a copy
+        state = self.__dict__.copy()
+        state["arrays"] = None
+        return state
+
+    def __len__(self) -> int:
+        return len(self.load_arrays()["src_offsets"]) - 1
+
+    def sentence(self, side: str, index: int) -> torch.Tensor:
+        arrays = self.load_arrays()
+        offsets = arrays[side + "_offsets"]
+        ids = arrays[side + "_ids"][offsets[index]:offsets[index + 1]]
+        return torch.from_numpy(ids.astype(np.int64))
+
+    def __getitem__(self, index: int) -> tuple[torch.Tensor, torch.Tensor]:
+        return self.sentence("src", index), self.sentence("trg", index)
+
+    def lengths(self, side: str) -> np.ndarray:
+        """
+        Returns the length of every sentence, including <SOS> and <EOS>.
+        """
+        return np.diff(self.load_arrays()[side + "_offsets"])
+
+    def indices_within(self, max_length: int) -> list[int]:
+        """
+        Returns the indices of the pairs where both sentences have
+        less than max_length words, the same pairs the notebooks
+        keep with filter_pairs.
+        """
+        keep = (self.lengths("src") - 2 < max_length) & (self.lengths("trg") - 2 < max_length)
+        return np.flatnonzero(keep).tolist()
+
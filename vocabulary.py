@@ -0,0 +1,162 @@
+import csv
+from collections import Counter
+from itertools import chain
+from typing import TYPE_CHECKING, Iterable, Optional, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    # only imported where tensors are used, as the ONNX
+    # engine uses the vocabularies without PyTorch
+    import torch
+
+PAD_IDX = 0
+SOS_IDX = 1
+EOS_IDX = 2
+# special tokens first in every vocabulary, in the order of their ids,
+# also of the vocabularies written by FileHandler.write_dataset_to_tokens
+SPECIALS = ["<PAD>", "<SOS>", "<EOS>"]
+
+
+class Vocabulary:
+    """
+    Vocabulary backed by a NumPy array of its tokens, that encodes
+    and decodes whole batches of sentences in one call.
+    Supports the parts of torchtext's Vocab used by the notebooks.
+    Tokens not in the vocabulary raise a KeyError, unless a
+    default index is set for them.
+    """
+
+    def __init__(self, tokens: list[str], default_index: Optional[int] = None) -> None:
+        self.itos = list(tokens)
+        self.stoi = {token: i for i, token in enumerate(self.itos)}
+        self.itos_array = np.array(self.itos, dtype=object)
+        self.set_default_index(default_index)
+
+    @classmethod
+    def build(cls, sentences: Iterable[str], specials=SPECIALS) -> "Vocabulary":
+        """
+        Builds a vocabulary in one counting pass over the sentences,
+        the specials followed by the words from most to least frequent,
+        in the same order as torchtext's build_vocab_from_iterator.
+        """
+        counts = Counter(word for sentence in sentences for word in sentence.split())
+        for special in specials:
+            counts.pop(special, None)
+        return cls(list(specials) + sorted(counts, key=lambda word: (-counts[word], word)))
+
+    @classmethod
+    def from_dataset(cls, path: str, column: int) -> "Vocabulary":
+        """
+        Builds a vocabulary from a column of a dataset written by the
+        generators, 0 for the contexts and 1 for the formulas.
+        """
+        with open(path, newline='') as data_file:
+            reader = csv.reader(data_file, delimiter='\t')
+            return cls.build(row[column] for row in reader)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the tokens with one per line, in the order of their ids.
+        """
+        with open(path, "w", encoding="utf-8") as vocab_file:
+            vocab_file.write("\n".join(self.itos) + "\n")
+
+    @classmethod
+    def load(cls, path: str) -> "Vocabulary":
+        with open(path, encoding="utf-8") as vocab_file:
+            return cls(vocab_file.read().split("\n")[:-1])
+
+    def __len__(self) -> int:
+        return len(self.itos)
+
+    def __getitem__(self, token: str) -> int:
+        if self.default_index is None:
+            return self.stoi[token]
+        return self.stoi.get(token, self.default_index)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.stoi
+
+    def set_default_index(self, index: Optional[int]) -> None:
+        """
+        Sets the id of tokens not in the vocabulary, which must be
+        the id of a token, or None to raise a KeyError for them.
+        """
+        if index is not None and not 0 <= index < len(self.itos):
+            raise ValueError("Default index " + str(index) + " is not in a vocabulary of " +
+                             str(len(self.itos)) + " tokens")
+        self.default_index = index
+
+    def get_itos(self) -> list[str]:
+        return self.itos
+
+    def get_stoi(self) -> dict[str, int]:
+        return self.stoi
+
+    def encode(self, sentences: list[str], add_sequence_tokens=True,
+               length=None, pad_idx=PAD_IDX) -> np.ndarray:
+        """
+        Encodes a batch of sentences into one [N, T] array of ids,
+        padded to the longest sentence or to length if given.
+        Sentences are wrapped in <SOS> and <EOS> unless specified.
+        """
+        tokenized = [sentence.split() for sentence in sentences]
+        extra = 2 if add_sequence_tokens else 0
+        word_lengths = np.fromiter(map(len, tokenized), dtype=np.int64, count=len(tokenized))
+        lengths = word_lengths + extra
+        if length is None:
+            length = int(lengths.max()) if len(lengths) else 0
+        elif len(lengths) and lengths.max() > length:
+            raise ValueError("Sentence of length " + str(lengths.max()) +
+                             " does not fit in length " + str(length))
+
+        words = chain.from_iterable(tokenized)
+        if self.default_index is None:
+            stoi = self.stoi
+            flat = np.array([stoi[word] for word in words], dtype=np.int64)
+        else:
+            get = self.stoi.get
+            default = self.default_index
+            flat = np.array([get(word, default) for word in words], dtype=np.int64)
+
+        # scatter the flat ids into their rows in one assignment
+        ids = np.full((len(tokenized), length), pad_idx, dtype=np.int64)
+        rows = np.repeat(np.arange(len(tokenized)), word_lengths)
+        starts = np.repeat(np.cumsum(word_lengths) - word_lengths, word_lengths)
+        columns = np.arange(len(flat)) - starts
+        if add_sequence_tokens and len(tokenized):
+            ids[:, 0] = SOS_IDX
+            ids[np.arange(len(tokenized)), lengths - 1] = EOS_IDX
+            columns += 1
+        ids[rows, columns] = flat
+        return ids
+
+    def encode_tensor(self, sentences: list[str], add_sequence_tokens=True,
+                      length=None, pad_idx=PAD_IDX, device="cpu") -> "torch.Tensor":
+        import torch
+        return torch.from_numpy(self.encode(
+            sentences, add_sequence_tokens, length, pad_idx)).to(device)
+
+    def decode(self, ids: Union[np.ndarray, "torch.Tensor"], strip_sos=True,
+               include_eos=False) -> list[list[str]]:
+        """
+        Decodes an [N, T] array or tensor of ids into token lists
+        with one vectorized lookup, cutting every sentence at its
+        first <EOS> and leaving out padding.
+        """
+        if hasattr(ids, "detach"):
+            ids = ids.detach().cpu().numpy()
+        ids = np.asarray(ids)
+        if ids.shape[1] == 0:
+            return [[] for _ in range(ids.shape[0])]
+        tokens = self.itos_array[ids]
+
+        is_eos = ids == EOS_IDX
+        ends = np.where(is_eos.any(axis=1), is_eos.argmax(axis=1), ids.shape[1])
+        if include_eos:
+            ends = np.minimum(ends + 1, ids.shape[1])
+        keep = (ids != PAD_IDX) & (np.arange(ids.shape[1]) < ends[:, None])
+        if strip_sos:
+            keep[:, 0] &= ids[:, 0] != SOS_IDX
+        return [row[mask].tolist() for row, mask in zip(tokens, keep)]